@@ -0,0 +1,6 @@
+"""
+Document Templater
+
+Rendering support for doc_templater.py: font resolution and other caches shared
+by the batch generator.
+"""
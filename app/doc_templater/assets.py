@@ -0,0 +1,90 @@
+import os
+from collections import OrderedDict
+from PIL import Image
+
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024  # decoded RGBA tiles kept per process
+
+_image_tile_cache = OrderedDict()  # key -> (offset_x, offset_y, tile), least recently used first
+_image_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes': 0}
+
+def fit_image_in_box(img_w, img_h, box_w, box_h, padding):
+    """
+    Fits an image into the padded content area of an element box, keeping its aspect ratio.
+    padding is (left, top, right, bottom).
+    Returns (offset_x, offset_y, render_w, render_h) with the offset relative to the box.
+    """
+    pad_left, pad_top, pad_right, pad_bottom = padding
+    content_area_w = box_w - pad_left - pad_right
+    content_area_h = box_h - pad_top - pad_bottom
+
+    aspect_ratio = img_w / img_h
+    
+    render_w = content_area_w
+    render_h = render_w / aspect_ratio
+    
+    if render_h > content_area_h:
+        render_h = content_area_h
+        render_w = render_h * aspect_ratio
+    
+    render_w = int(render_w)
+    render_h = int(render_h)
+
+    # Position for pasting (top-left corner of the resized image within the content area)
+    # Centering the image within the padded content area
+    offset_x = pad_left + (content_area_w - render_w) // 2
+    offset_y = pad_top + (content_area_h - render_h) // 2
+    return offset_x, offset_y, render_w, render_h
+
+def _tile_bytes(tile):
+    return tile.width * tile.height * 4
+
+def get_image_tile(image_path, box_w, box_h, padding):
+    """
+    Returns (offset_x, offset_y, tile) for an image fitted into a box of box_w x box_h
+    with the given (left, top, right, bottom) padding, or None if nothing would be drawn.
+    tile is an RGBA image at its final render size, ready to paste with itself as mask;
+    it is shared between callers and must not be modified.
+
+    Tiles are cached by (path, file mtime, box size, padding), so a changed file is
+    decoded again, and the least recently used tiles are evicted beyond IMAGE_CACHE_MAX_BYTES.
+    Raises OSError if the file cannot be read.
+    """
+    full_path = os.path.abspath(image_path)
+    key = (full_path, os.stat(full_path).st_mtime_ns, box_w, box_h, tuple(padding))
+
+    entry = _image_tile_cache.get(key)
+    if entry is not None:
+        _image_tile_cache.move_to_end(key)
+        _image_cache_stats['hits'] += 1
+        return entry
+
+    _image_cache_stats['misses'] += 1
+    with Image.open(full_path) as img:
+        img_orig_w, img_orig_h = img.size
+        if img_orig_w == 0 or img_orig_h == 0:
+            return None
+        offset_x, offset_y, render_w, render_h = fit_image_in_box(img_orig_w, img_orig_h, box_w, box_h, padding)
+        if render_w <= 0 or render_h <= 0:
+            return None
+        tile = img.convert("RGBA").resize((render_w, render_h), Image.LANCZOS)  # High quality resize
+
+    entry = (offset_x, offset_y, tile)
+    _image_tile_cache[key] = entry
+    _image_cache_stats['bytes'] += _tile_bytes(tile)
+    # Always keep the newest tile, even if it alone exceeds the budget
+    while _image_cache_stats['bytes'] > IMAGE_CACHE_MAX_BYTES and len(_image_tile_cache) > 1:
+        _, (_, _, evicted_tile) = _image_tile_cache.popitem(last=False)
+        _image_cache_stats['bytes'] -= _tile_bytes(evicted_tile)
+        _image_cache_stats['evictions'] += 1
+    return entry
+
+def get_image_cache_stats():
+    """Returns a snapshot of the tile cache counters: hits, misses, evictions, bytes and entries."""
+    stats = dict(_image_cache_stats)
+    stats['entries'] = len(_image_tile_cache)
+    return stats
+
+def clear_image_cache():
+    """Drops all cached tiles. Counters other than bytes are kept."""
+    _image_tile_cache.clear()
+    _image_cache_stats['bytes'] = 0
@@ -0,0 +1,123 @@
+import os
+import csv
+import glob
+import json
+
+from app.template_editor.constants import CONFIG_DIR
+
+# Dataset sources yield (dataset_name, template_data) pairs one record at a time, so a
+# batch of any size is never held in memory. dataset_name takes the place of the
+# template_keys_*.json file name in output names and reports.
+
+def iter_json_files(directory, pattern='*.json'):
+    """Yields (filename, template_data) for each JSON file in a directory, sorted by filename."""
+    for template_file in sorted(glob.glob(os.path.join(directory, pattern))):
+        try:
+            with open(template_file, 'r', encoding='utf-8') as f:
+                template_data = json.load(f)
+        except Exception as e:
+            print(f"Error loading template file {template_file}: {e}")
+            continue
+        filename = os.path.basename(template_file)
+        print(f"Loaded template file: {filename}")
+        yield filename, template_data
+
+def iter_jsonl(path):
+    """Yields (name, template_data) for each non-empty line of a JSON Lines file."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                template_data = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Error decoding JSON on line {line_no} of {path}: {e}")
+                continue
+            yield f"{stem}_{line_no:06d}", template_data
+
+def csv_row_to_template_data(row):
+    """
+    Maps a CSV row with dotted column names to nested template data:
+    'employee.name' becomes {'employee': {'name': ...}}. Columns starting with
+    'images.' are image replacements, so 'images.logo.jpg' maps the file name
+    'logo.jpg' rather than splitting it further; empty cells there are ignored.
+    """
+    template_data = {}
+    for column, value in row.items():
+        if not column:
+            continue
+        if value is None:
+            value = ''
+        parts = column.split('.')
+        if parts[0] == 'images' and len(parts) > 1:
+            if not value:
+                continue  # an empty cell means no replacement for this row
+            parts = ['images', '.'.join(parts[1:])]
+        current = template_data
+        for part in parts[:-1]:
+            if not isinstance(current.get(part), dict):
+                current[part] = {}
+            current = current[part]
+        current[parts[-1]] = value
+    return template_data
+
+def iter_csv(path):
+    """Yields (name, template_data) for each row of a CSV file with a header row."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        for row_no, row in enumerate(csv.DictReader(f), start=1):
+            yield f"{stem}_{row_no:06d}", csv_row_to_template_data(row)
+
+def iter_json_file(path):
+    """Yields the dataset in a JSON file, or each record if the file holds a list."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        for record_no, template_data in enumerate(data, start=1):
+            yield f"{stem}_{record_no:06d}", template_data
+    else:
+        yield os.path.basename(path), data
+
+def iter_template_keys_files():
+    """
+    Yields the template_keys_*.json files from the configs directory, or the fallback
+    template_keys.json if there are none.
+    """
+    found = False
+    for template_file in iter_json_files(CONFIG_DIR, 'template_keys_*.json'):
+        found = True
+        yield template_file
+
+    if not found:
+        print("No template_keys_*.json files found. Looking for fallback template_keys.json...")
+        fallback_path = os.path.join(CONFIG_DIR, 'template_keys.json')
+        if os.path.exists(fallback_path):
+            try:
+                with open(fallback_path, 'r', encoding='utf-8') as f:
+                    template_data = json.load(f)
+            except Exception as e:
+                print(f"Error loading fallback template_keys.json: {e}")
+                return
+            print("Loaded fallback template_keys.json")
+            yield 'template_keys.json', template_data
+
+def iter_datasets(source=None):
+    """
+    Yields (dataset_name, template_data) pairs lazily from a dataset source:
+    a .jsonl file, a .csv file, a .json file, or a directory of .json files.
+    With no source, reads configs/template_keys_*.json as before.
+    """
+    if source is None:
+        return iter_template_keys_files()
+    if os.path.isdir(source):
+        return iter_json_files(source)
+    ext = os.path.splitext(source)[1].lower()
+    if ext in ('.jsonl', '.ndjson'):
+        return iter_jsonl(source)
+    if ext == '.csv':
+        return iter_csv(source)
+    if ext == '.json':
+        return iter_json_file(source)
+    raise ValueError(f"Unsupported dataset source {source}: expected a .jsonl, .csv or .json file or a directory")
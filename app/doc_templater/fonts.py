@@ -0,0 +1,215 @@
+import os
+import json
+import platform
+from collections import OrderedDict
+from PIL import ImageFont
+
+from app.template_editor.constants import CACHE_DIR
+
+# Project fonts directory (repository root /fonts), searched before the system directories
+PROJECT_FONTS_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'fonts'))
+FONT_INDEX_PATH = os.path.join(CACHE_DIR, 'font_index.json')
+FONT_INDEX_VERSION = 1
+FONT_EXTENSIONS = ('.ttf', '.otf', '.ttc')
+FONT_CACHE_SIZE = 64  # loaded FreeTypeFont objects kept per process
+
+# Common font name mappings
+FONT_MAPPINGS = {
+    'timesnewroman': ['times.ttf', 'Times New Roman.ttf', 'TimesNewRoman.ttf', 'Times-Roman.ttf'],
+    'arial': ['arial.ttf', 'Arial.ttf', 'LiberationSans-Regular.ttf'],
+    'helvetica': ['helvetica.ttf', 'Helvetica.ttf', 'Arial.ttf', 'LiberationSans-Regular.ttf'],
+    'calibri': ['calibri.ttf', 'Calibri.ttf'],
+    'verdana': ['verdana.ttf', 'Verdana.ttf'],
+    'georgia': ['georgia.ttf', 'Georgia.ttf'],
+    'courier': ['courier.ttf', 'Courier.ttf', 'cour.ttf'],
+    'comic sans': ['comic.ttf', 'ComicSansMS.ttf'],
+}
+
+_font_index = None
+_resolved_font_paths = {}  # font name -> font file path, or None when not installed
+_font_cache = OrderedDict()  # (font file path, size) -> FreeTypeFont, least recently used first
+
+def get_font_search_dirs():
+    """Returns the font directories to index: the project fonts/ folder first, then the platform font dirs."""
+    font_search_dirs = [PROJECT_FONTS_DIR]
+
+    if platform.system() == 'Windows':
+        font_search_dirs.extend([
+            'C:/Windows/Fonts/',
+            'C:/Windows/System32/Fonts/',
+            os.path.expanduser('~/AppData/Local/Microsoft/Windows/Fonts/')
+        ])
+    elif platform.system() == 'Darwin':  # macOS
+        font_search_dirs.extend([
+            '/System/Library/Fonts/',
+            '/Library/Fonts/',
+            os.path.expanduser('~/Library/Fonts/')
+        ])
+    else:  # Linux and others
+        font_search_dirs.extend([
+            '/usr/share/fonts/',
+            '/usr/local/share/fonts/',
+            os.path.expanduser('~/.fonts/'),
+            os.path.expanduser('~/.local/share/fonts/')
+        ])
+        # PIL also searches the XDG data dirs when given a bare font file name
+        for data_dir in os.environ.get('XDG_DATA_DIRS', '').split(os.pathsep):
+            if data_dir:
+                font_search_dirs.append(os.path.join(data_dir, 'fonts'))
+
+    unique_dirs = []
+    for font_dir in font_search_dirs:
+        font_dir = os.path.normpath(font_dir)
+        if font_dir not in unique_dirs:
+            unique_dirs.append(font_dir)
+    return unique_dirs
+
+def _get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def scan_font_dirs(search_dirs):
+    """
+    Walks the search directories once and builds the font index.
+    Files are keyed by lower-cased file name; the first directory in search order wins.
+    The mtime of every visited directory is recorded so the index can be validated cheaply.
+    """
+    fonts = {}
+    dir_mtimes = {}
+    for font_dir in search_dirs:
+        dir_mtimes[font_dir] = _get_mtime(font_dir)
+        if dir_mtimes[font_dir] is None:
+            continue
+        for root, dirs, files in os.walk(font_dir):
+            dirs.sort()
+            dir_mtimes[root] = _get_mtime(root)
+            for filename in sorted(files):
+                if filename.lower().endswith(FONT_EXTENSIONS):
+                    fonts.setdefault(filename.lower(), os.path.join(root, filename))
+    return {
+        'version': FONT_INDEX_VERSION,
+        'search_dirs': search_dirs,
+        'dir_mtimes': dir_mtimes,
+        'fonts': fonts,
+    }
+
+def _is_index_current(index, search_dirs):
+    if not isinstance(index, dict) or index.get('version') != FONT_INDEX_VERSION:
+        return False
+    if index.get('search_dirs') != search_dirs:
+        return False
+    return all(_get_mtime(path) == mtime for path, mtime in index.get('dir_mtimes', {}).items())
+
+def get_font_index():
+    """
+    Returns the font name -> file index, loading the persisted copy from CACHE_DIR when
+    none of the indexed directories changed since it was written, and rescanning otherwise.
+    """
+    global _font_index
+    if _font_index is not None:
+        return _font_index
+
+    search_dirs = get_font_search_dirs()
+    try:
+        with open(FONT_INDEX_PATH, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if _is_index_current(index, search_dirs):
+            _font_index = index
+            return _font_index
+    except (OSError, ValueError):
+        pass
+
+    index = scan_font_dirs(search_dirs)
+    print(f"Indexed {len(index['fonts'])} font file(s) in {len(search_dirs)} font directories.")
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write to a temp file first so concurrent workers never read a partial index
+        tmp_path = f"{FONT_INDEX_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, FONT_INDEX_PATH)
+    except OSError as e:
+        print(f"Warning: Could not save font index to {FONT_INDEX_PATH}: {e}")
+    _font_index = index
+    return _font_index
+
+def resolve_font_path(font_name):
+    """
+    Resolves a font name ('arial', 'Times New Roman', 'DejaVuSans' or a path to a font file)
+    to a font file path using the font index. Returns None if the font is not installed.
+    """
+    if font_name in _resolved_font_paths:
+        return _resolved_font_paths[font_name]
+
+    # Normalize font name (lowercase, remove spaces)
+    normalized_name = font_name.lower().replace(' ', '').replace('-', '')
+    possible_fonts = FONT_MAPPINGS.get(normalized_name, [font_name + '.ttf', font_name + '.TTF'])
+
+    index_fonts = get_font_index()['fonts']
+    font_path = None
+    for font_file in possible_fonts:
+        # The font name might be a direct path
+        if os.path.isfile(font_file):
+            font_path = font_file
+            break
+        font_path = index_fonts.get(os.path.basename(font_file).lower())
+        if font_path:
+            break
+
+    _resolved_font_paths[font_name] = font_path
+    return font_path
+
+def load_font(font_path, font_size):
+    """
+    Returns a FreeTypeFont for the font file at the given size from the LRU cache,
+    loading it on a miss. Raises OSError if the file cannot be loaded.
+    """
+    key = (font_path, font_size)
+    font = _font_cache.get(key)
+    if font is not None:
+        _font_cache.move_to_end(key)
+        return font
+
+    font = ImageFont.truetype(font_path, font_size)
+    _font_cache[key] = font
+    if len(_font_cache) > FONT_CACHE_SIZE:
+        _font_cache.popitem(last=False)
+    return font
+
+def get_font(font_name, font_size):
+    """
+    Returns a PIL font object for the given font name and size, or None if not found.
+    """
+    font_path = resolve_font_path(font_name)
+    if not font_path:
+        return None
+    try:
+        return load_font(font_path, font_size)
+    except (IOError, OSError):
+        print(f"Warning: Could not load font file {font_path}.")
+        _resolved_font_paths[font_name] = None
+        return None
+
+def get_fallback_font(font_size):
+    """
+    Returns a reliable fallback font that should work on most systems.
+    """
+    if platform.system() == 'Windows':
+        fallback_fonts = ['arial', 'calibri', 'tahoma']
+    elif platform.system() == 'Darwin':  # macOS
+        fallback_fonts = ['Helvetica', 'Arial', 'Times']
+    else:  # Linux
+        fallback_fonts = ['LiberationSans-Regular', 'DejaVuSans', 'Ubuntu-Regular']
+
+    for fallback in fallback_fonts:
+        font = get_font(fallback, font_size)
+        if font:
+            return font
+
+    # Ultimate fallback - PIL's default font
+    try:
+        return ImageFont.load_default()
+    except Exception:
+        return None
@@ -0,0 +1,82 @@
+import os
+import json
+import hashlib
+
+MANIFEST_FILENAME = '.build_manifest.json'
+MANIFEST_VERSION = 1
+
+_file_hashes = {}  # (path, size, mtime) -> sha256 hex digest
+
+def hash_file(path):
+    """
+    Returns the sha256 hex digest of a file's bytes, or 'missing' if it cannot be read.
+    Digests are memoized per (path, size, mtime) for the lifetime of the process.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return 'missing'
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_hashes:
+        digest = hashlib.sha256()
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+        except OSError:
+            return 'missing'
+        _file_hashes[key] = digest.hexdigest()
+    return _file_hashes[key]
+
+def hash_json(data):
+    """Returns the sha256 hex digest of JSON-serializable data, independent of key order."""
+    encoded = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+def hash_files(paths):
+    """Returns one digest covering the given files (names and contents), independent of order."""
+    return hash_json(sorted((path, hash_file(path)) for path in set(paths)))
+
+def get_manifest_path(output_dir):
+    return os.path.join(output_dir, MANIFEST_FILENAME)
+
+def load_manifest(output_dir):
+    """Loads the build manifest of an output directory. Returns {output filename: entry}."""
+    try:
+        with open(get_manifest_path(output_dir), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read build manifest in {output_dir}, rebuilding everything: {e}")
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('outputs', {})
+
+def save_manifest(output_dir, outputs):
+    """Writes the build manifest atomically."""
+    manifest_path = get_manifest_path(output_dir)
+    tmp_path = f"{manifest_path}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'outputs': outputs}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, manifest_path)
+    except OSError as e:
+        print(f"Warning: Could not write build manifest {manifest_path}: {e}")
+
+def get_rebuild_reason(entry, inputs, output_pdf_path):
+    """
+    Compares the recorded inputs of an output with the current ones.
+    Returns None if the output is up to date, otherwise a short reason such as
+    'new output', 'output missing' or 'dataset, assets changed'.
+    """
+    if entry is None:
+        return 'new output'
+    if not os.path.exists(output_pdf_path):
+        return 'output missing'
+    recorded = entry.get('inputs', {})
+    changed = [name for name in inputs if recorded.get(name) != inputs[name]]
+    if changed:
+        return ', '.join(changed) + ' changed'
+    return None
@@ -0,0 +1,96 @@
+import zlib
+import io
+from PIL import Image
+import pymupdf  # PyMuPDF
+
+# How rendered pages are stored in the output PDF. The defaults reproduce PIL's PDF
+# writer: RGB JPEG at quality 75 at the editor's render resolution.
+DEFAULT_PAGE_ENCODING = {
+    'compression': 'jpeg',  # 'jpeg' (lossy, DCTDecode) or 'flate' (lossless, FlateDecode)
+    'color': 'rgb',         # 'rgb', 'gray' (8-bit) or 'mono' (1-bit, always flate)
+    'jpeg_quality': 75,
+    'dpi': None,            # downsample pages to this resolution; None keeps the render resolution
+}
+
+def encode_page_image(img, page_size=None, page_encoding=None):
+    """
+    Encodes a rendered page image for the output PDF as a ready-to-embed image stream.
+    page_size is the (width, height) of the page in points, needed for a target dpi.
+    Returns a dict with the image width, height, colorspace, bpc, filter and data.
+    """
+    page_encoding = page_encoding or DEFAULT_PAGE_ENCODING
+    dpi = page_encoding.get('dpi')
+    if dpi and page_size:
+        target_height = max(1, round(page_size[1] / 72 * dpi))
+        if target_height < img.height:
+            target_width = max(1, round(img.width * target_height / img.height))
+            img = img.resize((target_width, target_height), Image.LANCZOS)
+
+    color = page_encoding.get('color', 'rgb')
+    if color == 'mono':
+        # Plain threshold rather than dithering keeps text edges crisp
+        img = img.convert('1', dither=Image.Dither.NONE)
+    elif color == 'gray':
+        img = img.convert('L')
+    elif img.mode != 'RGB':
+        # Pages are rendered in RGB; only convert if an element changed the mode
+        img = img.convert('RGB')
+
+    colorspace = 'DeviceRGB' if img.mode == 'RGB' else 'DeviceGray'
+    bpc = 1 if img.mode == '1' else 8
+    if page_encoding.get('compression', 'jpeg') == 'jpeg' and img.mode != '1':
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=page_encoding.get('jpeg_quality', 75))
+        image_filter, data = 'DCTDecode', buffer.getvalue()
+    else:
+        # Mode '1' packs rows MSB first with 1 = white, matching a 1-bit DeviceGray image
+        image_filter, data = 'FlateDecode', zlib.compress(img.tobytes(), 6)
+    return {
+        'width': img.width,
+        'height': img.height,
+        'colorspace': colorspace,
+        'bpc': bpc,
+        'filter': image_filter,
+        'data': data,
+    }
+
+def _add_image_xobject(doc, encoded):
+    """Adds an encoded page image to the document as an image XObject and returns its xref."""
+    xref = doc.get_new_xref()
+    doc.update_object(xref, f"<< /Type /XObject /Subtype /Image /Width {encoded['width']} "
+                            f"/Height {encoded['height']} /ColorSpace /{encoded['colorspace']} "
+                            f"/BitsPerComponent {encoded['bpc']} >>")
+    doc.update_stream(xref, encoded['data'], compress=False)
+    # update_stream does not know the data is already encoded
+    doc.xref_set_key(xref, "Filter", f"/{encoded['filter']}")
+    return xref
+
+def write_output_pdf(output_pdf_path, source_pdf_path, pages):
+    """
+    Writes an output PDF from a list of (page_index, encoded_image) entries.
+    An encoded image from encode_page_image becomes a page of the source page's size
+    showing that image, embedded as is; None copies the source page verbatim, keeping
+    its text and vector content.
+    """
+    src = pymupdf.open(source_pdf_path)
+    out = pymupdf.open()
+    try:
+        run_start = None  # first page of a run of consecutive verbatim pages
+        for i, (page_index, encoded) in enumerate(pages):
+            if encoded is None:
+                if run_start is None:
+                    run_start = page_index
+                next_entry = pages[i + 1] if i + 1 < len(pages) else None
+                # Copy consecutive verbatim pages in one call so they share resources
+                if next_entry is None or next_entry[1] is not None or next_entry[0] != page_index + 1:
+                    out.insert_pdf(src, from_page=run_start, to_page=page_index)
+                    run_start = None
+                continue
+
+            page_rect = src[page_index].rect
+            page = out.new_page(width=page_rect.width, height=page_rect.height)
+            page.insert_image(page.rect, xref=_add_image_xobject(out, encoded))
+        out.save(output_pdf_path, garbage=3, deflate=True)
+    finally:
+        out.close()
+        src.close()
@@ -0,0 +1,153 @@
+# A template plan is a page config compiled once per PDF: for each page, an ordered draw
+# list of ops with integer boxes, normalized colors and paddings and pre-parsed value
+# accessors, so rendering a dataset is a single loop over the ops.
+
+# Draw elements in the correct order: rectangle, obscure, image, text
+# This ensures proper layering just like in the template editor
+ELEMENT_DRAW_ORDER = ['rectangle', 'obscure', 'image', 'text']
+
+def order_elements(elements):
+    """
+    Returns [(original_idx, element), ...] in draw order: the standard types in
+    ELEMENT_DRAW_ORDER first, then any remaining element types, each in config order.
+    """
+    all_elements_with_indices = list(enumerate(elements))
+    ordered = []
+    for el_type_to_draw in ELEMENT_DRAW_ORDER:
+        ordered.extend((idx, el) for idx, el in all_elements_with_indices if el.get('type') == el_type_to_draw)
+    ordered.extend((idx, el) for idx, el in all_elements_with_indices if el.get('type') not in ELEMENT_DRAW_ORDER)
+    return ordered
+
+def compile_accessor(element_config):
+    """
+    Pre-parses how a text or image element gets its value from a dataset:
+    ('key', value_key) for the legacy value_key, ('literal', value) for empty or
+    non-string values, ('field', value) for a top-level key and
+    ('path', value, parts) for a dotted path like 'employee.address'.
+    """
+    value_key = element_config.get("value_key")
+    if value_key:
+        return ('key', value_key)
+    value = element_config.get("value", "")
+    if not value or not isinstance(value, str):
+        return ('literal', value)
+    if '.' not in value:
+        return ('field', value)
+    return ('path', value, tuple(value.split('.')))
+
+def resolve_accessor(accessor, template_data):
+    """
+    Returns an element's value for one dataset. A 'field' or 'path' that is not in the
+    dataset resolves to the value text itself, like resolve_template_value.
+    """
+    kind = accessor[0]
+    if kind == 'field':
+        return template_data.get(accessor[1], accessor[1])
+    if kind == 'path':
+        current = template_data
+        for part in accessor[2]:
+            if isinstance(current, dict) and part in current:
+                current = current[part]
+            else:
+                return accessor[1]
+        return str(current) if current is not None else accessor[1]
+    if kind == 'key':
+        return template_data.get(accessor[1], "")
+    return accessor[1]
+
+def compile_element(element_config, original_idx=0):
+    """
+    Compiles one element config into a draw op: a dict with the element type, integer
+    box, the bounds it may touch when drawn and the normalized type-specific settings.
+    The original config stays available as op['element'].
+    """
+    x = int(element_config.get("x", 0))
+    y = int(element_config.get("y", 0))
+    width = int(element_config.get("width", 100))
+    height = int(element_config.get("height", 30))
+    element_type = element_config.get("type")
+    op = {
+        'index': original_idx,
+        'type': element_type,
+        'name': element_config.get('name', 'Unnamed'),
+        'element': element_config,
+        'x': x,
+        'y': y,
+        'width': width,
+        'height': height,
+        # PIL rectangles include their end coordinate, so the area touched is one pixel larger
+        'bounds': (x - 1, y - 1, x + width + 1, y + height + 1),
+    }
+    if element_type == "text":
+        op['accessor'] = compile_accessor(element_config)
+        op['bg_color'] = tuple(element_config.get('background_color', (255, 255, 255)))
+        op['font_name'] = element_config.get("font", "arial")
+        op['font_size'] = element_config.get("font_size", 18)
+        op['font_color'] = tuple(element_config.get("font_color", [0, 0, 0]))
+    elif element_type == "rectangle":
+        op['bg_color'] = tuple(element_config.get('background_color', (255, 255, 255)))
+        op['border_color'] = None
+        if element_config.get('show_border', False):
+            op['border_color'] = tuple(element_config.get('border_color', (0, 0, 0)))
+    elif element_type == "image" or element_type == "signature":
+        op['accessor'] = compile_accessor(element_config)
+        padding = element_config.get('padding', {'left': 0, 'top': 0, 'right': 0, 'bottom': 0})
+        op['padding'] = (int(padding.get('left', 0)), int(padding.get('top', 0)),
+                         int(padding.get('right', 0)), int(padding.get('bottom', 0)))
+    return op
+
+def compile_page(page_config):
+    """Compiles a page config into {'zoom_factor': ..., 'ops': [op, ...]} in draw order."""
+    return {
+        'zoom_factor': page_config.get('zoom_factor'),
+        'ops': [compile_element(element, idx) for idx, element in order_elements(page_config.get("elements", []))],
+    }
+
+def compile_template(config_data):
+    """Compiles every page of a PDF's page configuration. Returns a list of compiled pages."""
+    return [compile_page(page_config) for page_config in config_data.get("pages", [])]
+
+def is_op_static(op, template_data):
+    """
+    Returns True if the op draws the same pixels for every template dataset:
+    it has no value_key, its value does not resolve through template_data and,
+    for images, the path has no 'images' replacement.
+    """
+    if op['type'] not in ('text', 'image', 'signature'):
+        return True
+    accessor = op['accessor']
+    if accessor[0] == 'key':
+        return False
+    value = resolve_accessor(accessor, template_data)
+    if value != accessor[1]:
+        return False
+    if op['type'] != 'text':
+        return not (isinstance(value, str) and value in template_data.get('images', {}))
+    return True
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+def split_static_layers(ops, is_static):
+    """
+    Splits the draw-ordered ops of a page into a static layer that can be baked into a
+    shared page base and the dynamic ops drawn per dataset.
+
+    An op is baked when is_static(op) is true and no earlier dynamic op overlaps it:
+    drawing it ahead of those ops then gives the same pixels, which also keeps an
+    obscure region over dynamic content dynamic.
+    Returns (static_indices, static_ops, dynamic_ops); static_indices is a tuple of
+    original element indices that identifies the baked base.
+    """
+    static_ops = []
+    dynamic_ops = []
+    dynamic_bounds = []
+    for op in ops:
+        bounds = op['bounds']
+        if is_static(op) and not any(_overlaps(bounds, other) for other in dynamic_bounds):
+            static_ops.append(op)
+        else:
+            dynamic_ops.append(op)
+            dynamic_bounds.append(bounds)
+    static_indices = tuple(op['index'] for op in static_ops)
+    return static_indices, static_ops, dynamic_ops
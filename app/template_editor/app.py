@@ -1,23 +1,26 @@
 import os
 import pygame
 import pygame_gui
-import copy
+from pygame_gui.elements import UITextEntryLine
 
 # Import modules from our refactored structure
 from app.template_editor.constants import (
     TARGET_HEIGHT, TEMP_IMG_DIR, BG_TEXTURE_PATH, CURSOR_TEXT_PATH,
     CURSOR_IMAGE_PATH, INPUT_DIR, CONFIG_DIR, DEFAULT_ZOOM_INDEX,
-    ZOOM_LEVELS, DOUBLE_CLICK_THRESHOLD, INPUT_IMG_DIR
+    ZOOM_LEVELS, DOUBLE_CLICK_THRESHOLD, INPUT_IMG_DIR, CURSOR_BLINK_MS, IDLE_WAIT_MS
 )
 from app.template_editor.pdf_utils import (
-    pdf_page_to_image, load_config, save_config, 
-    get_pdf_thumbnails
+    load_config, save_config, 
+    request_pdf_thumbnails
 )
+from app.template_editor.page_cache import get_page_surface, prefetch_pages
 from app.template_editor.elements import draw_element, get_element_bounds
+from app.template_editor.spatial_index import get_page_index
+from app.template_editor.history import reset_history
 from app.template_editor.canvas import (
-    clamp_pan, get_canvas_position,
+    clamp_pan, get_canvas_position, get_scaled_document_region,
     draw_coordinates, draw_help_text, draw_resize_handles,
-    draw_marquee_rectangle
+    draw_marquee_rectangle, mark_dirty, get_coordinates_rect, get_help_text_rect
 )
 from app.template_editor.ui_components import (
     ListFileSelectWindow, create_toolbar_buttons, update_toolbar_highlight,
@@ -28,7 +31,7 @@ from app.template_editor.ui_components import (
 from app.template_editor.event_handlers import (
     handle_keyboard_event, handle_mousewheel_event, handle_mousebuttondown,
     handle_mousebuttonup, handle_mousemotion, handle_ui_event,
-    reset_text_edit_mode, smart_generate_fields
+    reset_text_edit_mode, smart_generate_fields, poll_ocr_job
 )
 from app.template_editor.ui_text_properties import hide_font_menu
 import generate_config # Assuming it's at the root, sibling to template_editor.py
@@ -59,8 +62,8 @@ def select_pdf_file(window, manager, clock):
         print('No PDFs found in input_pdfs.')
         return None
     
-    # Generate thumbnails
-    thumb_paths = get_pdf_thumbnails(pdf_files)
+    # Thumbnails are made in the background; the dialog shows placeholders meanwhile
+    thumb_paths = request_pdf_thumbnails(pdf_files)
     
     # Show file selection dialog
     file_select_win = ListFileSelectWindow(pygame.Rect(200, 40, 650, 600), manager, pdf_files, thumb_paths)
@@ -84,6 +87,7 @@ def select_pdf_file(window, manager, clock):
                     show_editor = True
             file_select_win.process_event(event)
             manager.process_events(event)
+        file_select_win.poll_preview()
         manager.update(time_delta)
         window.fill((40, 40, 40))
         manager.draw_ui(window)
@@ -120,12 +124,13 @@ def load_document(pdf_filename):
     
     return pdf_path, config
 
-def render_document_page(pdf_path, page_num):
-    """Render a PDF page to an image"""
-    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
-    img_path = os.path.join(TEMP_IMG_DIR, f'{base_name}_page{page_num+1}_2x.png')
-    pdf_page_to_image(pdf_path, page_num, img_path)
-    doc_img_full = pygame.image.load(img_path)
+def render_document_page(pdf_path, page_num, page_count=None):
+    """
+    Returns a PDF page rendered to an image, from the in-memory page cache when possible,
+    and starts prefetching the pages before and after it.
+    """
+    doc_img_full = get_page_surface(pdf_path, page_num)
+    prefetch_pages(pdf_path, [page_num + 1, page_num - 1], page_count)
     return doc_img_full
 
 def initialize_editor_state(config, doc_img_full):
@@ -195,6 +200,15 @@ def initialize_editor_state(config, doc_img_full):
         # Runtime state
         'running': True,
         'file_dialog': None,
+        # Repaint state: the first frame draws everything
+        'scene_dirty': True,
+        'full_redraw': True,
+        'hud_dirty': False,
+        'dirty_rects': [],
+        'hud_rects': [],
+        'ui_hovered': False,
+        # Background OCR (Generate Fields / Smart Generate), see ocr_worker
+        'ocr_job': None,
         # Undo/redo state
         'history': [],
         'history_index': -1,
@@ -239,6 +253,8 @@ def update_editor_ui(state, window, manager):
         manager=manager,
         object_id='#generate_fields'
     )
+    if state.get('ocr_job'):
+        state['btn_generate_fields'].set_text('Cancel OCR')
     
     # Create 'Save' button at bottom right
     state['btn_save'] = pygame_gui.elements.UIButton(
@@ -271,6 +287,132 @@ def update_editor_ui(state, window, manager):
     
     return state
 
+def draw_document_scene(surface, state, bg_texture, bg_texture_rect):
+    """
+    Draws everything below the toolbars, HUD text and UI onto a window-sized surface:
+    the background, the visible part of the page, its elements, the marquee and the
+    resize handles.
+    """
+    window_width, window_height = surface.get_size()
+    canvas_w, canvas_h = state['canvas_size']
+    scaled_w, scaled_h = int(canvas_w * state['zoom']), int(canvas_h * state['zoom'])
+    canvas_x, canvas_y = get_canvas_position(window_width, window_height, scaled_w, scaled_h, state['pan_x'], state['pan_y'])
+
+    # Draw repeating background texture
+    for x_bg in range(0, window_width, bg_texture_rect.width):
+        for y_bg in range(0, window_height, bg_texture_rect.height):
+            surface.blit(bg_texture, (x_bg, y_bg))
+    
+    # The document is drawn straight onto the scene, clipped to its visible part,
+    # so the per-frame cost follows the window size rather than the zoom
+    doc_screen_rect = pygame.Rect(canvas_x, canvas_y, scaled_w, scaled_h)
+    visible_doc_rect = doc_screen_rect.clip(surface.get_rect())
+    surface.set_clip(visible_doc_rect)
+
+    # 1. Draw the scaled PDF image (only the region inside the window)
+    if state['doc_img_full']:
+        if visible_doc_rect.width > 0 and visible_doc_rect.height > 0:
+            try:
+                doc_region = visible_doc_rect.move(-canvas_x, -canvas_y)
+                scaled_doc_img, (region_x, region_y) = get_scaled_document_region(
+                    state['doc_img_full'], scaled_w, scaled_h, doc_region)
+                if scaled_doc_img:
+                    surface.blit(scaled_doc_img, (canvas_x + region_x, canvas_y + region_y))
+            except pygame.error as e:
+                print(f"Error scaling document image: {e}. Scaled_w={scaled_w}, Scaled_h={scaled_h}")
+    else:
+        pass
+
+    # 2. Draw rulers onto the document area
+
+    # 3. Draw elements (text boxes, images) at the canvas position
+    current_page_config = state['config']['pages'][state['page_num']]
+    if 'elements' in current_page_config:
+        element_types_draw_order = ['rectangle', 'obscure', 'image', 'text']
+        # Calculate visible area in canvas coordinates
+        win_w, win_h = window_width, window_height
+        viewport_rect = pygame.Rect(-canvas_x / state['zoom'], -canvas_y / state['zoom'], win_w / state['zoom'], win_h / state['zoom'])
+        # Only elements the page index finds near the viewport are considered
+        page_elements = current_page_config.get('elements', [])
+        all_elements_with_indices = [(idx, page_elements[idx]) for idx in get_page_index(state).query_rect(viewport_rect)]
+        for el_type_to_draw in element_types_draw_order:
+            for original_idx, el_config in all_elements_with_indices:
+                if el_config.get('type') == el_type_to_draw:
+                    # Get element bounds in canvas coordinates
+                    x, y = el_config.get('x', 0), el_config.get('y', 0)
+                    w, h = el_config.get('width', 0), el_config.get('height', 0)
+                    el_rect = pygame.Rect(x, y, w, h)
+                    if not viewport_rect.colliderect(el_rect):
+                        continue  # Skip drawing if not visible
+                    is_selected = (original_idx in state.get('selected_indices', []))
+                    is_editing_this_element = (state['editing_idx'] == original_idx and state['text_edit_mode'])
+                    current_text_for_draw = state['editing_text'] if is_editing_this_element else el_config.get('value', '')
+                    text_cursor_pos_for_draw = state['text_cursor_pos'] if is_editing_this_element else 0
+                    text_cursor_visible_for_draw = state['text_cursor_visible'] if is_editing_this_element else False
+                    draw_element(surface, el_config, selected=is_selected, editing=is_editing_this_element,
+                                 current_text=current_text_for_draw, show_cursor=text_cursor_visible_for_draw,
+                                 cursor_pos=text_cursor_pos_for_draw, scale=state['zoom'], offset=(canvas_x, canvas_y))
+        for original_idx, el_config in all_elements_with_indices:
+            if el_config.get('type') not in element_types_draw_order:
+                x, y = el_config.get('x', 0), el_config.get('y', 0)
+                w, h = el_config.get('width', 0), el_config.get('height', 0)
+                el_rect = pygame.Rect(x, y, w, h)
+                if not viewport_rect.colliderect(el_rect):
+                    continue
+                is_selected = (original_idx in state.get('selected_indices', []))
+                is_editing_this_element = (state['editing_idx'] == original_idx and state['text_edit_mode'])
+                current_text_for_draw = state['editing_text'] if is_editing_this_element else el_config.get('value', '')
+                text_cursor_pos_for_draw = state['text_cursor_pos'] if is_editing_this_element else 0
+                text_cursor_visible_for_draw = state['text_cursor_visible'] if is_editing_this_element else False
+                draw_element(surface, el_config, selected=is_selected, editing=is_editing_this_element,
+                             current_text=current_text_for_draw, show_cursor=text_cursor_visible_for_draw,
+                             cursor_pos=text_cursor_pos_for_draw, scale=state['zoom'], offset=(canvas_x, canvas_y))
+    
+    # 4. Stop clipping to the document for the marquee and handles
+    surface.set_clip(None)
+
+    # Draw marquee selection rectangle (if active)
+    draw_marquee_rectangle(surface, state, canvas_x, canvas_y, state['zoom'])
+
+    # 5. Draw resize handles (if an element is selected)
+    if state['tool_mode'] == 'select' and state.get('selected_indices'):
+        for idx in state['selected_indices']:
+            if idx < len(current_page_config.get('elements', [])):
+                selected_element_config = current_page_config['elements'][idx]
+                element_rect_unscaled = get_element_bounds(selected_element_config, state['zoom'])
+                draw_resize_handles(surface, element_rect_unscaled, idx, state['config'], state['page_num'],
+                                 canvas_x, canvas_y, state['zoom'])
+
+def get_coordinates_args(state):
+    """Returns the (mx, my, cx, cy) arguments for draw_coordinates at the mouse position."""
+    return (state['mouse_screen_pos'][0], state['mouse_screen_pos'][1],
+            int(state['mouse_canvas_pos'][0]), int(state['mouse_canvas_pos'][1]))
+
+def get_help_text_lines(state):
+    """Returns the help text lines shown at the bottom of the window."""
+    help_text_lines = [
+        f"Tool: {state['tool_mode']}" + (f" ({state['insert_mode']})" if state['insert_mode'] else ""),
+        f"Page: {state['page_num'] + 1}/{len(state['config']['pages'])} Zoom: {int(state['zoom']*100)}%",
+        f"Mouse (Canvas): {int(state['mouse_canvas_pos'][0])}, {int(state['mouse_canvas_pos'][1])}",
+        "Pan: Click-Drag (Select Tool) / Middle-Mouse Drag. Scroll: Zoom.",
+        "Ctrl+S: Save Config. Del: Delete Selected Element.",
+    ]
+    if state['tool_mode'] == 'text' and state['editing_idx'] is not None:
+        help_text_lines.append("Text Edit Mode: Esc to exit. Enter for new line (if supported).")
+    if state.get('ocr_job'):
+        help_text_lines.append(state['ocr_job'].status_text())
+    return help_text_lines
+
+def is_text_entry_focused(manager):
+    """Returns True if a pygame_gui text entry has focus, so its caret is blinking."""
+    return any(isinstance(element, UITextEntryLine) for element in manager.get_focus_set() or ())
+
+def is_editor_idle(state, manager):
+    """Returns True if nothing will change on screen until the next event arrives."""
+    return not (state.get('scene_dirty') or state.get('hud_dirty') or state.get('ui_needs_update')
+                or state.get('page_changed') or state.get('smart_generate_process') or state.get('reselect_file')
+                or is_text_entry_focused(manager))
+
 def main():
     """Main entry point for the template editor"""
     # Initialize the editor
@@ -292,7 +434,7 @@ def main():
     print(f"[app.py] Document rendering standardized to approx. {TARGET_HEIGHT} pixels height for better performance")
     
     # Render the first page
-    doc_img_full = render_document_page(pdf_path, 0)
+    doc_img_full = render_document_page(pdf_path, 0, len(config['pages']))
     print("[app.py] First page rendered.")
     
     # Initialize editor state
@@ -300,10 +442,9 @@ def main():
     state['pdf_filename'] = pdf_filename
     state['pdf_path'] = pdf_path
     print("[app.py] Editor state initialized.")
-    # Push initial config to history for undo (only if history is empty)
+    # Start the undo history with the loaded config (only if history is empty)
     if not state['history']:
-        state['history'].append(copy.deepcopy(state['config']))
-        state['history_index'] = 0
+        reset_history(state)
     # Set up UI elements
     state = update_editor_ui(state, window, manager)
     print("[app.py] Editor UI updated.")
@@ -320,14 +461,32 @@ def main():
         state['merge_toolbar_panel'].hide() # Initially hide it
     
     # Main event loop
+    scene_surface = None  # window-sized document layer, see draw_document_scene
     while state['running']:
+        # Sleep while nothing needs repainting instead of spinning at 60 fps
+        if is_editor_idle(state, manager):
+            timeout = CURSOR_BLINK_MS if state['text_edit_mode'] else IDLE_WAIT_MS
+            first_event = pygame.event.wait(timeout)
+            events = [first_event] + pygame.event.get() if first_event.type != pygame.NOEVENT else []
+        else:
+            events = pygame.event.get()
         time_delta = clock.tick(60)/1000.0
         
         # Handle events
-        for event in pygame.event.get():
+        for event in events:
             # It's crucial for pygame_gui to process events first.
             manager.process_events(event)
 
+            # Plain mouse movement only moves the coordinate HUD; anything else may change the view
+            if event.type == pygame.MOUSEMOTION:
+                state['hud_dirty'] = True
+            else:
+                mark_dirty(state)
+                if state['text_edit_mode'] and event.type in (pygame.KEYDOWN, pygame.TEXTINPUT):
+                    # Keep the cursor visible while typing
+                    state['text_cursor_visible'] = True
+                    state['text_cursor_blink_time'] = pygame.time.get_ticks()
+
             if event.type == pygame.QUIT:
                 state['running'] = False
                 break # Exit event loop immediately
@@ -344,6 +503,7 @@ def main():
             if handle_mousebuttonup(event, state):
                 continue
             if handle_mousemotion(event, state, window, manager):
+                mark_dirty(state) # dragging, resizing, panning or marquee selection
                 continue
             
             if event.type == pygame.VIDEORESIZE:
@@ -395,6 +555,9 @@ def main():
 
         # Handle state changes flagged by event handlers (outside the event iteration loop)
 
+        # Add the fields found by a running OCR job (its worker wakes the loop with OCR_EVENT)
+        poll_ocr_job(state)
+
         # --- Handle Smart Generate Process ---
         if state.get('smart_generate_process'):
             bounds = state.get('smart_generate_bounds')
@@ -433,7 +596,7 @@ def main():
                 print(f"Failed to load document: {pdf_filename_new}")
                 continue
             
-            doc_img_full_new = render_document_page(pdf_path_new, 0)
+            doc_img_full_new = render_document_page(pdf_path_new, 0, len(config_new['pages']))
             
             # Update state with new document info
             state.update(initialize_editor_state(config_new, doc_img_full_new))
@@ -484,7 +647,7 @@ def main():
                          del state['element_idx_for_image_update']
 
         if state.get('page_changed'):
-            state['doc_img_full'] = render_document_page(state['pdf_path'], state['page_num'])
+            state['doc_img_full'] = render_document_page(state['pdf_path'], state['page_num'], len(state['config']['pages']))
             state['doc_rect_full'] = state['doc_img_full'].get_rect()
             state['canvas_size'] = (state['doc_img_full'].get_width(), state['doc_img_full'].get_height())
             state['page_changed'] = False
@@ -492,7 +655,7 @@ def main():
         # --- Force redraw if requested (e.g., obscure mode changed) ---
         if state.get('redraw'):
             state['redraw'] = False
-            # No-op: the next drawing section will use the updated config
+            mark_dirty(state)
 
         # --- UI Updates based on state (call these every frame after events) --- 
         update_toolbar_highlight(
@@ -529,123 +692,6 @@ def main():
 
         # Update UI manager after all event processing and state changes for this frame
         manager.update(time_delta)
-        
-        # Get window and canvas dimensions for drawing
-        window_width, window_height = window.get_size()
-        canvas_w, canvas_h = state['canvas_size']
-        scaled_w, scaled_h = int(canvas_w * state['zoom']), int(canvas_h * state['zoom'])
-        state['pan_x'], state['pan_y'] = clamp_pan(state['pan_x'], state['pan_y'], window_width, window_height, scaled_w, scaled_h)
-        canvas_x, canvas_y = get_canvas_position(window_width, window_height, scaled_w, scaled_h, state['pan_x'], state['pan_y'])
-
-        # --- Drawing Start ---
-
-        # Draw repeating background texture
-        for x_bg in range(0, window_width, bg_texture_rect.width):
-            for y_bg in range(0, window_height, bg_texture_rect.height):
-                window.blit(bg_texture, (x_bg, y_bg))
-        
-        # Create the scaled_canvas surface: this is where the document (PDF, elements, rulers) will be drawn
-        scaled_canvas = pygame.Surface((scaled_w, scaled_h), pygame.SRCALPHA)
-        scaled_canvas.fill((0, 0, 0, 0)) 
-
-        # 1. Draw the scaled PDF image onto scaled_canvas
-        if state['doc_img_full']:
-            if scaled_w > 0 and scaled_h > 0: 
-                try:
-                    scaled_doc_img = pygame.transform.scale(state['doc_img_full'], (scaled_w, scaled_h))
-                    scaled_canvas.blit(scaled_doc_img, (0, 0)) 
-                except pygame.error as e:
-                    print(f"Error scaling document image: {e}. Scaled_w={scaled_w}, Scaled_h={scaled_h}")
-        else:
-            pass
-
-        # 2. Draw rulers onto scaled_canvas
-
-        # 3. Draw elements (text boxes, images) onto scaled_canvas
-        current_page_config = state['config']['pages'][state['page_num']]
-        if 'elements' in current_page_config:
-            all_elements_with_indices = list(enumerate(current_page_config.get('elements', [])))
-            element_types_draw_order = ['rectangle', 'obscure', 'image', 'text']
-            # Calculate visible area in canvas coordinates
-            win_w, win_h = window.get_width(), window.get_height()
-            canvas_x, canvas_y = get_canvas_position(win_w, win_h, scaled_w, scaled_h, state['pan_x'], state['pan_y'])
-            viewport_rect = pygame.Rect(-canvas_x / state['zoom'], -canvas_y / state['zoom'], win_w / state['zoom'], win_h / state['zoom'])
-            for el_type_to_draw in element_types_draw_order:
-                for original_idx, el_config in all_elements_with_indices:
-                    if el_config.get('type') == el_type_to_draw:
-                        # Get element bounds in canvas coordinates
-                        x, y = el_config.get('x', 0), el_config.get('y', 0)
-                        w, h = el_config.get('width', 0), el_config.get('height', 0)
-                        el_rect = pygame.Rect(x, y, w, h)
-                        if not viewport_rect.colliderect(el_rect):
-                            continue  # Skip drawing if not visible
-                        is_selected = (original_idx in state.get('selected_indices', []))
-                        is_editing_this_element = (state['editing_idx'] == original_idx and state['text_edit_mode'])
-                        current_text_for_draw = state['editing_text'] if is_editing_this_element else el_config.get('value', '')
-                        text_cursor_pos_for_draw = state['text_cursor_pos'] if is_editing_this_element else 0
-                        text_cursor_visible_for_draw = state['text_cursor_visible'] if is_editing_this_element else False
-                        draw_element(scaled_canvas, el_config, selected=is_selected, editing=is_editing_this_element,
-                                     current_text=current_text_for_draw, show_cursor=text_cursor_visible_for_draw,
-                                     cursor_pos=text_cursor_pos_for_draw, scale=state['zoom'])
-            for original_idx, el_config in all_elements_with_indices:
-                if el_config.get('type') not in element_types_draw_order:
-                    x, y = el_config.get('x', 0), el_config.get('y', 0)
-                    w, h = el_config.get('width', 0), el_config.get('height', 0)
-                    el_rect = pygame.Rect(x, y, w, h)
-                    if not viewport_rect.colliderect(el_rect):
-                        continue
-                    is_selected = (original_idx in state.get('selected_indices', []))
-                    is_editing_this_element = (state['editing_idx'] == original_idx and state['text_edit_mode'])
-                    current_text_for_draw = state['editing_text'] if is_editing_this_element else el_config.get('value', '')
-                    text_cursor_pos_for_draw = state['text_cursor_pos'] if is_editing_this_element else 0
-                    text_cursor_visible_for_draw = state['text_cursor_visible'] if is_editing_this_element else False
-                    draw_element(scaled_canvas, el_config, selected=is_selected, editing=is_editing_this_element,
-                                 current_text=current_text_for_draw, show_cursor=text_cursor_visible_for_draw,
-                                 cursor_pos=text_cursor_pos_for_draw, scale=state['zoom'])
-        
-        # 4. Blit the fully drawn scaled_canvas (with PDF, rulers, elements) onto the main window
-        window.blit(scaled_canvas, (canvas_x, canvas_y))
-
-        # Draw marquee selection rectangle (if active)
-        draw_marquee_rectangle(window, state, canvas_x, canvas_y, state['zoom'])
-
-        # 5. Draw resize handles directly on the main window (if an element is selected)
-        if state['tool_mode'] == 'select' and state.get('selected_indices'):
-            for idx in state['selected_indices']:
-                if idx < len(current_page_config.get('elements', [])):
-                    selected_element_config = current_page_config['elements'][idx]
-                    element_rect_unscaled = get_element_bounds(selected_element_config, state['zoom'])
-                    draw_resize_handles(window, element_rect_unscaled, idx, state['config'], state['page_num'],
-                                     canvas_x, canvas_y, state['zoom'])
-
-        # 6. Draw toolbar backgrounds (should be on top of canvas content, but below UI manager elements)
-        draw_toolbar_backgrounds(window, window_width, window_height)
-        
-        # 7. Draw coordinates and help text (on top of everything except UI Manager elements)
-        draw_coordinates(window, state['mouse_screen_pos'][0], state['mouse_screen_pos'][1],
-                         int(state['mouse_canvas_pos'][0]), int(state['mouse_canvas_pos'][1]))
-        help_text_lines = [
-            f"Tool: {state['tool_mode']}" + (f" ({state['insert_mode']})" if state['insert_mode'] else ""),
-            f"Page: {state['page_num'] + 1}/{len(state['config']['pages'])} Zoom: {int(state['zoom']*100)}%",
-            f"Mouse (Canvas): {int(state['mouse_canvas_pos'][0])}, {int(state['mouse_canvas_pos'][1])}",
-            "Pan: Click-Drag (Select Tool) / Middle-Mouse Drag. Scroll: Zoom.",
-            "Ctrl+S: Save Config. Del: Delete Selected Element.",
-        ]
-        if state['tool_mode'] == 'text' and state['editing_idx'] is not None:
-            help_text_lines.append("Text Edit Mode: Esc to exit. Enter for new line (if supported).")
-        draw_help_text(window, help_text_lines)
-
-        # 8. Pygame GUI Manager draws its UI elements (buttons, dialogs etc.) last, so they are on top
-        
-        manager.draw_ui(window)
-        
-        # 9. Update the full display Surface to the screen
-        pygame.display.update()
-
-        # Handle state changes flagged by event handlers (outside the event iteration loop)
-        if state.get('ui_needs_update'):
-            update_editor_ui(state, window, manager)
-            state['ui_needs_update'] = False
 
         # --- Sync node list selection with canvas selection ---
         # If the selected_idx changed (e.g., by canvas click), update the node list selection
@@ -669,3 +715,93 @@ def main():
                     item['selected'] = False
                     if item['button_element'] is not None:
                         item['button_element'].unselect()
+
+        # Get window and canvas dimensions for drawing
+        window_width, window_height = window.get_size()
+        canvas_w, canvas_h = state['canvas_size']
+        scaled_w, scaled_h = int(canvas_w * state['zoom']), int(canvas_h * state['zoom'])
+        state['pan_x'], state['pan_y'] = clamp_pan(state['pan_x'], state['pan_y'], window_width, window_height, scaled_w, scaled_h)
+        canvas_x, canvas_y = get_canvas_position(window_width, window_height, scaled_w, scaled_h, state['pan_x'], state['pan_y'])
+
+        # --- Work out what needs repainting ---
+        # Blink the text cursor; only the edited element changes
+        if state['text_edit_mode'] and state['editing_idx'] is not None:
+            now = pygame.time.get_ticks()
+            if now - state['text_cursor_blink_time'] >= CURSOR_BLINK_MS:
+                state['text_cursor_visible'] = not state['text_cursor_visible']
+                state['text_cursor_blink_time'] = now
+                page_elements = state['config']['pages'][state['page_num']].get('elements', [])
+                if state['editing_idx'] < len(page_elements):
+                    el = page_elements[state['editing_idx']]
+                    mark_dirty(state, pygame.Rect(canvas_x + int(el.get('x', 0) * state['zoom']) - 2,
+                                                  canvas_y + int(el.get('y', 0) * state['zoom']) - 2,
+                                                  int(el.get('width', 100) * state['zoom']) + 4,
+                                                  int(el.get('height', 30) * state['zoom']) + 4))
+        # Hovering the UI changes button highlights, which only pygame_gui knows about
+        hovering_ui = manager.get_hovering_any_element()
+        if state.get('hud_dirty') and (hovering_ui or state.get('ui_hovered')):
+            mark_dirty(state)
+        state['ui_hovered'] = hovering_ui
+        # A focused text entry blinks its caret: show the UI without redrawing the document
+        ui_animating = is_text_entry_focused(manager)
+
+        if not (state.get('scene_dirty') or state.get('hud_dirty') or ui_animating):
+            continue  # Nothing changed; the next iteration sleeps until an event arrives
+
+        # --- Drawing Start ---
+
+        # The document layer is kept in a window-sized surface and redrawn only when it changed
+        if scene_surface is None or scene_surface.get_size() != (window_width, window_height):
+            scene_surface = pygame.Surface((window_width, window_height)).convert()
+            mark_dirty(state)
+        full_redraw = state.get('full_redraw') or ui_animating
+        if state.get('scene_dirty'):
+            # Always redrawn whole: obscure elements read back the pixels underneath them
+            draw_document_scene(scene_surface, state, bg_texture, bg_texture_rect)
+
+        # Areas to send to the display: the whole window, or the changed rects and the HUD
+        help_text_lines = get_help_text_lines(state)
+        if full_redraw:
+            update_rects = [window.get_rect()]
+        else:
+            update_rects = list(state.get('dirty_rects', []))
+            if state.get('hud_dirty'):
+                # The HUD's old and new places
+                update_rects.extend(state.get('hud_rects', []))
+                update_rects.append(get_coordinates_rect(*get_coordinates_args(state)))
+                update_rects.append(get_help_text_rect(window, help_text_lines))
+            update_rects = [r.clip(window.get_rect()) for r in update_rects]
+            update_rects = [r for r in update_rects if r.width > 0 and r.height > 0]
+
+        for update_rect in update_rects:
+            window.set_clip(update_rect)
+            window.blit(scene_surface, update_rect.topleft, update_rect)
+
+            # 6. Draw toolbar backgrounds (should be on top of canvas content, but below UI manager elements)
+            draw_toolbar_backgrounds(window, window_width, window_height)
+
+            # 7. Draw coordinates and help text (on top of everything except UI Manager elements)
+            coords_rect = draw_coordinates(window, *get_coordinates_args(state))
+            help_rect = draw_help_text(window, help_text_lines)
+
+            # 8. Pygame GUI Manager draws its UI elements (buttons, dialogs etc.) last, so they are on top
+            manager.draw_ui(window)
+        window.set_clip(None)
+
+        # 9. Send only the repainted areas to the screen
+        if full_redraw:
+            pygame.display.update()
+        elif update_rects:
+            pygame.display.update(update_rects)
+        if update_rects:
+            state['hud_rects'] = [coords_rect, help_rect]
+        state['scene_dirty'] = False
+        state['full_redraw'] = False
+        state['hud_dirty'] = False
+        state['dirty_rects'] = []
+
+        # Handle state changes flagged by event handlers (outside the event iteration loop)
+        if state.get('ui_needs_update'):
+            update_editor_ui(state, window, manager)
+            state['ui_needs_update'] = False
+            mark_dirty(state)
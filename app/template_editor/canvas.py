@@ -1,7 +1,9 @@
 import pygame
+from collections import OrderedDict
 from app.template_editor.constants import SCALE, HANDLE_SIZE, RULER_COLOR, RULER_TEXT_COLOR
 from app.template_editor.elements import get_resize_handles
 from .constants import RULER_THICKNESS, RULER_TEXT_COLOR, HELP_TEXT, ICON_RESIZE_PATH
+from app.template_editor.text_cache import render_text
 
 # Global variable for the resize icon, loaded on demand
 _resize_icon_img_surface = None
@@ -75,6 +77,103 @@ def get_canvas_position(window_width, window_height, scaled_w, scaled_h, pan_x,
     canvas_y = (window_height - scaled_h) // 2 + pan_y
     return canvas_x, canvas_y
 
+# Scaled copies of the current page, so panning and idle frames cost only a blit.
+# The pyramid holds the page at 1/1, 1/2, 1/4, ... of its size and is rebuilt only
+# when the page surface changes; a zoomed copy is scaled from the nearest level.
+SCALED_DOC_CACHE_MAX_BYTES = 256 * 1024 * 1024
+_doc_pyramid_source = None  # the page surface the pyramid and cache belong to
+_doc_pyramid = []
+_scaled_doc_cache = OrderedDict()  # (width, height) -> surface, least recently used first
+_scaled_doc_cache_bytes = 0
+
+def _build_doc_pyramid(doc_img, min_height=256):
+    """Returns [doc_img, doc_img at 1/2, 1/4, ...] down to about min_height pixels high."""
+    levels = [doc_img]
+    while levels[-1].get_height() // 2 >= min_height:
+        prev = levels[-1]
+        size = (max(1, prev.get_width() // 2), prev.get_height() // 2)
+        try:
+            levels.append(pygame.transform.smoothscale(prev, size))
+        except (pygame.error, ValueError):
+            levels.append(pygame.transform.scale(prev, size))  # smoothscale needs 24/32 bit
+    return levels
+
+def get_scaled_document(doc_img, scaled_w, scaled_h):
+    """
+    Returns doc_img scaled to scaled_w x scaled_h, reusing earlier results.
+    Zoomed copies are cached per size (least recently used evicted beyond
+    SCALED_DOC_CACHE_MAX_BYTES) and made from the smallest pyramid level that is at
+    least as large, so a zoom change never rescales the full page when zooming out.
+    The cache is dropped when a different page surface is passed in.
+    """
+    global _doc_pyramid_source, _doc_pyramid, _scaled_doc_cache_bytes
+    if doc_img is not _doc_pyramid_source:
+        _doc_pyramid_source = doc_img
+        _doc_pyramid = _build_doc_pyramid(doc_img)
+        _scaled_doc_cache.clear()
+        _scaled_doc_cache_bytes = 0
+
+    key = (scaled_w, scaled_h)
+    scaled = _scaled_doc_cache.get(key)
+    if scaled is not None:
+        _scaled_doc_cache.move_to_end(key)
+        return scaled
+
+    source = _doc_pyramid[0]
+    for level in _doc_pyramid:
+        if level.get_width() >= scaled_w and level.get_height() >= scaled_h:
+            source = level
+    if source.get_size() == key:
+        scaled = source
+    else:
+        scaled = pygame.transform.scale(source, key)
+    if pygame.display.get_surface() is not None:
+        scaled = scaled.convert()  # display format blits much faster
+
+    _scaled_doc_cache[key] = scaled
+    _scaled_doc_cache_bytes += scaled_w * scaled_h * scaled.get_bytesize()
+    # Always keep the newest copy, even if it alone exceeds the budget
+    while _scaled_doc_cache_bytes > SCALED_DOC_CACHE_MAX_BYTES and len(_scaled_doc_cache) > 1:
+        (old_w, old_h), old = _scaled_doc_cache.popitem(last=False)
+        _scaled_doc_cache_bytes -= old_w * old_h * old.get_bytesize()
+    return scaled
+
+# Above this size a zoomed page is not kept whole; only the visible part is scaled
+SCALED_DOC_FULL_MAX_BYTES = 64 * 1024 * 1024
+_doc_region_cache = (None, None, None)  # (page surface, key, (surface, position)) of the last region
+
+def get_scaled_document_region(doc_img, scaled_w, scaled_h, region):
+    """
+    Returns (surface, (x, y)) covering region, a pygame.Rect in the coordinates of the
+    page scaled to scaled_w x scaled_h; (x, y) is where surface goes relative to the
+    page's top-left corner. Small zooms use the cached whole page from
+    get_scaled_document; large ones scale only the source pixels under region, so
+    memory stays proportional to the window rather than the zoom.
+    """
+    global _doc_region_cache
+    if scaled_w * scaled_h * 4 <= SCALED_DOC_FULL_MAX_BYTES:
+        return get_scaled_document(doc_img, scaled_w, scaled_h), (0, 0)
+
+    src_w, src_h = doc_img.get_size()
+    # Source pixels under the region, and the exact scaled span they map to
+    sx0 = max(0, region.left * src_w // scaled_w)
+    sy0 = max(0, region.top * src_h // scaled_h)
+    sx1 = min(src_w, -(-region.right * src_w // scaled_w))
+    sy1 = min(src_h, -(-region.bottom * src_h // scaled_h))
+    dx0, dy0 = sx0 * scaled_w // src_w, sy0 * scaled_h // src_h
+    dx1, dy1 = sx1 * scaled_w // src_w, sy1 * scaled_h // src_h
+    if sx1 <= sx0 or sy1 <= sy0 or dx1 <= dx0 or dy1 <= dy0:
+        return None, (0, 0)
+
+    key = (scaled_w, scaled_h, sx0, sy0, sx1, sy1)
+    cached_doc, cached_key, cached_result = _doc_region_cache
+    if cached_doc is doc_img and cached_key == key:
+        return cached_result
+    crop = doc_img.subsurface((sx0, sy0, sx1 - sx0, sy1 - sy0))
+    result = (pygame.transform.scale(crop, (dx1 - dx0, dy1 - dy0)), (dx0, dy0))
+    _doc_region_cache = (doc_img, key, result)
+    return result
+
 def draw_document_rulers(surface, zoom, width, height, color, text_color):
     """
     Draws horizontal and vertical rulers with tick marks onto the given surface.
@@ -86,10 +185,6 @@ def draw_document_rulers(surface, zoom, width, height, color, text_color):
         return
 
     font_size = max(8, int(10 / zoom)) # Adjust font size based on zoom, with a minimum
-    try:
-        font = pygame.font.SysFont('arial', font_size)
-    except Exception:
-        font = pygame.font.Font(None, font_size) # Fallback font
 
     # Define ruler properties - these are in "original document pixels" before scaling by zoom
     # For example, major tick every 100 document pixels, minor every 10.
@@ -118,7 +213,7 @@ def draw_document_rulers(surface, zoom, width, height, color, text_color):
         if pos_x_unscaled % major_tick_interval_unscaled == 0:
             pygame.draw.line(surface, color, (x, 0), (x, major_tick_len), ruler_thickness)
             if zoom > 0.2: # Only draw text if not too zoomed out
-                label = font.render(str(pos_x_unscaled), True, text_color)
+                label = render_text('arial', font_size, str(pos_x_unscaled), text_color)
                 surface.blit(label, (x + 2, 2))
         elif pos_x_unscaled % minor_tick_interval_unscaled == 0:
             pygame.draw.line(surface, color, (x, 0), (x, minor_tick_len), ruler_thickness)
@@ -137,7 +232,7 @@ def draw_document_rulers(surface, zoom, width, height, color, text_color):
         if pos_y_unscaled % major_tick_interval_unscaled == 0:
             pygame.draw.line(surface, color, (0, y), (major_tick_len, y), ruler_thickness)
             if zoom > 0.2:
-                label = font.render(str(pos_y_unscaled), True, text_color)
+                label = render_text('arial', font_size, str(pos_y_unscaled), text_color)
                 surface.blit(label, (2, y + 2))
         elif pos_y_unscaled % minor_tick_interval_unscaled == 0:
             pygame.draw.line(surface, color, (0, y), (minor_tick_len, y), ruler_thickness)
@@ -153,24 +248,56 @@ def draw_rulers(window, mx, my, window_width, window_height):
         pygame.draw.line(window, RULER_COLOR, (mx, 0), (mx, window_height), 1)
         pygame.draw.line(window, RULER_COLOR, (0, my), (window_width, my), 1)
 
-def draw_coordinates(window, mx, my, cx, cy):
-    """Draw coordinate display at mouse position"""
-    font = pygame.font.SysFont('arial', 16)
+def _layout_coordinates(mx, my, cx, cy):
     coord_text = f"x: {cx}, y: {cy}"
-    text_surf = font.render(coord_text, True, RULER_TEXT_COLOR)
+    text_surf = render_text('arial', 16, coord_text, RULER_TEXT_COLOR)
     text_rect = text_surf.get_rect()
     text_rect.topleft = (mx + 10, my + 10)
+    return text_surf, text_rect, text_rect.inflate(8, 4)
+
+def get_coordinates_rect(mx, my, cx, cy):
+    """Returns the screen rect draw_coordinates covers for these arguments."""
+    return _layout_coordinates(mx, my, cx, cy)[2]
+
+def draw_coordinates(window, mx, my, cx, cy):
+    """Draw coordinate display at mouse position. Returns the screen rect it covers."""
+    text_surf, text_rect, bg_rect = _layout_coordinates(mx, my, cx, cy)
     # Draw white background behind label
-    bg_rect = text_rect.inflate(8, 4)
     pygame.draw.rect(window, (255, 255, 255), bg_rect)
     window.blit(text_surf, text_rect)
+    return bg_rect
 
-def draw_help_text(window, help_text):
-    """Draw help text at the bottom of the window"""
-    font = pygame.font.SysFont('arial', 16)
+def _layout_help_text(window_height, help_text):
+    lines = []
     for i, line in enumerate(help_text):
-        text_surf = font.render(line, True, (180, 180, 180))
-        window.blit(text_surf, (10, window.get_height() - 20 * (len(help_text) - i)))
+        text_surf = render_text('arial', 16, line, (180, 180, 180))
+        lines.append((text_surf, (10, window_height - 20 * (len(help_text) - i))))
+    return lines
+
+def get_help_text_rect(window, help_text):
+    """Returns the screen rect draw_help_text covers for these lines."""
+    covered = pygame.Rect(10, window.get_height() - 20 * len(help_text), 0, 0)
+    for text_surf, line_pos in _layout_help_text(window.get_height(), help_text):
+        covered.union_ip(pygame.Rect(line_pos, text_surf.get_size()))
+    return covered
+
+def draw_help_text(window, help_text):
+    """Draw help text at the bottom of the window. Returns the screen rect it covers."""
+    for text_surf, line_pos in _layout_help_text(window.get_height(), help_text):
+        window.blit(text_surf, line_pos)
+    return get_help_text_rect(window, help_text)
+
+def mark_dirty(state, rect=None):
+    """
+    Flags the document view for repainting on the next frame. With a rect in screen
+    coordinates only that area is repainted and sent to the display, otherwise the
+    whole window is.
+    """
+    state['scene_dirty'] = True
+    if rect is None:
+        state['full_redraw'] = True
+    else:
+        state.setdefault('dirty_rects', []).append(pygame.Rect(rect))
 
 def draw_resize_handles(window, _element_rect_scaled_is_unused, selected_idx, config, page_num, canvas_x, canvas_y, zoom):
     if selected_idx is None or selected_idx >= len(config['pages'][page_num]['elements']):
@@ -12,6 +12,7 @@ INPUT_DIR = 'input_pdfs'
 OUTPUT_DIR = 'output_pdfs'
 TEMP_IMG_DIR = 'temp_images'
 INPUT_IMG_DIR = 'input_img'
+CACHE_DIR = '.cache'  # persisted indexes and caches (safe to delete)
 
 # Asset paths
 BG_TEXTURE_PATH = os.path.join(_ASSETS_DIR, 'background.png')
@@ -25,9 +26,19 @@ ICON_MERGE_PATH = os.path.join(_ASSETS_DIR, 'icon_merge.png')
 PADDING = 80  # workspace padding around the document (display units)
 SCALE = 2     # Legacy 2x resolution value (kept for backward compatibility)
 TARGET_HEIGHT = 2000  # Target height in pixels for document renderings
+PAGE_PNG_CACHE = False  # also keep rendered pages as PNGs in TEMP_IMG_DIR and reuse them across sessions
 ZOOM_LEVELS = [0.25, 0.33, 0.5, 0.66, 0.75, 0.8, 0.9, 1.0, 1.1, 1.25, 1.5, 1.75, 2.0, 2.5, 3.0, 4.0]
 DEFAULT_ZOOM_INDEX = 7  # 1.0
 HANDLE_SIZE = 10
+SPATIAL_INDEX_CELL_SIZE = 100  # grid cell size (base units) of the per-page element index
+CURSOR_BLINK_MS = 500  # text cursor blink interval in the editor
+IDLE_WAIT_MS = 500  # longest the editor sleeps waiting for events while nothing changes
+HISTORY_MERGE_MS = 1000  # repeated nudges or typing within this interval form one undo step
+
+# Tiled OCR (Tesseract): the page is split into overlapping horizontal bands OCR'd in parallel
+OCR_WORKERS = os.cpu_count() or 1  # processes in the OCR pool
+OCR_MIN_BAND_HEIGHT = 300  # pixels; smaller images are OCR'd in one piece
+OCR_BAND_OVERLAP = 64  # pixels shared by neighbouring bands, more than a line of text is tall
 
 # Colors
 TEXT_COLOR = (0, 0, 0)
@@ -1,21 +1,80 @@
 import pygame
 import os
-from app.template_editor.constants import SCALE, HIGHLIGHT_COLOR, INPUT_IMG_DIR
+import zlib
+import numpy as np
+from collections import OrderedDict
+from app.template_editor.constants import SCALE, HIGHLIGHT_COLOR, INPUT_IMG_DIR, OBSCURE_BLUR_KERNEL
+from app.template_editor.text_cache import render_text, get_text_size
+from app.template_editor.image_cache import load_image_surface, get_scaled_image
+from app.template_editor.image_filters import box_blur_array
 
-def draw_element(surface, element, selected=False, editing=False, current_text=None, show_cursor=False, cursor_pos=0, scale=1.0):
+OBSCURE_BLUR_CACHE_ENTRIES = 256
+_obscure_blur_cache = OrderedDict()  # id(element) -> (region size, pixel checksum, blurred surface)
+
+def _get_blurred_region(element, region):
+    """
+    Returns the box-blurred version of region, the pixels under an obscure element.
+    The last result per element is reused while the size and pixels underneath are
+    unchanged, which is every frame unless something below it moves or the view changes.
+    """
+    checksum = zlib.crc32(region.get_buffer().raw)
+    key = id(element)
+    entry = _obscure_blur_cache.get(key)
+    if entry is not None and entry[0] == region.get_size() and entry[1] == checksum:
+        _obscure_blur_cache.move_to_end(key)
+        return entry[2]
+
+    blurred = region.copy()
+    pygame.surfarray.blit_array(blurred, box_blur_array(pygame.surfarray.pixels3d(region), OBSCURE_BLUR_KERNEL))
+    _obscure_blur_cache[key] = (region.get_size(), checksum, blurred)
+    _obscure_blur_cache.move_to_end(key)
+    while len(_obscure_blur_cache) > OBSCURE_BLUR_CACHE_ENTRIES:
+        _obscure_blur_cache.popitem(last=False)
+    return blurred
+
+def _grid_cuts(start, length, cells, visible_start, visible_end):
+    """
+    Returns where the cells of a grid dividing [start, start + length) into `cells`
+    equal parts begin within [visible_start, visible_end), relative to visible_start.
+    The visible range is assumed to lie within the grid.
+    """
+    cuts = [0]
+    for k in range(1, cells):
+        edge = start + k * length // cells
+        if visible_start < edge < visible_end:
+            cuts.append(edge - visible_start)
+    return cuts
+
+def _pixelate_region(region, col_cuts, row_cuts):
+    """
+    Returns region with every grid cell (columns and rows starting at col_cuts and
+    row_cuts) filled with the mean colour of its pixels.
+    """
+    pixels = pygame.surfarray.array3d(region)
+    sums = np.add.reduceat(np.add.reduceat(pixels, col_cuts, axis=0, dtype=np.int64), row_cuts, axis=1)
+    widths = np.diff(col_cuts + [pixels.shape[0]])
+    heights = np.diff(row_cuts + [pixels.shape[1]])
+    means = (sums // (widths[:, None, None] * heights[None, :, None])).astype(np.uint8)
+    pixelated = region.copy()
+    pygame.surfarray.blit_array(pixelated, np.repeat(np.repeat(means, widths, axis=0), heights, axis=1))
+    return pixelated
+
+def draw_element(surface, element, selected=False, editing=False, current_text=None, show_cursor=False, cursor_pos=0, scale=1.0, offset=(0, 0)):
     """
     Draws a template element.
     For text: el['x'], el['y'] are top-left of bounding box. el['width'], el['height'] are box dims.
     For rectangle: el['x'], el['y'] are top-left. el['width'], el['height'] are dims.
     'scale' is state['zoom']. All base units are multiplied by 'scale' for drawing.
+    'offset' is where the document's origin lies on 'surface', e.g. the canvas position
+    when drawing straight onto the window.
     """
     if scale <= 0: return None, 0, 0
 
     el_type = element.get('type')
 
     # --- Element's bounding box (scaled) ---
-    scaled_box_x = int(element.get('x', 0) * scale)
-    scaled_box_y = int(element.get('y', 0) * scale)
+    scaled_box_x = int(element.get('x', 0) * scale) + offset[0]
+    scaled_box_y = int(element.get('y', 0) * scale) + offset[1]
     scaled_box_width = int(element.get('width', 100) * scale)
     scaled_box_height = int(element.get('height', 30) * scale)
     background_color = tuple(element.get('background_color', (255,255,255))) # Default white for any element
@@ -33,11 +92,7 @@ def draw_element(surface, element, selected=False, editing=False, current_text=N
         font_name = element.get('font', 'arial')
         scaled_font_size = max(1, int(base_font_size * scale))
 
-        try:
-            font = pygame.font.SysFont(font_name, scaled_font_size)
-        except pygame.error:
-            font = pygame.font.Font(None, scaled_font_size) # Fallback
-        text_surf = font.render(text_to_draw, True, font_color)
+        text_surf = render_text(font_name, scaled_font_size, text_to_draw, font_color)
         scaled_text_content_width = text_surf.get_width()
         scaled_text_content_height = text_surf.get_height()
 
@@ -66,8 +121,7 @@ def draw_element(surface, element, selected=False, editing=False, current_text=N
             if editing and show_cursor and cursor_pos >= 0:
                 clamped_cursor_pos = max(0, min(cursor_pos, len(text_to_draw)))
                 cursor_offset_text = text_to_draw[:clamped_cursor_pos]
-                cursor_offset_surf = font.render(cursor_offset_text, True, font_color) 
-                cursor_draw_x_relative_to_blit = cursor_offset_surf.get_width()
+                cursor_draw_x_relative_to_blit = get_text_size(font_name, scaled_font_size, cursor_offset_text)[0]
                 final_cursor_draw_x = blit_text_at_x + cursor_draw_x_relative_to_blit
                 final_cursor_draw_x = max(blit_text_at_x, min(final_cursor_draw_x, blit_text_at_x + source_rect_for_blit.width -1 ))
                 cursor_y1 = blit_text_at_y
@@ -99,7 +153,7 @@ def draw_element(surface, element, selected=False, editing=False, current_text=N
                     else:
                         full_img_path = img_path
 
-                    img_surf = pygame.image.load(full_img_path)
+                    img_surf = load_image_surface(full_img_path)
                     img_orig_w, img_orig_h = img_surf.get_size()
 
                     if img_orig_w > 0 and img_orig_h > 0:
@@ -135,7 +189,7 @@ def draw_element(surface, element, selected=False, editing=False, current_text=N
                             content_blit_x = scaled_box_x + scaled_padding_left + (content_area_w - render_w) // 2
                             content_blit_y = scaled_box_y + scaled_padding_top + (content_area_h - render_h) // 2
                             
-                            scaled_img_surf = pygame.transform.smoothscale(img_surf, (render_w, render_h))
+                            scaled_img_surf = get_scaled_image(full_img_path, render_w, render_h)
                             surface.blit(scaled_img_surf, (content_blit_x, content_blit_y))
                         else: 
                             raise ValueError("Calculated render dimensions for image are zero after padding.")
@@ -145,8 +199,7 @@ def draw_element(surface, element, selected=False, editing=False, current_text=N
                 except Exception as e:
                     print(f"Error loading/drawing image {img_path} (resolved to {full_img_path if 'full_img_path' in locals() else 'N/A'}): {e}")
                     # Draw an X or error message on the box
-                    font = pygame.font.Font(None, max(1,int(20 * scale))) # Scale error font size
-                    err_surf = font.render("X", True, (255,0,0))
+                    err_surf = render_text(None, max(1,int(20 * scale)), "X", (255,0,0)) # Scale error font size
                     err_blit_x = scaled_box_x + (scaled_box_width - err_surf.get_width()) // 2
                     err_blit_y = scaled_box_y + (scaled_box_height - err_surf.get_height()) // 2
                     surface.blit(err_surf, (err_blit_x, err_blit_y))
@@ -154,34 +207,27 @@ def draw_element(surface, element, selected=False, editing=False, current_text=N
     elif el_type == 'obscure':
         # Dies wird benutzt um Infos in Dokumenten zu schwärzen.
         mode = element.get('mode', 'pixelate')
-        if scaled_box_width > 0 and scaled_box_height > 0:
+        # Only the part of the box inside the surface's clip area can be read back
+        obscure_rect = pygame.Rect(scaled_box_x, scaled_box_y, scaled_box_width, scaled_box_height).clip(surface.get_clip())
+        if scaled_box_width > 0 and scaled_box_height > 0 and obscure_rect.width > 0 and obscure_rect.height > 0:
             if mode == 'pixelate':
-                # Pixelate: downscale and upscale the area
+                # Pixelate: average the area over a coarse grid (8% of the box size). The grid
+                # is laid over the whole box, so its blocks stay put when only part is visible.
                 try:
-                    sub_surface = surface.subsurface((scaled_box_x, scaled_box_y, scaled_box_width, scaled_box_height)).copy()
-                    factor = 0.08  # 8% of original size
-                    small = pygame.transform.smoothscale(sub_surface, (max(1,int(scaled_box_width*factor)), max(1,int(scaled_box_height*factor))))
-                    pixelated = pygame.transform.scale(small, (scaled_box_width, scaled_box_height))
-                    surface.blit(pixelated, (scaled_box_x, scaled_box_y))
+                    factor = 0.08
+                    col_cuts = _grid_cuts(scaled_box_x, scaled_box_width, max(1, int(scaled_box_width * factor)),
+                                          obscure_rect.left, obscure_rect.right)
+                    row_cuts = _grid_cuts(scaled_box_y, scaled_box_height, max(1, int(scaled_box_height * factor)),
+                                          obscure_rect.top, obscure_rect.bottom)
+                    pixelated = _pixelate_region(surface.subsurface(obscure_rect), col_cuts, row_cuts)
+                    surface.blit(pixelated, obscure_rect.topleft)
                 except Exception as e:
                     pygame.draw.rect(surface, (0,0,0), (scaled_box_x, scaled_box_y, scaled_box_width, scaled_box_height))
             elif mode == 'blur':
                 # Simple box blur: average color in a grid
                 try:
-                    sub_surface = surface.subsurface((scaled_box_x, scaled_box_y, scaled_box_width, scaled_box_height)).copy()
-                    arr = pygame.surfarray.pixels3d(sub_surface)
-                    import numpy as np
-                    kernel_size = 7
-                    arr_blur = arr.copy()
-                    for y in range(arr.shape[1]):
-                        for x in range(arr.shape[0]):
-                            x0 = max(0, x - kernel_size//2)
-                            x1 = min(arr.shape[0], x + kernel_size//2 + 1)
-                            y0 = max(0, y - kernel_size//2)
-                            y1 = min(arr.shape[1], y + kernel_size//2 + 1)
-                            arr_blur[x, y] = np.mean(arr[x0:x1, y0:y1], axis=(0,1))
-                    pygame.surfarray.blit_array(sub_surface, arr_blur)
-                    surface.blit(sub_surface, (scaled_box_x, scaled_box_y))
+                    sub_surface = surface.subsurface(obscure_rect).copy()
+                    surface.blit(_get_blurred_region(element, sub_surface), obscure_rect.topleft)
                 except Exception as e:
                     pygame.draw.rect(surface, (0,0,0), (scaled_box_x, scaled_box_y, scaled_box_width, scaled_box_height))
             elif mode == 'blacken':
@@ -210,13 +256,7 @@ def get_element_bounds(element, zoom_level_unused): # zoom_level_unused is not u
         base_font_size = element.get('font_size', 18)
         font_name = element.get('font', 'arial')
         text_value = element.get('value', '')
-        try:
-            font = pygame.font.SysFont(font_name, base_font_size)
-        except pygame.error:
-            font = pygame.font.Font(None, base_font_size)
-        text_surf = font.render(text_value, True, (0,0,0)) # Color doesn't matter for size
-        base_text_content_width = text_surf.get_width()
-        base_text_content_height = text_surf.get_height()
+        base_text_content_width, base_text_content_height = get_text_size(font_name, base_font_size, text_value)
     elif element.get('type') == 'image': # Images also have explicit w/h
         pass # base_text_content_width/height remain 0 for images
 
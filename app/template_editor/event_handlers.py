@@ -4,18 +4,20 @@ from pygame_gui.elements import UITextEntryLine
 import os
 import pygame.surfarray
 import numpy as np
-import copy
 import time
 
 from app.template_editor.constants import SCALE, ZOOM_LEVELS, DEFAULT_ZOOM_INDEX, HANDLE_SIZE, INPUT_IMG_DIR
 from app.template_editor.elements import get_element_bounds, get_resize_handles
 from app.template_editor.canvas import get_canvas_coords
+from app.template_editor.text_cache import get_text_size
+from app.template_editor.spatial_index import get_page_index, index_add, index_remove, index_update
+from app.template_editor.history import push_history, undo_history, begin_history, commit_history
 from app.template_editor.ui_text_properties import hide_font_menu, show_font_menu, handle_font_menu_event, is_editing_custom_key_input
 from app.template_editor.ui_image_properties import show_image_properties_panel, hide_image_properties_panel, handle_image_properties_event
 from app.template_editor.ui_components import ImageFileSelectWindow
 from app.template_editor import ui_text_properties # Ensure this import is present or adjust as needed
 from app.template_editor.ui_obscure_properties import show_obscure_properties_panel, hide_obscure_properties_panel, handle_obscure_properties_event
-from app.template_editor import ocr_utils
+from app.template_editor.ocr_worker import OcrJob
 
 def handle_keyboard_event(event, state, manager: pygame_gui.UIManager):
     """Handle keyboard events"""
@@ -99,6 +101,7 @@ def handle_keyboard_event(event, state, manager: pygame_gui.UIManager):
                     # Insert the new elements
                     for i, element in enumerate(new_elements):
                         page_elements.insert(insertion_idx + i, element)
+                        index_add(state, element)
 
                     # Update selection to the newly pasted elements
                     state['selected_indices'] = list(range(insertion_idx, insertion_idx + len(new_elements)))
@@ -143,9 +146,11 @@ def handle_keyboard_event(event, state, manager: pygame_gui.UIManager):
                     if 0 <= idx < len(page_elements):
                         page_elements[idx]['x'] = page_elements[idx].get('x', 0) + dx
                         page_elements[idx]['y'] = page_elements[idx].get('y', 0) + dy
+                        index_update(state, page_elements[idx])
                         moved = True
                 if moved:
-                    push_history(state)
+                    # Successive nudges of the same selection form one undo step
+                    push_history(state, merge_key=('nudge', state['page_num'], tuple(state['selected_indices'])))
                     state['ui_needs_update'] = True
                     state['redraw'] = True
                     return True
@@ -194,10 +199,12 @@ def handle_keyboard_event(event, state, manager: pygame_gui.UIManager):
                     state['editing_text'] = editing_text[:text_cursor_pos-1] + editing_text[text_cursor_pos:]
                     state['text_cursor_pos'] -= 1
                     state['config']['pages'][state['page_num']]['elements'][editing_idx]['value'] = state['editing_text']
+                    push_history(state, merge_key=('text', state['page_num'], editing_idx))
             elif event.key == pygame.K_DELETE:
                 if text_cursor_pos < len(editing_text):
                     state['editing_text'] = editing_text[:text_cursor_pos] + editing_text[text_cursor_pos+1:]
                     state['config']['pages'][state['page_num']]['elements'][editing_idx]['value'] = state['editing_text']
+                    push_history(state, merge_key=('text', state['page_num'], editing_idx))
             elif event.key == pygame.K_LEFT:
                 state['text_cursor_pos'] = max(0, text_cursor_pos - 1)
             elif event.key == pygame.K_RIGHT:
@@ -210,6 +217,7 @@ def handle_keyboard_event(event, state, manager: pygame_gui.UIManager):
                 state['editing_text'] = editing_text[:text_cursor_pos] + event.unicode + editing_text[text_cursor_pos:]
                 state['text_cursor_pos'] += 1
                 state['config']['pages'][state['page_num']]['elements'][editing_idx]['value'] = state['editing_text']
+                push_history(state, merge_key=('text', state['page_num'], editing_idx))
             return True
         
         elif not state['text_edit_mode']:
@@ -239,7 +247,7 @@ def handle_keyboard_event(event, state, manager: pygame_gui.UIManager):
                 if selected_indices:
                     for idx in selected_indices:
                         if 0 <= idx < len(page_elements):
-                            del page_elements[idx]
+                            index_remove(state, page_elements.pop(idx))
                     state['selected_indices'] = []
                     state['selected_idx'] = None
                     hide_font_menu()
@@ -294,7 +302,10 @@ def handle_mousebuttondown(event, state, window, manager: pygame_gui.UIManager):
             resize_initiated = False
 
             # 1. Check for resize handle clicks FIRST
-            for el_idx, el_iter in enumerate(current_page_elements):
+            # Only elements whose box is within a handle's reach of the click can match
+            page_index = get_page_index(state)
+            for el_idx in page_index.query_point(cx, cy, HANDLE_SIZE / state['zoom']):
+                el_iter = current_page_elements[el_idx]
                 handles = get_resize_handles(el_iter, SCALE / state['zoom'])
                 for h_idx, (hx, hy) in enumerate(handles):
                     if abs(cx - hx) <= HANDLE_SIZE / state['zoom'] and abs(cy - hy) <= HANDLE_SIZE / state['zoom']:
@@ -310,11 +321,7 @@ def handle_mousebuttondown(event, state, window, manager: pygame_gui.UIManager):
                             state['orig_rect'] = (el_iter['x'], el_iter['y'], el_iter.get('width', 100), el_iter.get('height', 30))
                             state['resize_start_mouse'] = (cx, cy)
                             if el_iter.get('type') == 'text':
-                                try:
-                                    orig_font = pygame.font.SysFont(el_iter.get('font', 'arial'), el_iter.get('font_size', 18))
-                                except pygame.error:
-                                    orig_font = pygame.font.Font(None, el_iter.get('font_size', 18))
-                                state['orig_text_content_dims'] = (orig_font.render(el_iter.get('value', ''), True, (0,0,0)).get_size())
+                                state['orig_text_content_dims'] = get_text_size(el_iter.get('font', 'arial'), el_iter.get('font_size', 18), el_iter.get('value', ''))
 
 
                         # Set common states for any resize initiation
@@ -328,6 +335,8 @@ def handle_mousebuttondown(event, state, window, manager: pygame_gui.UIManager):
                         
                         clicked_on_handle = True
                         resize_initiated = True
+                        # The whole resize becomes one undo step, recorded on mouse up
+                        begin_history(state, 'font_resize' if state.get('font_resizing') else 'resize')
                         break
                 if clicked_on_handle:
                     break
@@ -364,7 +373,8 @@ def handle_mousebuttondown(event, state, window, manager: pygame_gui.UIManager):
                 # 2. If NO handle was clicked, check if an element body was clicked
 
                 clicked_elements_indices = []
-                for el_idx, el_iter in enumerate(current_page_elements):
+                for el_idx in page_index.query_point(cx, cy):
+                    el_iter = current_page_elements[el_idx]
                     x_el, y_el, w_el, h_el, _, _ = get_element_bounds(el_iter, SCALE / state['zoom'])
                     if x_el <= cx <= x_el + w_el and y_el <= cy <= y_el + h_el:
                         clicked_elements_indices.append(el_idx) # Collect all elements under click
@@ -396,6 +406,7 @@ def handle_mousebuttondown(event, state, window, manager: pygame_gui.UIManager):
                     state['drag_start_mouse_canvas'] = (cx, cy)
                     state['drag_start_el_x'] = element_clicked['x']
                     state['drag_start_el_y'] = element_clicked['y']
+                    begin_history(state, 'drag')  # recorded once on mouse up
 
                     state['resizing'] = False
                     state['font_resizing'] = False
@@ -438,6 +449,7 @@ def handle_mousebuttondown(event, state, window, manager: pygame_gui.UIManager):
                         pygame.mouse.set_visible(False) # Hide system cursor for text editing
                         # Font menu is already shown
                         state['dragging'] = False # Cancel drag if it's a double click into text edit
+                        commit_history(state)
                     
                     state['last_click_idx_for_double_click'] = body_hit_idx
                     state['last_click_time_for_double_click'] = current_time
@@ -454,6 +466,7 @@ def handle_mousebuttondown(event, state, window, manager: pygame_gui.UIManager):
                     state['dragging'] = False
                     state['resizing'] = False
                     state['font_resizing'] = False
+                    commit_history(state)  # records a drag or resize still open
                     
                     hide_font_menu()
                     hide_image_properties_panel()
@@ -474,6 +487,7 @@ def handle_mousebuttondown(event, state, window, manager: pygame_gui.UIManager):
                 'text_align_h': 'left', 'text_align_v': 'top'
             }
             current_page_elements.append(new_el)
+            index_add(state, new_el)
             new_idx = len(current_page_elements) - 1
             state['selected_idx'] = new_idx
             state['selected_indices'] = [new_idx]
@@ -501,6 +515,7 @@ def handle_mousebuttondown(event, state, window, manager: pygame_gui.UIManager):
                 'padding': {'left': 0, 'top': 0, 'right': 0, 'bottom': 0}
             }
             current_page_elements.append(new_el)
+            index_add(state, new_el)
             new_idx = len(current_page_elements) - 1
             state['selected_idx'] = new_idx
             state['selected_indices'] = [new_idx]
@@ -526,6 +541,7 @@ def handle_mousebuttondown(event, state, window, manager: pygame_gui.UIManager):
                 'background_color': [255, 255, 255]
             }
             current_page_elements.append(new_el)
+            index_add(state, new_el)
             new_idx = len(current_page_elements) - 1
             state['selected_idx'] = new_idx
             state['selected_indices'] = [new_idx]
@@ -545,6 +561,7 @@ def handle_mousebuttondown(event, state, window, manager: pygame_gui.UIManager):
                 'mode': 'pixelate'
             }
             current_page_elements.append(new_el)
+            index_add(state, new_el)
             new_idx = len(current_page_elements) - 1
             state['selected_idx'] = new_idx
             state['selected_indices'] = [new_idx]
@@ -578,6 +595,7 @@ def handle_mousebuttondown(event, state, window, manager: pygame_gui.UIManager):
             state['dragging'] = False
             state['resizing'] = False
             state['font_resizing'] = False
+            commit_history(state)  # records a drag or resize still open
             hide_font_menu()
             hide_image_properties_panel()
             hide_obscure_properties_panel()
@@ -598,6 +616,7 @@ def handle_mousebuttondown(event, state, window, manager: pygame_gui.UIManager):
         state['resizing'] = False
         state['font_resizing'] = False
         state['marquee_selecting'] = False
+        commit_history(state)  # records a drag or resize still open
         handled = True
     
     return handled
@@ -619,7 +638,8 @@ def handle_mousebuttonup(event, state):
             # Find elements in the marquee area
             page_elements = state['config']['pages'][state['page_num']]['elements']
             selected_indices = []
-            for idx, el in enumerate(page_elements):
+            for idx in get_page_index(state).query_rect(marquee_rect):
+                el = page_elements[idx]
                 x_el, y_el, w_el, h_el, _, _ = get_element_bounds(el, SCALE/state['zoom'])
                 el_rect = pygame.Rect(x_el, y_el, w_el, h_el)
                 if marquee_rect.colliderect(el_rect):
@@ -659,8 +679,8 @@ def handle_mousebuttonup(event, state):
     if state['dragging']:
         state['dragging'] = False
         state['offset'] = (0, 0)
-        # Push to history on completion of a dragging operation
-        push_history(state)
+        # Record the drag as one history entry
+        commit_history(state)
         return True
     
     # Handle mouseup for canvas drag
@@ -674,16 +694,16 @@ def handle_mousebuttonup(event, state):
     if state['resizing']:
         state['resizing'] = False
         state['resize_mode'] = None
-        # Push to history on completion of a resize operation
-        push_history(state)
+        # Record the resize as one history entry
+        commit_history(state)
         return True
     
     # Handle mouseup for font resizing
     if state['font_resizing']:
         state['font_resizing'] = False 
         state['font_resizing_mode'] = None 
-        # Push to history on completion of a font resize operation
-        push_history(state)
+        # Record the font resize as one history entry
+        commit_history(state)
         return True
     
     return False
@@ -725,6 +745,7 @@ def handle_mousemotion(event, state, window, manager):
         
         el['x'] = state['drag_start_el_x'] + dx
         el['y'] = state['drag_start_el_y'] + dy
+        index_update(state, el)
         
         # If text edit mode was active for this element, update font menu position
         if state['text_edit_mode'] and state['editing_idx'] == idx and el['type'] == 'text':
@@ -831,6 +852,7 @@ def handle_resize_motion(state, cx, cy):
         el['y'] = new_y
         el['width'] = new_w
         el['height'] = new_h
+        index_update(state, el)
         return
 
     # --- Existing generic resize logic for non-image elements --- 
@@ -867,6 +889,7 @@ def handle_resize_motion(state, cx, cy):
     el['y'] = new_y
     el['width'] = new_w
     el['height'] = new_h
+    index_update(state, el)
     # 'padding' key is no longer used for this type of resize.
 
 def handle_font_resize_motion(state, cx, cy):
@@ -1019,6 +1042,10 @@ def handle_ui_event(event, state, save_config_func, manager):
                 print("[DEBUG] Smart Generate mode activated. Draw a marquee to select area for OCR processing.")
                 return True
             elif ui_element == state.get('btn_generate_fields'):
+                # While OCR runs the button reads 'Cancel OCR'
+                if state.get('ocr_job'):
+                    cancel_ocr_job(state)
+                    return True
                 # Check if we need to process a smart generate request
                 if state.get('smart_generate_process'):
                     # Process the smart generate request using the stored bounds
@@ -1032,8 +1059,8 @@ def handle_ui_event(event, state, save_config_func, manager):
                         state['tool_mode'] = 'select'  # Switch back to select mode
                         return True
                 
-                # If not a smart generate request, run normal generate fields
-                run_generate_fields(state)
+                # If not a smart generate request, run OCR on the whole page
+                start_ocr_job(state)
                 return True
                 
             elif button_id == '#confirm_image_selection' and state.get('image_select_dialog'):
@@ -1089,6 +1116,7 @@ def handle_ui_event(event, state, save_config_func, manager):
                                 # Adjust x and y to center the new tight bounds within the original container bounds
                                 target_element['x'] = container_x + (container_w - final_scaled_w) / 2
                                 target_element['y'] = container_y + (container_h - final_scaled_h) / 2
+                                index_update(state, target_element)
                                 
                                 push_history(state)
                                 state['redraw'] = True
@@ -1133,7 +1161,7 @@ def handle_ui_event(event, state, save_config_func, manager):
                 return True
             elif hasattr(event.ui_element, 'object_ids') and event.ui_element.object_ids and '#remove_text_node' in event.ui_element.object_ids[-1]:
                 if state['editing_idx'] is not None and state['editing_idx'] < len(state['config']['pages'][state['page_num']]['elements']):
-                    del state['config']['pages'][state['page_num']]['elements'][state['editing_idx']]
+                    index_remove(state, state['config']['pages'][state['page_num']]['elements'].pop(state['editing_idx']))
                     reset_text_edit_mode(state)
                     state['selected_idx'] = None
                     push_history(state)
@@ -1141,30 +1169,6 @@ def handle_ui_event(event, state, save_config_func, manager):
                 state['insert_mode'] = 'obscure'
                 state['tool_mode'] = None
                 pygame.mouse.set_visible(False)
-            elif ui_element == state.get('btn_generate_fields'):
-                # Run OCR on the current page image and add text nodes
-                arr = pygame.surfarray.array3d(state['doc_img_full'])
-                arr = np.transpose(arr, (1, 0, 2))  # Pygame is (w,h,3), PIL is (h,w,3)
-                ocr_results = ocr_utils.ocr_image(arr)
-                for res in ocr_results:
-                    new_el = {
-                        'type': 'text',
-                        'x': res['left'],
-                        'y': res['top'],
-                        'width': res['width'],
-                        'height': res['height'],
-                        'font_size': res['font_size'],
-                        'value': res['text'],
-                        'background_color': [255, 255, 255],
-                        'font_color': [0, 0, 0],
-                        'text_align_h': 'left',
-                        'text_align_v': 'top',
-                        'font': 'arial'
-                    }
-                    state['config']['pages'][state['page_num']]['elements'].append(new_el)
-                state['redraw'] = True
-                push_history(state)
-                return True
             elif button_id == '#convert_to_obscure':
                 selected_indices = state.get('selected_indices', [])
                 if len(selected_indices) == 1:
@@ -1249,8 +1253,9 @@ def handle_ui_event(event, state, save_config_func, manager):
                             'height': max_y - min_y
                         }
                     for idx in sorted(selected_indices, reverse=True):
-                        del page_elements[idx]
+                        index_remove(state, page_elements.pop(idx))
                     page_elements.insert(selected_indices[0], new_el)
+                    index_add(state, new_el)
                     state['selected_indices'] = [selected_indices[0]]
                     state['selected_idx'] = selected_indices[0]
                     if new_el['type'] == 'image':
@@ -1380,8 +1385,9 @@ def handle_ui_event(event, state, save_config_func, manager):
                     'height': max_y - min_y
                 }
             for idx in sorted(selected_indices, reverse=True):
-                del page_elements[idx]
+                index_remove(state, page_elements.pop(idx))
             page_elements.insert(selected_indices[0], new_el)
+            index_add(state, new_el)
             state['selected_indices'] = [selected_indices[0]]
             state['selected_idx'] = selected_indices[0]
             if merge_type == 'image':
@@ -1390,77 +1396,90 @@ def handle_ui_event(event, state, save_config_func, manager):
 
 def smart_generate_fields(state, bounds):
     """
-    Extracts the selected area from the current page image, runs OCR, and adds detected fields as new text elements.
+    Starts OCR of the selected area of the current page image; detected fields are added
+    as new text elements as they arrive (see poll_ocr_job).
     Args:
         state (dict): The editor state.
         bounds (tuple): (x, y, width, height) in canvas coordinates.
     """
-    x, y, w, h = map(int, bounds)
+    start_ocr_job(state, bounds)
+
+def start_ocr_job(state, bounds=None):
+    """
+    Starts OCR of the current page image, or of bounds (x, y, width, height) within it,
+    on a worker thread. Only one OCR job runs at a time.
+    """
+    if state.get('ocr_job'):
+        print("[OCR] A job is already running. Cancel it first.")
+        return
     # Get the full page image as a numpy array
     arr = pygame.surfarray.array3d(state['doc_img_full'])
     arr = np.transpose(arr, (1, 0, 2))  # Pygame is (w,h,3), PIL is (h,w,3)
-    # Crop the selected area
-    crop = arr[y:y+h, x:x+w]
-    if crop.size == 0:
-        print("[smart_generate_fields] Selected area is empty. No OCR performed.")
-        return
-    # Run OCR on the cropped area
-    ocr_results = ocr_utils.ocr_image(crop)
-    # Add new elements for each detected field
-    for res in ocr_results:
-        new_el = {
-            'type': 'text',
-            'x': x + res['left'],
-            'y': y + res['top'],
-            'width': res['width'],
-            'height': res['height'],
-            'font_size': res['font_size'],
-            'value': res['text'],
-            'background_color': [255, 255, 255],
-            'font_color': [0, 0, 0],
-            'text_align_h': 'left',
-            'text_align_v': 'top',
-            'font': 'arial'
-        }
-        state['config']['pages'][state['page_num']]['elements'].append(new_el)
-    state['redraw'] = True
-    push_history(state)
-    print(f"[smart_generate_fields] Added {len(ocr_results)} fields from OCR.")
-
-def push_history(state):
-    """
-    Save a deep copy of the current config to the history stack for undo/redo.
-    Trims any future history if the user has undone and then makes a new change.
-    """
-    # If we've undone some steps, remove all future history
-    if state['history_index'] < len(state['history']) - 1:
-        state['history'] = state['history'][:state['history_index'] + 1]
-    # Append a deep copy of the current config
-    state['history'].append(copy.deepcopy(state['config']))
-    state['history_index'] = len(state['history']) - 1
-    # Optional: limit history size for memory (e.g., 100 steps)
-    MAX_HISTORY = 100
-    if len(state['history']) > MAX_HISTORY:
-        state['history'] = state['history'][-MAX_HISTORY:]
-        state['history_index'] = len(state['history']) - 1
-    print(f"[push_history] History length: {len(state['history'])}, current index: {state['history_index']}")
-
-def undo_history(state):
+    if bounds is not None:
+        x, y, w, h = map(int, bounds)
+        # Clip to the page, so the bounds (part of the OCR cache key) match the area read
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, arr.shape[1]), min(y + h, arr.shape[0])
+        if x1 <= x0 or y1 <= y0:
+            print("[smart_generate_fields] Selected area is empty. No OCR performed.")
+            return
+        bounds = (x0, y0, x1 - x0, y1 - y0)
+    state['ocr_job'] = OcrJob(arr, bounds, page_num=state['page_num']).start()
+    if state.get('btn_generate_fields'):
+        state['btn_generate_fields'].set_text('Cancel OCR')
+    state['hud_dirty'] = True
+    print(f"[OCR] Started on page {state['page_num'] + 1}" + (f", area {bounds}" if bounds else ""))
+
+def cancel_ocr_job(state):
+    """Stops the running OCR job; fields already added stay (one Ctrl+Z removes them)."""
+    job = state.get('ocr_job')
+    if job:
+        job.cancel()
+        state['hud_dirty'] = True
+        print("[OCR] Cancelling...")
+
+def poll_ocr_job(state):
     """
-    Undo the last change by reverting to the previous config in the history stack.
-    Updates state['config'] and state['history_index'] if possible.
-    Also clears selection and marks UI for update.
+    Called every frame from the main loop. Adds the fields the OCR job found since the
+    last call to the job's page and finishes the job once the worker is done. All fields
+    of one job form a single undo step, unless other edits come in between.
     """
-    if state['history_index'] > 0:
-        state['history_index'] -= 1
-        state['config'] = copy.deepcopy(state['history'][state['history_index']])
-        state['selected_idx'] = None
-        state['selected_indices'] = []
-        state['editing_idx'] = None
+    job = state.get('ocr_job')
+    if job is None:
+        return
+    ocr_results = job.poll()
+    if ocr_results:
+        page_elements = state['config']['pages'][job.page_num].setdefault('elements', [])
+        for res in ocr_results:
+            new_el = {
+                'type': 'text',
+                'x': res['left'],
+                'y': res['top'],
+                'width': res['width'],
+                'height': res['height'],
+                'font_size': res['font_size'],
+                'value': res['text'],
+                'background_color': [255, 255, 255],
+                'font_color': [0, 0, 0],
+                'text_align_h': 'left',
+                'text_align_v': 'top',
+                'font': 'arial'
+            }
+            page_elements.append(new_el)
+            index_add(state, new_el, job.page_num)
+        push_history(state, merge_key=('ocr', id(job)), merge_ms=None)
+        state['redraw'] = True
+        state['ui_needs_update'] = True
+    if job.done:
+        state['ocr_job'] = None
+        if state.get('btn_generate_fields'):
+            state['btn_generate_fields'].set_text('Generate Fields')
         state['ui_needs_update'] = True
-        print(f"[undo_history] Undid to history index: {state['history_index']}")
-    else:
-        print("[undo_history] Already at oldest history state. Nothing to undo.")
+        if job.error is not None:
+            print(f"[OCR] Failed: {job.error}")
+        else:
+            print(f"[OCR] {'Cancelled' if job.cancelled else 'Finished'}. Added {job.results_count} fields.")
+    state['hud_dirty'] = True
 
 def handle_arrow_key_repeat(state):
     """
@@ -1497,9 +1516,10 @@ def handle_arrow_key_repeat(state):
             if 0 <= idx < len(page_elements):
                 page_elements[idx]['x'] = page_elements[idx].get('x', 0) + dx
                 page_elements[idx]['y'] = page_elements[idx].get('y', 0) + dy
+                index_update(state, page_elements[idx])
                 moved = True
         if moved:
-            push_history(state)
+            push_history(state, merge_key=('nudge', state['page_num'], tuple(state['selected_indices'])))
             state['ui_needs_update'] = True
             state['redraw'] = True
     state['arrow_key_last_time'] = now
\ No newline at end of file
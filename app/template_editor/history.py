@@ -0,0 +1,201 @@
+import copy
+import time
+
+from app.template_editor.constants import HISTORY_MERGE_MS
+from app.template_editor.spatial_index import invalidate_page_index
+
+# Undo history for the editor. Each entry is a snapshot of the config made of frozen
+# records that are shared between entries: an element, a page's settings or the
+# top-level settings are copied only when they changed since the previous entry, and
+# a page whose elements all stayed the same reuses the previous entry's tuple. The
+# history therefore grows with the edits made rather than with the config size.
+#
+# A snapshot is (top-level settings, pages), each page being (page settings, element
+# records or None if the page has no 'elements' key). Records are never modified.
+# state['history_records'] maps id(element) -> (live element, its record in the newest
+# entry), so the next push can tell unchanged elements by comparing them to their record.
+#
+# Continuous edits are folded into one entry in two ways. A push with a merge_key equal
+# to the previous push's, made within HISTORY_MERGE_MS of it, replaces the newest entry
+# instead of adding one (held arrow keys, typing). Between begin_history and
+# commit_history pushes are deferred and a single entry is recorded on commit (drags
+# and resizes).
+MAX_HISTORY = 100
+
+def _settings(d, nested_key):
+    return {k: v for k, v in d.items() if k != nested_key}
+
+def _freeze(state, previous):
+    """Returns a snapshot of state['config'] sharing unchanged records with previous."""
+    config = state['config']
+    records = state.get('history_records', {})
+    new_records = {}
+
+    prev_rest, prev_pages = previous if previous else (None, ())
+    rest = _settings(config, 'pages')
+    rest_record = prev_rest if prev_rest == rest else copy.deepcopy(rest)
+
+    pages = []
+    for page_num, page in enumerate(config.get('pages', [])):
+        prev_meta, prev_elements = prev_pages[page_num] if page_num < len(prev_pages) else (None, None)
+        meta = _settings(page, 'elements')
+        meta_record = prev_meta if prev_meta == meta else copy.deepcopy(meta)
+
+        element_records = None
+        if 'elements' in page:
+            element_records = []
+            for el in page['elements']:
+                cached = records.get(id(el))
+                if cached is not None and cached[0] is el and cached[1] == el:
+                    record = cached[1]
+                else:
+                    record = copy.deepcopy(el)
+                new_records[id(el)] = (el, record)
+                element_records.append(record)
+            element_records = tuple(element_records)
+            if (prev_elements is not None and len(prev_elements) == len(element_records)
+                    and all(a is b for a, b in zip(prev_elements, element_records))):
+                element_records = prev_elements
+        pages.append((meta_record, element_records))
+
+    state['history_records'] = new_records
+    return (rest_record, tuple(pages))
+
+def _restore(state, snapshot):
+    """
+    Brings state['config'] back to snapshot in place. Live elements equal to their record
+    are kept as they are; only elements that differ are copied back from their records.
+    """
+    config = state['config']
+    rest_record, page_records = snapshot
+    live_by_record = {id(record): el for el, record in state.get('history_records', {}).values()}
+    new_records = {}
+
+    if _settings(config, 'pages') != rest_record:
+        for key in [k for k in config if k != 'pages']:
+            del config[key]
+        config.update(copy.deepcopy(rest_record))
+
+    pages = config.setdefault('pages', [])
+    del pages[len(page_records):]
+    while len(pages) < len(page_records):
+        pages.append({})
+    for page_num, (meta_record, element_records) in enumerate(page_records):
+        page = pages[page_num]
+        if _settings(page, 'elements') != meta_record:
+            for key in [k for k in page if k != 'elements']:
+                del page[key]
+            page.update(copy.deepcopy(meta_record))
+
+        if element_records is None:
+            if page.pop('elements', None) is not None:
+                invalidate_page_index(state, page_num)
+            continue
+        restored = []
+        for record in element_records:
+            el = live_by_record.get(id(record))
+            if el is None or el != record:
+                el = copy.deepcopy(record)
+            new_records[id(el)] = (el, record)
+            restored.append(el)
+        live = page.setdefault('elements', [])
+        if len(live) != len(restored) or any(a is not b for a, b in zip(live, restored)):
+            live[:] = restored
+            invalidate_page_index(state, page_num)
+
+    state['history_records'] = new_records
+
+def _same_snapshot(a, b):
+    """True if b shares all of a's records, i.e. nothing changed between them."""
+    return (a[0] is b[0] and len(a[1]) == len(b[1])
+            and all(pa[0] is pb[0] and pa[1] is pb[1] for pa, pb in zip(a[1], b[1])))
+
+def reset_history(state):
+    """Starts the history over with the current config as its only entry."""
+    state['history_records'] = {}
+    state['history_transaction'] = None
+    state['history_merge_key'] = None
+    state['history'] = [_freeze(state, None)]
+    state['history_index'] = 0
+
+def push_history(state, merge_key=None, merge_ms=HISTORY_MERGE_MS):
+    """
+    Records the current config as a new history entry for undo.
+    Trims any future history if the user has undone and then makes a new change.
+    With merge_key, a push following one with the same key within merge_ms updates
+    that entry instead, so e.g. a held arrow key becomes one undo step. merge_ms=None
+    merges however long ago that push was (used for the batches of one OCR job).
+    """
+    if state.get('history_transaction') is not None:
+        return  # recorded once by commit_history
+    now = time.time()
+    merge = (merge_key is not None and merge_key == state.get('history_merge_key')
+             and (merge_ms is None or (now - state.get('history_merge_time', 0)) * 1000 < merge_ms)
+             and state['history_index'] == len(state['history']) - 1
+             and len(state['history']) > 1)
+    state['history_merge_key'] = merge_key
+    state['history_merge_time'] = now
+    if merge:
+        state['history'][-1] = _freeze(state, state['history'][-2])
+        print(f"[push_history] Merged into history index: {state['history_index']}")
+        return
+    _append(state, _freeze(state, _current_entry(state)))
+
+def _current_entry(state):
+    return state['history'][state['history_index']] if state['history'] else None
+
+def _append(state, snapshot):
+    # If we've undone some steps, remove all future history
+    if state['history_index'] < len(state['history']) - 1:
+        state['history'] = state['history'][:state['history_index'] + 1]
+    state['history'].append(snapshot)
+    state['history_index'] = len(state['history']) - 1
+    if len(state['history']) > MAX_HISTORY:
+        state['history'] = state['history'][-MAX_HISTORY:]
+        state['history_index'] = len(state['history']) - 1
+    print(f"[push_history] History length: {len(state['history'])}, current index: {state['history_index']}")
+
+def begin_history(state, kind):
+    """
+    Opens a transaction for a continuous edit such as a drag: pushes are deferred until
+    commit_history, which records the whole edit as one entry. A transaction left open
+    is committed first.
+    """
+    if state.get('history_transaction') is not None:
+        commit_history(state)
+    state['history_transaction'] = kind
+
+def commit_history(state):
+    """Closes the open transaction, recording one entry if the config changed."""
+    if state.get('history_transaction') is None:
+        return
+    state['history_transaction'] = None
+    previous = _current_entry(state)
+    snapshot = _freeze(state, previous)
+    if previous is not None and _same_snapshot(previous, snapshot):
+        return  # e.g. a click on an element without moving it
+    state['history_merge_key'] = None
+    _append(state, snapshot)
+
+def undo_history(state):
+    """
+    Undo the last change by reverting to the previous entry in the history stack.
+    Updates state['config'] in place and state['history_index'] if possible.
+    Also clears selection and marks UI for update. An edit still in progress (e.g.
+    Ctrl+Z during a drag) is recorded first, so it is the step undone.
+    """
+    commit_history(state)
+    state['history_merge_key'] = None
+    if state['history_index'] > 0:
+        state['history_index'] -= 1
+        _restore(state, state['history'][state['history_index']])
+        state['selected_idx'] = None
+        state['selected_indices'] = []
+        state['editing_idx'] = None
+        state['dragging'] = False  # the dragged or resized element may be gone
+        state['resizing'] = False
+        state['font_resizing'] = False
+        state['ui_needs_update'] = True
+        print(f"[undo_history] Undid to history index: {state['history_index']}")
+    else:
+        print("[undo_history] Already at oldest history state. Nothing to undo.")
@@ -0,0 +1,56 @@
+import os
+import pygame
+from collections import OrderedDict
+
+# Image element surfaces for the editor. Decoded images are kept per (path, mtime), so a
+# file is read from disk once and again only after it changes; smoothscaled copies are
+# kept per render size, which changes only with the element's size, padding or the zoom.
+IMAGE_SURFACE_CACHE_MAX_BYTES = 128 * 1024 * 1024
+SCALED_IMAGE_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+_image_surfaces = OrderedDict()  # (path, mtime) -> decoded surface, least recently used first
+_scaled_images = OrderedDict()  # (path, mtime, width, height) -> scaled surface
+_cache_bytes = {'decoded': 0, 'scaled': 0}
+
+def _surface_bytes(surf):
+    return surf.get_width() * surf.get_height() * surf.get_bytesize()
+
+def _store(cache, kind, max_bytes, key, surf):
+    cache[key] = surf
+    _cache_bytes[kind] += _surface_bytes(surf)
+    # Always keep the newest surface, even if it alone exceeds the budget
+    while _cache_bytes[kind] > max_bytes and len(cache) > 1:
+        _, old = cache.popitem(last=False)
+        _cache_bytes[kind] -= _surface_bytes(old)
+
+def _image_key(path):
+    full_path = os.path.abspath(path)
+    return (full_path, os.stat(full_path).st_mtime_ns)
+
+def load_image_surface(path):
+    """
+    Returns the decoded image at path as a shared surface that must not be modified.
+    Raises OSError or pygame.error if the file cannot be read.
+    """
+    key = _image_key(path)
+    surf = _image_surfaces.get(key)
+    if surf is not None:
+        _image_surfaces.move_to_end(key)
+        return surf
+    surf = pygame.image.load(key[0])
+    _store(_image_surfaces, 'decoded', IMAGE_SURFACE_CACHE_MAX_BYTES, key, surf)
+    return surf
+
+def get_scaled_image(path, width, height):
+    """
+    Returns the image at path smoothscaled to width x height as a shared surface that
+    must not be modified. Raises like load_image_surface.
+    """
+    key = _image_key(path) + (width, height)
+    surf = _scaled_images.get(key)
+    if surf is not None:
+        _scaled_images.move_to_end(key)
+        return surf
+    surf = pygame.transform.smoothscale(load_image_surface(path), (width, height))
+    _store(_scaled_images, 'scaled', SCALED_IMAGE_CACHE_MAX_BYTES, key, surf)
+    return surf
@@ -0,0 +1,41 @@
+import numpy as np
+
+from app.template_editor.constants import OBSCURE_BLUR_KERNEL
+
+# Image filters shared by the template editor and doc_templater, so an obscured region
+# looks the same on screen and in the generated PDF. They work on numpy arrays whose
+# first two axes are the image axes (in either order, as pygame.surfarray and
+# numpy.asarray(PIL image) use different ones), followed by the color channels.
+
+def _window_sums(arr, axis, radius):
+    """
+    Sums arr over a window of radius pixels on both sides along axis, with the window
+    clipped at the edges. Returns (sums, counts) with counts shaped to broadcast.
+    """
+    n = arr.shape[axis]
+    padded_shape = list(arr.shape)
+    padded_shape[axis] = n + 1
+    cumulative = np.zeros(padded_shape, dtype=np.int64)
+    index = [slice(None)] * arr.ndim
+    index[axis] = slice(1, None)
+    np.cumsum(arr, axis=axis, dtype=np.int64, out=cumulative[tuple(index)])
+
+    positions = np.arange(n)
+    lo = np.maximum(positions - radius, 0)
+    hi = np.minimum(positions + radius + 1, n)
+    sums = np.take(cumulative, hi, axis=axis) - np.take(cumulative, lo, axis=axis)
+    counts_shape = [1] * arr.ndim
+    counts_shape[axis] = n
+    return sums, (hi - lo).reshape(counts_shape)
+
+def box_blur_array(arr, kernel_size=OBSCURE_BLUR_KERNEL):
+    """
+    Returns a box-blurred uint8 copy of arr: every pixel becomes the mean of the
+    kernel_size x kernel_size block around it, truncated to an integer. Near the edges
+    the block is clipped to the image and the mean taken over the pixels inside.
+    Works in whole-array operations through summed-area sums along each axis.
+    """
+    radius = kernel_size // 2
+    sums, counts_0 = _window_sums(np.asarray(arr), 0, radius)
+    sums, counts_1 = _window_sums(sums, 1, radius)
+    return (sums // (counts_0 * counts_1)).astype(np.uint8)
@@ -0,0 +1,92 @@
+import os
+import json
+import hashlib
+
+from app.template_editor.constants import CACHE_DIR
+
+# OCR results persisted in CACHE_DIR, so running Generate Fields again on the same page,
+# or Smart Generate over part of it, does not OCR it again. An entry is keyed by a hash
+# of the page raster, the OCR'd bounds (None for the whole page) and the OCR settings
+# (ocr_utils.get_ocr_settings). Results are stored as the engine returned them, relative
+# to the OCR'd region. A crop of a page whose whole-page results are cached is answered
+# from those by keeping the words whose centre falls inside the crop.
+OCR_CACHE_DIR = os.path.join(CACHE_DIR, 'ocr')
+OCR_CACHE_VERSION = 1
+OCR_CACHE_MAX_ENTRIES = 500  # oldest entries are removed beyond this
+
+def hash_raster(image):
+    """Returns a hex digest of an image array's shape and pixels."""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(repr(image.shape).encode())
+    digest.update(memoryview(image).cast('B') if image.flags['C_CONTIGUOUS'] else image.tobytes())
+    return digest.hexdigest()
+
+def _entry_path(raster_hash, bounds, settings):
+    key = json.dumps([OCR_CACHE_VERSION, raster_hash, list(bounds) if bounds else None, settings],
+                     sort_keys=True)
+    return os.path.join(OCR_CACHE_DIR, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+def load_results(raster_hash, bounds, settings):
+    """Returns the cached results for this raster, bounds and settings, or None."""
+    path = _entry_path(raster_hash, bounds, settings)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            results = json.load(f)['results']
+    except (OSError, ValueError, KeyError):
+        return None
+    try:
+        os.utime(path)  # recently used: pruned last
+    except OSError:
+        pass
+    return results
+
+def store_results(raster_hash, bounds, settings, results):
+    """Persists results for this raster, bounds and settings; failures are only reported."""
+    path = _entry_path(raster_hash, bounds, settings)
+    try:
+        os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+        # Write to a temp file first so a concurrent reader never sees a partial entry
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'bounds': bounds, 'settings': settings, 'results': results}, f)
+        os.replace(tmp_path, path)
+        _prune()
+    except OSError as e:
+        print(f"Warning: Could not save OCR results to {path}: {e}")
+
+def _prune():
+    entries = [os.path.join(OCR_CACHE_DIR, name) for name in os.listdir(OCR_CACHE_DIR) if name.endswith('.json')]
+    if len(entries) <= OCR_CACHE_MAX_ENTRIES:
+        return
+    entries.sort(key=os.path.getmtime)
+    for path in entries[:len(entries) - OCR_CACHE_MAX_ENTRIES]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def crop_results(page_results, bounds):
+    """
+    Returns the whole-page results whose box centre lies within bounds (x, y, width,
+    height), moved to be relative to the crop like results of OCR on the crop itself.
+    """
+    x, y, w, h = bounds
+    cropped = []
+    for res in page_results:
+        centre_x = res['left'] + res['width'] / 2
+        centre_y = res['top'] + res['height'] / 2
+        if x <= centre_x < x + w and y <= centre_y < y + h:
+            cropped.append(dict(res, left=res['left'] - x, top=res['top'] - y))
+    return cropped
+
+def find_results(raster_hash, bounds, settings):
+    """
+    Returns cached results for OCR of bounds (None for the whole page) on this raster,
+    taken from the whole-page entry when there is one, or None if nothing is cached.
+    """
+    page_results = load_results(raster_hash, None, settings)
+    if page_results is not None:
+        return page_results if bounds is None else crop_results(page_results, bounds)
+    if bounds is None:
+        return None
+    return load_results(raster_hash, bounds, settings)
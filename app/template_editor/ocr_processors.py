@@ -22,6 +22,7 @@ class OcrProcessor(abc.ABC):
 
 class TesseractProcessor(OcrProcessor):
     def __init__(self, tesseract_cmd_path='C:\\Program Files\\Tesseract-OCR\\tesseract.exe'):
+        self.tesseract_cmd_path = tesseract_cmd_path
         pytesseract.pytesseract.tesseract_cmd = tesseract_cmd_path
 
     def ocr_image(self, image):
@@ -1,5 +1,8 @@
 import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from .ocr_processors import TesseractProcessor, EasyOcrProcessor, OcrProcessor
+from .constants import OCR_WORKERS, OCR_MIN_BAND_HEIGHT, OCR_BAND_OVERLAP
 
 _ocr_processor_instance: OcrProcessor = None
 
@@ -29,10 +32,143 @@ def get_ocr_processor() -> OcrProcessor:
             _ocr_processor_instance = TesseractProcessor(tesseract_cmd_path=tesseract_cmd)
     return _ocr_processor_instance
 
+def get_ocr_settings():
+    """
+    Returns the settings that shape OCR results (engine, languages, tiling), as stored
+    in the OCR cache key so results of other settings are never reused.
+    """
+    processor = get_ocr_processor()
+    settings = {'engine': type(processor).__name__}
+    if isinstance(processor, EasyOcrProcessor):
+        settings['languages'] = os.environ.get("EASYOCR_LANGUAGES", "en").split(',')
+    else:
+        settings['tesseract_cmd'] = processor.tesseract_cmd_path
+    settings['tiled'] = use_tiled_ocr()
+    if settings['tiled']:
+        # Not OCR_WORKERS: merged band results do not depend on how many bands there are,
+        # and the cache stays valid on machines with another core count
+        settings['bands'] = [OCR_MIN_BAND_HEIGHT, OCR_BAND_OVERLAP]
+    return settings
+
+def ocr_ready():
+    """
+    False if the OCR engine failed to start (EasyOCR without its models) and returns no
+    results, which must not be cached.
+    """
+    processor = get_ocr_processor()
+    return not (isinstance(processor, EasyOcrProcessor) and processor.reader is None)
+
 def ocr_image(image):
     """
     Run OCR on a PIL Image or numpy array using the configured OCR engine.
     Returns a list of dicts as specified by OcrProcessor.ocr_image.
     """
     processor = get_ocr_processor()
-    return processor.ocr_image(image)
\ No newline at end of file
+    return processor.ocr_image(image)
+
+# --- Tiled OCR ---
+# Tesseract reads a page on one core. In tiled mode the image is cut into horizontal
+# bands overlapping by OCR_BAND_OVERLAP pixels, which a process pool OCRs concurrently.
+# A word near a seam is seen by both bands, whole by at least one of them, so words in
+# the overlaps are merged: copies with the same text and overlapping boxes are kept
+# once, and fragments cut off at a band edge give way to the whole word.
+_ocr_pool = None
+
+def use_tiled_ocr():
+    """
+    True if OCR should run in bands on the process pool. Only used with Tesseract, as
+    every EasyOCR process would load its own model; OCR_TILED=0 turns it off.
+    """
+    return (os.environ.get("OCR_TILED", "1") != "0"
+            and isinstance(get_ocr_processor(), TesseractProcessor))
+
+def _init_pool_worker():
+    # Bands already run in parallel; keep each Tesseract to one thread
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+def get_ocr_pool():
+    global _ocr_pool
+    if _ocr_pool is None:
+        # spawn: the editor has threads running, which a forked worker would inherit badly
+        _ocr_pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_pool_worker)
+    return _ocr_pool
+
+def plan_bands(height):
+    """Returns (top, bottom) pixel rows of the bands to OCR an image height pixels tall."""
+    # One band per worker, each at least OCR_MIN_BAND_HEIGHT tall
+    count = max(1, min(OCR_WORKERS, height // OCR_MIN_BAND_HEIGHT))
+    if count == 1:
+        return [(0, height)]
+    band_height = -(-(height + (count - 1) * OCR_BAND_OVERLAP) // count)
+    bands = []
+    top = 0
+    while True:
+        bottom = min(height, top + band_height)
+        bands.append((top, bottom))
+        if bottom >= height:
+            return bands
+        top = bottom - OCR_BAND_OVERLAP
+
+def ocr_band(image, top):
+    """Pool task: OCRs one band and moves its boxes to image coordinates."""
+    return [dict(res, top=res['top'] + top) for res in ocr_image(image)]
+
+def _overlap(a, b):
+    """Area shared by two result boxes, relative to the smaller box."""
+    w = min(a['left'] + a['width'], b['left'] + b['width']) - max(a['left'], b['left'])
+    h = min(a['top'] + a['height'], b['top'] + b['height']) - max(a['top'], b['top'])
+    if w <= 0 or h <= 0:
+        return 0.0
+    smaller = min(a['width'] * a['height'], b['width'] * b['height'])
+    return (w * h) / smaller if smaller > 0 else 0.0
+
+class BandMerger:
+    """
+    Collects band results as they finish, in any order. add_band returns the words that
+    are final: words away from the seams at once, words in a seam's overlap once both of
+    its bands are in, merged as described above.
+    """
+    def __init__(self, bands, height):
+        self.bands = bands
+        self.height = height
+        self._done = set()
+        self._pending = {}  # seam number -> [(clipped, result)], seam i is between bands i and i+1
+
+    def _seam_of(self, res):
+        for seam in range(len(self.bands) - 1):
+            seam_top, seam_bottom = self.bands[seam + 1][0], self.bands[seam][1]
+            if res['top'] < seam_bottom and res['top'] + res['height'] > seam_top:
+                return seam
+        return None
+
+    def add_band(self, band_idx, results):
+        top, bottom = self.bands[band_idx]
+        final = []
+        for res in results:
+            seam = self._seam_of(res)
+            if seam is None:
+                final.append(res)
+                continue
+            clipped = ((top > 0 and res['top'] <= top + 1)
+                       or (bottom < self.height and res['top'] + res['height'] >= bottom - 1))
+            self._pending.setdefault(seam, []).append((clipped, res))
+        self._done.add(band_idx)
+        for seam in (band_idx - 1, band_idx):
+            if seam in self._pending and seam in self._done and seam + 1 in self._done:
+                final.extend(self._merge_seam(self._pending.pop(seam)))
+        return final
+
+    def _merge_seam(self, candidates):
+        kept = []
+        # Whole words first, most confident first
+        for clipped, res in sorted(candidates, key=lambda c: (c[0], -c[1].get('conf', 0))):
+            duplicate = False
+            for other in kept:
+                overlap = _overlap(res, other)
+                if overlap >= 0.5 and (clipped or res['text'].strip() == other['text'].strip()):
+                    duplicate = True
+                    break
+            if not duplicate:
+                kept.append(res)
+        return kept
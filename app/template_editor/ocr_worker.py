@@ -0,0 +1,138 @@
+import queue
+import threading
+from concurrent.futures import as_completed
+
+import pygame
+
+from app.template_editor import ocr_utils, ocr_cache
+
+# OCR for "Generate Fields" and Smart Generate runs here, on a worker thread, so the
+# editor keeps responding while Tesseract or EasyOCR work through a page. The worker
+# posts OCR_EVENT whenever a job makes progress, which wakes the editor loop to collect
+# the results with OcrJob.poll().
+OCR_EVENT = pygame.event.custom_type()
+
+class OcrJob:
+    """
+    OCR of a page image (an (h, w, 3) array), or of bounds (x, y, width, height) within
+    it. Results in the OCR cache are used when there are any (see ocr_cache); otherwise
+    the region is OCR'd, split into bands on the process pool with tiled OCR (see
+    ocr_utils) or as one part, and the results are cached once the job completes if it
+    found anything.
+    Results come back through poll() part by part as they are found, with 'left' and
+    'top' already moved to page coordinates.
+    cancel() stops the job: results found afterwards are dropped, although an OCR call
+    already under way runs to its end on the worker.
+    """
+    def __init__(self, page_image, bounds=None, page_num=0):
+        self.page_num = page_num
+        self.parts_total = 1
+        self.parts_done = 0
+        self.results_count = 0
+        self.done = False
+        self.cancelled = False
+        self.error = None
+        self._page_image = page_image
+        self._bounds = bounds
+        self._origin = tuple(bounds[:2]) if bounds else (0, 0)
+        self._queue = queue.Queue()
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='ocr-worker', daemon=True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self.cancelled = True
+        self._cancel.set()
+
+    def _post(self, item):
+        self._queue.put(item)
+        try:
+            pygame.event.post(pygame.event.Event(OCR_EVENT))
+        except pygame.error:
+            pass  # display already shut down
+
+    def _post_results(self, results):
+        origin_x, origin_y = self._origin
+        self._post([dict(res, left=res['left'] + origin_x, top=res['top'] + origin_y)
+                    for res in results])
+
+    def _run_tiled(self, image, bands):
+        """OCRs image band by band and returns all its results, or None if cancelled."""
+        merger = ocr_utils.BandMerger(bands, image.shape[0])
+        pool = ocr_utils.get_ocr_pool()
+        futures = {pool.submit(ocr_utils.ocr_band, image[top:bottom], top): band_idx
+                   for band_idx, (top, bottom) in enumerate(bands)}
+        found = []
+        try:
+            for future in as_completed(futures):
+                if self._cancel.is_set():
+                    return None
+                results = merger.add_band(futures[future], future.result())
+                found.extend(results)
+                self._post_results(results)
+        finally:
+            for future in futures:
+                future.cancel()  # bands not started yet, after a cancel or an error
+        return found
+
+    def _run(self):
+        try:
+            settings = ocr_utils.get_ocr_settings()
+            raster_hash = ocr_cache.hash_raster(self._page_image)
+            cached = ocr_cache.find_results(raster_hash, self._bounds, settings)
+            if cached is not None:
+                print(f"[OCR] Using cached results ({len(cached)} fields)")
+                self._post_results(cached)
+                return
+
+            image = self._page_image
+            if self._bounds:
+                x, y, w, h = self._bounds
+                image = image[y:y+h, x:x+w]
+            bands = ocr_utils.plan_bands(image.shape[0])
+            if len(bands) > 1 and ocr_utils.use_tiled_ocr():
+                self.parts_total = len(bands)
+                found = self._run_tiled(image, bands)
+            else:
+                found = ocr_utils.ocr_image(image)
+                if self._cancel.is_set():
+                    found = None
+                else:
+                    self._post_results(found)
+            # Nothing found is not cached: it may come from an engine that failed to start
+            if found and ocr_utils.ocr_ready():
+                ocr_cache.store_results(raster_hash, self._bounds, settings, found)
+        except Exception as e:
+            self._post(e)
+        finally:
+            self._page_image = None
+            self._post(None)  # finished
+
+    def poll(self):
+        """Returns the results that arrived since the last call, in page coordinates."""
+        new_results = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.done = True
+            elif isinstance(item, Exception):
+                self.error = item
+            elif not self.cancelled:
+                self.parts_done += 1
+                new_results.extend(item)
+        self.results_count += len(new_results)
+        return new_results
+
+    def status_text(self):
+        """One line describing the job's progress for the editor's help text."""
+        if self.cancelled:
+            return "OCR: cancelling..."
+        return (f"OCR: {self.parts_done}/{self.parts_total} parts done, "
+                f"{self.results_count} fields added. Click 'Cancel OCR' to stop.")
@@ -0,0 +1,120 @@
+import os
+import threading
+from collections import OrderedDict
+
+import pygame
+
+from app.template_editor.constants import TEMP_IMG_DIR, PAGE_PNG_CACHE
+from app.template_editor.pdf_utils import pdf_page_to_surface, pdf_render_lock
+
+# Rendered document pages for the editor. Pages are kept in memory in an LRU keyed by
+# (pdf path, mtime, page number), and a background thread renders the pages next to
+# the one shown, so page navigation usually finds its page already rendered.
+PAGE_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+_page_cache = OrderedDict()  # key -> surface, least recently used first
+_page_cache_bytes = 0
+_cache_lock = threading.Lock()
+_in_flight = {}  # key -> threading.Event set when its render finishes
+
+_prefetch_queue = []  # (pdf_path, page_num) still to prefetch, next one first
+_prefetch_cond = threading.Condition()
+_prefetch_thread = None
+
+def _page_key(pdf_path, page_num):
+    full_path = os.path.abspath(pdf_path)
+    return (full_path, os.stat(full_path).st_mtime_ns, page_num)
+
+def _surface_bytes(surf):
+    return surf.get_width() * surf.get_height() * surf.get_bytesize()
+
+def _render_page(pdf_path, page_num):
+    """
+    Rasterizes one page at the editor resolution and returns it as a surface. With
+    PAGE_PNG_CACHE, a PNG in TEMP_IMG_DIR newer than the PDF is loaded instead, and
+    freshly rendered pages are written there.
+    """
+    png_path = None
+    if PAGE_PNG_CACHE:
+        base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        png_path = os.path.join(TEMP_IMG_DIR, f'{base_name}_page{page_num+1}_2x.png')
+        try:
+            if os.path.getmtime(png_path) >= os.path.getmtime(pdf_path):
+                return pygame.image.load(png_path)
+        except (OSError, pygame.error):
+            pass  # missing or unreadable: render it again
+    with pdf_render_lock:
+        return pdf_page_to_surface(pdf_path, page_num, png_path)
+
+def _store_page(key, surf):
+    global _page_cache_bytes
+    with _cache_lock:
+        if key in _page_cache:
+            return
+        _page_cache[key] = surf
+        _page_cache_bytes += _surface_bytes(surf)
+        # Always keep the newest page, even if it alone exceeds the budget
+        while _page_cache_bytes > PAGE_CACHE_MAX_BYTES and len(_page_cache) > 1:
+            _, old = _page_cache.popitem(last=False)
+            _page_cache_bytes -= _surface_bytes(old)
+
+def _get_or_render(key, pdf_path, page_num):
+    """
+    Returns the cached page for key, rendering it if needed. If another thread is
+    already rendering it, waits for that render instead of starting a second one.
+    """
+    while True:
+        with _cache_lock:
+            surf = _page_cache.get(key)
+            if surf is not None:
+                _page_cache.move_to_end(key)
+                return surf
+            pending = _in_flight.get(key)
+            if pending is None:
+                pending = _in_flight[key] = threading.Event()
+                break
+        pending.wait()
+        # The other render finished (or failed); look again
+
+    try:
+        surf = _render_page(pdf_path, page_num)
+        _store_page(key, surf)
+        return surf
+    finally:
+        with _cache_lock:
+            del _in_flight[key]
+        pending.set()
+
+def get_page_surface(pdf_path, page_num):
+    """
+    Returns page page_num of the PDF rendered at the editor resolution, from memory if
+    it was shown or prefetched before. The surface is shared and must not be modified.
+    """
+    return _get_or_render(_page_key(pdf_path, page_num), pdf_path, page_num)
+
+def _prefetch_worker():
+    while True:
+        with _prefetch_cond:
+            while not _prefetch_queue:
+                _prefetch_cond.wait()
+            pdf_path, page_num = _prefetch_queue.pop(0)
+        try:
+            _get_or_render(_page_key(pdf_path, page_num), pdf_path, page_num)
+        except Exception as e:
+            # A page past the end or a PDF that went away: the editor will report it if shown
+            print(f"[page_cache] Could not prefetch page {page_num+1} of {pdf_path}: {e}")
+
+def prefetch_pages(pdf_path, page_nums, page_count=None):
+    """
+    Renders the given pages in the background so a later get_page_surface returns at
+    once. Replaces any prefetch still waiting, as only the latest neighbours matter.
+    """
+    global _prefetch_thread
+    wanted = [(pdf_path, n) for n in page_nums
+              if n >= 0 and (page_count is None or n < page_count)]
+    with _prefetch_cond:
+        _prefetch_queue[:] = wanted
+        if _prefetch_thread is None:
+            _prefetch_thread = threading.Thread(target=_prefetch_worker, name='page-prefetch', daemon=True)
+            _prefetch_thread.start()
+        _prefetch_cond.notify()
@@ -1,10 +1,15 @@
 import os
+import threading
+from collections import deque
 import pymupdf
 from PIL import Image
 import json
 import pygame
 from app.template_editor.constants import SCALE, TEMP_IMG_DIR, CONFIG_DIR, INPUT_DIR, THUMB_SIZE, PREVIEW_SIZE, TARGET_HEIGHT
 
+# PyMuPDF is not thread-safe: every render made off the main thread holds this lock
+pdf_render_lock = threading.Lock()
+
 def pdf_page_to_image(pdf_path, page_num, out_path):
     """Convert a PDF page to an image file at a standardized height"""
     doc = pymupdf.open(pdf_path)
@@ -34,6 +39,26 @@ def pdf_page_to_image(pdf_path, page_num, out_path):
     doc.close()
     return out_path
 
+def pdf_page_to_surface(pdf_path, page_num, png_path=None):
+    """
+    Renders a PDF page at the standardized height straight into a pygame surface.
+    The pixmap's samples become the surface's pixel buffer without an image encode or
+    decode in between. If png_path is given, the page is also saved there as a PNG.
+    """
+    doc = pymupdf.open(pdf_path)
+    try:
+        page = doc.load_page(page_num)
+        zoom_factor = TARGET_HEIGHT / page.rect.height
+        pix = page.get_pixmap(matrix=pymupdf.Matrix(zoom_factor, zoom_factor), alpha=False)
+        if png_path:
+            pix.save(png_path)
+        # pix.samples is a bytes copy the surface keeps alive, so the pixmap can be freed
+        surface = pygame.image.frombuffer(pix.samples, (pix.width, pix.height), 'RGB', pix.stride)
+    finally:
+        doc.close()
+    print(f"Rendered page {page_num+1} at size: {pix.width}x{pix.height} pixels (zoom: {zoom_factor:.2f})")
+    return surface
+
 def load_config(pdf_filename):
     """Load the template configuration for a PDF file"""
     base_name = os.path.splitext(pdf_filename)[0]
@@ -79,19 +104,120 @@ def generate_preview(pdf_path, preview_path):
         print(f'Could not create preview: {e}')
         return False
 
+def get_cached_image_path(pdf, kind):
+    """
+    Returns the path of the cached 'thumb' or 'preview' image for a PDF in INPUT_DIR.
+    The name carries the PDF's size and mtime, so an edited PDF gets a new image.
+    """
+    stat = os.stat(os.path.join(INPUT_DIR, pdf))
+    return os.path.join(TEMP_IMG_DIR, f'{os.path.splitext(pdf)[0]}_{kind}_{stat.st_size}_{stat.st_mtime_ns}.png')
+
+def _remove_stale_images(pdf, kind, keep_path):
+    """Deletes cached images of a PDF made from older versions of it."""
+    prefix = f'{os.path.splitext(pdf)[0]}_{kind}'
+    try:
+        names = os.listdir(TEMP_IMG_DIR)
+    except OSError:
+        return
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        parts = stem[len(prefix):].split('_') if stem.startswith(prefix) else None
+        # '<pdf>_<kind>.png' from before versioned names, or '<pdf>_<kind>_<size>_<mtime>.png'
+        if ext == '.png' and parts is not None and (parts == [''] or (len(parts) == 3 and parts[0] == '' and parts[1].isdigit() and parts[2].isdigit())):
+            path = os.path.join(TEMP_IMG_DIR, name)
+            if path != keep_path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+_IMAGE_GENERATORS = {'thumb': generate_thumbnail, 'preview': generate_preview}
+_failed_images = set()  # (pdf, kind, mtime_ns) that could not be made, not retried until the PDF changes
+
+def _failure_key(pdf, kind):
+    return (pdf, kind, os.stat(os.path.join(INPUT_DIR, pdf)).st_mtime_ns)
+
+def _make_cached_image(pdf, kind):
+    """Generates the cached image of a PDF unless it is up to date. Returns its path or None."""
+    try:
+        image_path = get_cached_image_path(pdf, kind)
+        failure_key = _failure_key(pdf, kind)
+    except OSError as e:
+        print(f'Could not create {kind} for {pdf}: {e}')
+        return None
+    if failure_key in _failed_images:
+        return None
+    if not os.path.exists(image_path):
+        tmp_path = f'{image_path}.tmp.png'
+        with pdf_render_lock:
+            ok = _IMAGE_GENERATORS[kind](os.path.join(INPUT_DIR, pdf), tmp_path)
+        if not ok:
+            _failed_images.add(failure_key)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return None
+        os.replace(tmp_path, image_path)  # never expose a half-written file to the UI
+        _remove_stale_images(pdf, kind, image_path)
+    return image_path
+
 def get_pdf_thumbnails(pdf_files):
     """Generate thumbnails for a list of PDF files"""
     thumb_paths = {}
     for pdf in pdf_files:
-        thumb_path = os.path.join(TEMP_IMG_DIR, f'{os.path.splitext(pdf)[0]}_thumb.png')
-        if not os.path.exists(thumb_path):
-            generate_thumbnail(os.path.join(INPUT_DIR, pdf), thumb_path)
-        thumb_paths[pdf] = thumb_path
+        thumb_paths[pdf] = _make_cached_image(pdf, 'thumb')
     return thumb_paths
 
 def get_preview_path(pdf):
     """Get the path to a PDF preview image, generating it if needed"""
-    preview_path = os.path.join(TEMP_IMG_DIR, f'{os.path.splitext(pdf)[0]}_preview.png')
-    if not os.path.exists(preview_path):
-        generate_preview(os.path.join(INPUT_DIR, pdf), preview_path)
-    return preview_path 
\ No newline at end of file
+    return _make_cached_image(pdf, 'preview')
+
+# Thumbnails and previews for the file picker are made by a background thread, so the
+# dialog opens at once; urgent requests (the selected file's preview) jump the queue.
+_image_requests = deque()  # (pdf, kind) waiting to be generated
+_image_requests_cond = threading.Condition()
+_image_thread = None
+
+def _image_worker():
+    while True:
+        with _image_requests_cond:
+            while not _image_requests:
+                _image_requests_cond.wait()
+            pdf, kind = _image_requests.popleft()
+        _make_cached_image(pdf, kind)
+
+def request_pdf_image(pdf, kind, urgent=False):
+    """
+    Returns the path of the cached 'thumb' or 'preview' image of a PDF if it is ready,
+    False if it could not be made (unreadable PDF), otherwise None after queueing it for
+    the background thread. Poll again later.
+    """
+    global _image_thread
+    try:
+        image_path = get_cached_image_path(pdf, kind)
+        failure_key = _failure_key(pdf, kind)
+    except OSError:
+        return False
+    if os.path.exists(image_path):
+        return image_path
+    if failure_key in _failed_images:
+        return False
+    with _image_requests_cond:
+        if (pdf, kind) in _image_requests:
+            if not urgent:
+                return None
+            _image_requests.remove((pdf, kind))
+        if urgent:
+            _image_requests.appendleft((pdf, kind))
+        else:
+            _image_requests.append((pdf, kind))
+        if _image_thread is None:
+            _image_thread = threading.Thread(target=_image_worker, name='pdf-images', daemon=True)
+            _image_thread.start()
+        _image_requests_cond.notify()
+    return None
+
+def request_pdf_thumbnails(pdf_files):
+    """Queues thumbnails for a list of PDF files. Returns {pdf: path, None if pending or False if failed}."""
+    return {pdf: request_pdf_image(pdf, 'thumb') for pdf in pdf_files}
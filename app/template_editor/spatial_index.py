@@ -0,0 +1,177 @@
+import math
+
+from app.template_editor.constants import SPATIAL_INDEX_CELL_SIZE
+
+# Uniform grid over the elements of a page, so clicks, marquee selection and the draw
+# loop look only at the elements near a point or rectangle instead of the whole page.
+# Queries return candidate indices into the page's element list in list order; callers
+# still apply their exact test, as the grid only narrows the search to nearby cells.
+#
+# The index is kept per page in state['spatial_indexes'] and updated by the editor at
+# the places that add, remove, move or resize elements (index_add, index_remove,
+# index_update). get_page_index rebuilds it when the page's element list is replaced
+# (undo, loading a template) and resyncs it if the element count changed without a hook.
+
+def _element_bounds(element):
+    """Returns (left, top, right, bottom) of the element's box in base units."""
+    x = element.get('x', 0)
+    y = element.get('y', 0)
+    w = element.get('width', 100)
+    h = element.get('height', 30)
+    return min(x, x + w), min(y, y + h), max(x, x + w), max(y, y + h)
+
+class SpatialIndex:
+    def __init__(self, elements, cell_size=SPATIAL_INDEX_CELL_SIZE):
+        self.cell_size = cell_size
+        self._cells = {}  # (col, row) -> set of id(element)
+        self._entries = {}  # id(element) -> (element, cell range)
+        self._positions = {}  # id(element) -> index in the element list
+        self._elements = elements
+        for element in elements:
+            self._insert(element)
+        self._positions_stale = True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _cell_range(self, left, top, right, bottom):
+        size = self.cell_size
+        return (math.floor(left / size), math.floor(top / size),
+                math.floor(right / size), math.floor(bottom / size))
+
+    def _insert(self, element):
+        cell_range = self._cell_range(*_element_bounds(element))
+        c0, r0, c1, r1 = cell_range
+        key = id(element)
+        for col in range(c0, c1 + 1):
+            for row in range(r0, r1 + 1):
+                self._cells.setdefault((col, row), set()).add(key)
+        self._entries[key] = (element, cell_range)
+
+    def _discard(self, key):
+        _, (c0, r0, c1, r1) = self._entries.pop(key)
+        for col in range(c0, c1 + 1):
+            for row in range(r0, r1 + 1):
+                cell = self._cells.get((col, row))
+                if cell is not None:
+                    cell.discard(key)
+                    if not cell:
+                        del self._cells[(col, row)]
+
+    def add(self, element):
+        """Indexes an element newly added to the page."""
+        if id(element) in self._entries:
+            self._discard(id(element))
+        self._insert(element)
+        self._positions_stale = True
+
+    def remove(self, element):
+        """Drops an element removed from the page."""
+        if id(element) in self._entries:
+            self._discard(id(element))
+            self._positions_stale = True
+
+    def update(self, element):
+        """Re-buckets an element after it was moved or resized."""
+        entry = self._entries.get(id(element))
+        if entry is None:
+            self.add(element)
+            return
+        if self._cell_range(*_element_bounds(element)) != entry[1]:
+            self._discard(id(element))
+            self._insert(element)
+
+    def sync(self):
+        """Brings the index back in line with the element list after unhooked changes."""
+        current = {id(el): el for el in self._elements}
+        for key, (element, _) in list(self._entries.items()):
+            if current.get(key) is not element:
+                self._discard(key)
+        for key, element in current.items():
+            if key not in self._entries:
+                self._insert(element)
+        self._positions_stale = True
+
+    def _collect(self, left, top, right, bottom):
+        c0, r0, c1, r1 = self._cell_range(left, top, right, bottom)
+        if (c1 - c0 + 1) * (r1 - r0 + 1) > len(self._cells):
+            # Query covers more cells than are occupied: walk the occupied ones instead
+            keys = set()
+            for (col, row), cell in self._cells.items():
+                if c0 <= col <= c1 and r0 <= row <= r1:
+                    keys.update(cell)
+        else:
+            keys = set()
+            for col in range(c0, c1 + 1):
+                for row in range(r0, r1 + 1):
+                    cell = self._cells.get((col, row))
+                    if cell:
+                        keys.update(cell)
+        if self._positions_stale:
+            self._positions = {id(el): i for i, el in enumerate(self._elements)}
+            self._positions_stale = False
+        return sorted(self._positions[key] for key in keys if key in self._positions)
+
+    def query_point(self, x, y, margin=0):
+        """
+        Returns the indices of elements whose box, grown by margin on every side, may
+        contain (x, y). With margin set to the handle size this finds the elements
+        whose resize handles may be under the point, as handles sit on the box edges.
+        """
+        return self._collect(x - margin, y - margin, x + margin, y + margin)
+
+    def query_rect(self, rect):
+        """Returns the indices of elements whose box may overlap rect (a pygame.Rect)."""
+        # One unit of slack covers pygame.Rect truncating fractional element positions
+        return self._collect(rect.left - 1, rect.top - 1, rect.right + 1, rect.bottom + 1)
+
+def get_page_index(state, page_num=None):
+    """
+    Returns the spatial index of a page (the current page by default), building it on
+    first use or when the page's element list was replaced.
+    """
+    if page_num is None:
+        page_num = state['page_num']
+    elements = state['config']['pages'][page_num].get('elements')
+    if elements is None:
+        return SpatialIndex([])  # page without elements: nothing to index or keep
+    indexes = state.setdefault('spatial_indexes', {})
+    index = indexes.get(page_num)
+    if index is None or index._elements is not elements:
+        index = indexes[page_num] = SpatialIndex(elements)
+    elif len(index) != len(elements):
+        index.sync()
+    return index
+
+def _built_index(state, page_num=None):
+    """Returns a page's index if it is built and up to date, else None."""
+    if page_num is None:
+        page_num = state['page_num']
+    index = state.get('spatial_indexes', {}).get(page_num)
+    if index is None:
+        return None
+    if index._elements is not state['config']['pages'][page_num].get('elements'):
+        return None  # list replaced: get_page_index rebuilds it anyway
+    return index
+
+def index_add(state, element, page_num=None):
+    """Call after adding element to a page (the current page by default)."""
+    index = _built_index(state, page_num)
+    if index is not None:
+        index.add(element)
+
+def index_remove(state, element):
+    """Call after removing element from the current page."""
+    index = _built_index(state)
+    if index is not None:
+        index.remove(element)
+
+def index_update(state, element):
+    """Call after moving or resizing element on the current page."""
+    index = _built_index(state)
+    if index is not None:
+        index.update(element)
+
+def invalidate_page_index(state, page_num):
+    """Drops a page's index after its elements were replaced wholesale (e.g. by undo)."""
+    state.get('spatial_indexes', {}).pop(page_num, None)
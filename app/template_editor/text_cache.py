@@ -0,0 +1,51 @@
+import pygame
+from collections import OrderedDict
+
+# Fonts and rendered text for the editor. pygame.font.SysFont looks the font up on
+# every call, so fonts are kept per (name, size) and rendered text surfaces in an LRU
+# keyed by everything that affects their pixels; editing an element's text or style
+# simply produces a new key.
+TEXT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+_fonts = {}  # (font_name, size) -> pygame.font.Font
+_text_surfaces = OrderedDict()  # (font_name, size, text, color) -> surface, least recently used first
+_text_cache_bytes = 0
+
+def get_font(font_name, size):
+    """Returns the system font font_name at size, falling back to pygame's default font."""
+    key = (font_name, size)
+    font = _fonts.get(key)
+    if font is None:
+        try:
+            font = pygame.font.SysFont(font_name, size)
+        except pygame.error:
+            font = pygame.font.Font(None, size) # Fallback
+        _fonts[key] = font
+    return font
+
+def render_text(font_name, size, text, color):
+    """
+    Returns an antialiased surface of text in the given font and color. The surface is
+    shared between callers and must not be modified.
+    """
+    global _text_cache_bytes
+    key = (font_name, size, text, tuple(color))
+    surf = _text_surfaces.get(key)
+    if surf is not None:
+        _text_surfaces.move_to_end(key)
+        return surf
+
+    surf = get_font(font_name, size).render(text, True, color)
+    _text_surfaces[key] = surf
+    _text_cache_bytes += surf.get_width() * surf.get_height() * surf.get_bytesize()
+    while _text_cache_bytes > TEXT_CACHE_MAX_BYTES and len(_text_surfaces) > 1:
+        _, old = _text_surfaces.popitem(last=False)
+        _text_cache_bytes -= old.get_width() * old.get_height() * old.get_bytesize()
+    return surf
+
+def get_text_size(font_name, size, text):
+    """
+    Returns the (width, height) of text rendered in the given font. This is the size of
+    the rendered surface, which can be taller than Font.size() reports.
+    """
+    return render_text(font_name, size, text, (0, 0, 0)).get_size()
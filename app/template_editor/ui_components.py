@@ -3,7 +3,7 @@ import pygame
 import pygame_gui
 from pygame_gui.elements import UIButton, UILabel, UISelectionList, UIWindow, UIImage, UITextBox
 from app.template_editor.constants import TOOLBAR_BG_COLOR, PREVIEW_SIZE, CONFIG_DIR, INPUT_DIR, THUMBNAIL_SIZE
-from app.template_editor.pdf_utils import get_preview_path
+from app.template_editor.pdf_utils import request_pdf_image
 
 class ListFileSelectWindow(UIWindow):
     """File selection window for choosing PDFs to edit"""
@@ -31,6 +31,7 @@ class ListFileSelectWindow(UIWindow):
         )
         self.preview_img = None
         self.preview_img_widget = None
+        self.pending_preview = None  # file whose preview is still being generated
         self.stats_box = UITextBox(
             html_text='',
             relative_rect=pygame.Rect(360, 400, 260, 100),
@@ -56,21 +57,38 @@ class ListFileSelectWindow(UIWindow):
             self.update_preview(self.selected)
         return handled
     
+    def poll_preview(self):
+        """Shows the selected file's preview once the background thread has made it. Call every frame."""
+        if self.pending_preview:
+            preview_path = request_pdf_image(self.pending_preview, 'preview')
+            if preview_path is False:
+                self.preview_label.set_text(f'{self.pending_preview} (no preview available)')
+                self.pending_preview = None
+            elif preview_path:
+                self.update_preview(self.pending_preview)
+
     def update_preview(self, pdf):
         if self.preview_img_widget:
             self.preview_img_widget.kill()
             self.preview_img_widget = None
+        self.pending_preview = None
         
         if pdf:
-            preview_path = get_preview_path(pdf)
-            if os.path.exists(preview_path):
+            preview_path = request_pdf_image(pdf, 'preview', urgent=True)
+            if preview_path is False:
+                self.preview_label.set_text(f'{pdf} (no preview available)')
+            elif preview_path:
                 self.preview_img_widget = UIImage(
                     relative_rect=pygame.Rect(360, 70, PREVIEW_SIZE[0], PREVIEW_SIZE[1]),
                     image_surface=pygame.image.load(preview_path),
                     manager=self.ui_manager,
                     container=self
                 )
-            self.preview_label.set_text(pdf)
+                self.preview_label.set_text(pdf)
+            else:
+                # Placeholder until the preview is ready, see poll_preview
+                self.pending_preview = pdf
+                self.preview_label.set_text(f'{pdf} (loading preview...)')
             
             # Show file stats
             file_path = os.path.join(INPUT_DIR, pdf)
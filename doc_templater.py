@@ -1,19 +1,34 @@
 import os
+import io
 import json
 import pymupdf  # PyMuPDF
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
-import glob
-import platform
+import numpy as np
+from PIL import Image, ImageDraw
+import argparse
+import bisect
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 # Import constants from the template editor
 from app.template_editor.constants import (
     INPUT_DIR, CONFIG_DIR, OUTPUT_DIR, INPUT_IMG_DIR,
-    OBSCURE_PIXELATE_FACTOR, DEFAULT_OBSCURE_MODE, TARGET_HEIGHT
+    OBSCURE_PIXELATE_FACTOR, OBSCURE_BLUR_KERNEL, DEFAULT_OBSCURE_MODE, TARGET_HEIGHT
 )
+from app.template_editor.image_filters import box_blur_array
+from app.doc_templater import fonts, assets, manifest, datasets
+from app.doc_templater.assets import fit_image_in_box
+from app.doc_templater.plan import (
+    compile_template, compile_element, compile_accessor, resolve_accessor, is_op_static, split_static_layers
+)
+from app.doc_templater.pdf_writer import DEFAULT_PAGE_ENCODING, encode_page_image, write_output_pdf
 
 # Additional directory for template-specific images
 CONFIG_IMG_DIR = "config_img"
 
+# Recorded in the build manifest; bump when a rendering change should rebuild existing outputs
+RENDERER_VERSION = 2
+
 # Ensure these are consistent if they are also defined in constants.py
 # For this refactor, we will prioritize the imported constants.
 # CONFIG_DIR = "configs" (Now from constants)
@@ -32,47 +47,24 @@ def load_all_template_files():
     """
     Loads all template_keys_*.json files from the configs directory.
     Returns a list of (filename, template_data) tuples.
+    For large batches use datasets.iter_datasets, which streams records instead.
     """
-    template_files = []
-    pattern = os.path.join(CONFIG_DIR, 'template_keys_*.json')
-    
-    for template_file in glob.glob(pattern):
-        try:
-            with open(template_file, 'r', encoding='utf-8') as f:
-                template_data = json.load(f)
-                filename = os.path.basename(template_file)
-                template_files.append((filename, template_data))
-                print(f"Loaded template file: {filename}")
-        except Exception as e:
-            print(f"Error loading template file {template_file}: {e}")
-    
-    # Sort by filename for consistent ordering
-    template_files.sort(key=lambda x: x[0])
-    
-    if not template_files:
-        print("No template_keys_*.json files found. Looking for fallback template_keys.json...")
-        fallback_path = os.path.join(CONFIG_DIR, 'template_keys.json')
-        if os.path.exists(fallback_path):
-            try:
-                with open(fallback_path, 'r', encoding='utf-8') as f:
-                    template_data = json.load(f)
-                    template_files.append(('template_keys.json', template_data))
-                    print("Loaded fallback template_keys.json")
-            except Exception as e:
-                print(f"Error loading fallback template_keys.json: {e}")
-    
-    return template_files
+    return list(datasets.iter_template_keys_files())
 
-def convert_pdf_to_images(pdf_path):
+def convert_pdf_to_images(pdf_path, skip_pages=()):
     """
     Converts each page of a PDF to a PIL Image object using the same scaling
     logic as the template editor to ensure WYSIWYG consistency.
     Returns a list of PIL Image objects at the same resolution as the editor.
+    Pages in skip_pages are not rendered and are None in the list.
     """
     images = []
     try:
         doc = pymupdf.open(pdf_path)
         for page_num in range(len(doc)):
+            if page_num in skip_pages:
+                images.append(None)
+                continue
             page = doc.load_page(page_num)
             
             # Use the same scaling logic as template editor's pdf_page_to_image
@@ -99,96 +91,35 @@ def get_system_font_path(font_name, font_size):
     """
     Tries to find a system font file for the given font name.
     Returns a PIL font object or None if not found.
+    Fonts are resolved through the persisted font index and loaded from an LRU cache.
     """
-    # Common font name mappings
-    font_mappings = {
-        'timesnewroman': ['times.ttf', 'Times New Roman.ttf', 'TimesNewRoman.ttf', 'Times-Roman.ttf'],
-        'arial': ['arial.ttf', 'Arial.ttf', 'LiberationSans-Regular.ttf'],
-        'helvetica': ['helvetica.ttf', 'Helvetica.ttf', 'Arial.ttf', 'LiberationSans-Regular.ttf'],
-        'calibri': ['calibri.ttf', 'Calibri.ttf'],
-        'verdana': ['verdana.ttf', 'Verdana.ttf'],
-        'georgia': ['georgia.ttf', 'Georgia.ttf'],
-        'courier': ['courier.ttf', 'Courier.ttf', 'cour.ttf'],
-        'comic sans': ['comic.ttf', 'ComicSansMS.ttf'],
-    }
-    
-    # Normalize font name (lowercase, remove spaces)
-    normalized_name = font_name.lower().replace(' ', '').replace('-', '')
-    
-    # Get possible font files for this font name
-    possible_fonts = font_mappings.get(normalized_name, [font_name + '.ttf', font_name + '.TTF'])
-    
-    # Font search directories (local project fonts first, then system fonts)
-    font_search_dirs = []
-    
-    # Add local project fonts directory
-    local_fonts_dir = os.path.join(os.path.dirname(__file__), 'fonts')
-    if os.path.exists(local_fonts_dir):
-        font_search_dirs.append(local_fonts_dir)
-    
-    # System font directories by platform
-    if platform.system() == 'Windows':
-        font_search_dirs.extend([
-            'C:/Windows/Fonts/',
-            'C:/Windows/System32/Fonts/',
-            os.path.expanduser('~/AppData/Local/Microsoft/Windows/Fonts/')
-        ])
-    elif platform.system() == 'Darwin':  # macOS
-        font_search_dirs.extend([
-            '/System/Library/Fonts/',
-            '/Library/Fonts/',
-            os.path.expanduser('~/Library/Fonts/')
-        ])
-    else:  # Linux and others
-        font_search_dirs.extend([
-            '/usr/share/fonts/',
-            '/usr/local/share/fonts/',
-            os.path.expanduser('~/.fonts/'),
-            os.path.expanduser('~/.local/share/fonts/')
-        ])
-    
-    # Try to find the font file
-    for font_file in possible_fonts:
-        # First try the font name as-is (might be a direct path)
-        try:
-            return ImageFont.truetype(font_file, font_size)
-        except (IOError, OSError):
-            pass
-        
-        # Then try in font search directories
-        for font_dir in font_search_dirs:
-            if os.path.exists(font_dir):
-                font_path = os.path.join(font_dir, font_file)
-                try:
-                    return ImageFont.truetype(font_path, font_size)
-                except (IOError, OSError):
-                    continue
-    
-    return None
+    return fonts.get_font(font_name, font_size)
 
 def get_fallback_font(font_size):
     """
     Returns a reliable fallback font that should work on most systems.
     """
-    fallback_fonts = []
-    
-    if platform.system() == 'Windows':
-        fallback_fonts = ['arial.ttf', 'calibri.ttf', 'tahoma.ttf']
-    elif platform.system() == 'Darwin':  # macOS
-        fallback_fonts = ['Helvetica.ttf', 'Arial.ttf', 'Times.ttf']
-    else:  # Linux
-        fallback_fonts = ['LiberationSans-Regular.ttf', 'DejaVuSans.ttf', 'Ubuntu-Regular.ttf']
-    
-    for fallback in fallback_fonts:
-        font = get_system_font_path(fallback.replace('.ttf', ''), font_size)
-        if font:
-            return font
-    
-    # Ultimate fallback - PIL's default font
-    try:
-        return ImageFont.load_default()
-    except Exception:
-        return None
+    return fonts.get_fallback_font(font_size)
+
+def obscure_region_pil(region, mode, element_config):
+    """
+    Returns the obscured version of a cropped PIL region for an 'obscure' element.
+    Unknown modes fall back to 'blacken'.
+    """
+    width, height = region.size
+    if mode == 'blacken':
+        return Image.new('RGB', (width, height), (0,0,0))
+    elif mode == 'pixelate':
+        factor = OBSCURE_PIXELATE_FACTOR # From constants
+        small_w = max(1, int(width * factor))
+        small_h = max(1, int(height * factor))
+        small = region.resize((small_w, small_h), Image.NEAREST)
+        return small.resize((width, height), Image.NEAREST)
+    elif mode == 'blur':
+        # Same box blur as the editor, so the output matches what was seen there
+        return Image.fromarray(box_blur_array(np.asarray(region.convert('RGB')), OBSCURE_BLUR_KERNEL))
+    # Default to blacken if mode is unknown
+    return Image.new('RGB', (width, height), (0,0,0))
 
 def draw_element_pil(image, element_config, template_data):
     """
@@ -197,15 +128,20 @@ def draw_element_pil(image, element_config, template_data):
     draw_element from the template_editor.
     Scale is assumed to be 1.0 for final output.
     """
+    draw_op_pil(image, compile_element(element_config), template_data)
+
+def draw_op_pil(image, op, template_data):
+    """
+    Draws one compiled element op (see app.doc_templater.plan) on the PIL Image.
+    """
     draw = ImageDraw.Draw(image)
-    element_type = element_config.get("type")
+    element_type = op['type']
 
-    # Element's bounding box (base units, scale is 1.0)
-    # Convert to integers to avoid float errors
-    x = int(element_config.get("x", 0))
-    y = int(element_config.get("y", 0))
-    width = int(element_config.get("width", 100))
-    height = int(element_config.get("height", 30))
+    # Element's bounding box (base units, scale is 1.0), already converted to integers
+    x = op['x']
+    y = op['y']
+    width = op['width']
+    height = op['height']
     
     # Background color for the element's bounding box (similar to editor's default)
     # The editor uses (255,255,255) as a default background_color for elements.
@@ -218,35 +154,24 @@ def draw_element_pil(image, element_config, template_data):
         # Text elements in the editor have a background color.
         # Original doc_templater.py also drew a white rectangle.
         # Let's use the element's background_color or white if not specified.
-        bg_color = tuple(element_config.get('background_color', (255, 255, 255))) # Default to white for text BG
-        draw.rectangle([x, y, x + width, y + height], fill=bg_color)
+        draw.rectangle([x, y, x + width, y + height], fill=op['bg_color']) # Default to white for text BG
         # Border removed for final output - borders are only needed in editor for field visualization
         # draw.rectangle([x, y, x + width, y + height], outline=(0,0,0), width=1)
 
-        # First check for value_key (legacy approach)
-        value_key = element_config.get("value_key")
-        if value_key:
-            actual_value = template_data.get(value_key, "")
-        else:
-            # Use the value field and resolve it if it's a template path
-            template_path = element_config.get("value", "")
-            actual_value = resolve_template_value(template_path, template_data)
-        
-        text_to_draw = str(actual_value)
+        text_to_draw = str(resolve_accessor(op['accessor'], template_data))
+        font_color = op['font_color'] # RGB, default black
 
-        font_path_or_name = element_config.get("font", "arial") # Default font
-        font_size = element_config.get("font_size", 18) # Base font size
-        font_color = tuple(element_config.get("font_color", [0,0,0])) # RGB, default black
-
-        # Try to load the requested font
-        font = get_system_font_path(font_path_or_name, font_size)
-        
-        if not font:
-            print(f"Warning: Font '{font_path_or_name}' not found. Using fallback font.")
-            font = get_fallback_font(font_size)
+        # Load the requested font once per op and keep it on the op for the next datasets
+        font = op.get('font')
+        if font is None:
+            font = get_system_font_path(op['font_name'], op['font_size'])
+            if not font:
+                print(f"Warning: Font '{op['font_name']}' not found. Using fallback font.")
+                font = get_fallback_font(op['font_size'])
+            op['font'] = font
         
         if not font:
-            print(f"Error: Could not load any font for text element: {element_config.get('name', 'Unnamed')}")
+            print(f"Error: Could not load any font for text element: {op['name']}")
             return
         
         if font:
@@ -279,32 +204,23 @@ def draw_element_pil(image, element_config, template_data):
             # The element's (x,y) is the top-left of its bounding box.
             image.paste(text_surface, (x, y), text_surface)
         else:
-            print(f"Error: Could not load font for text element: {element_config.get('name', 'Unnamed')}")
+            print(f"Error: Could not load font for text element: {op['name']}")
 
 
     elif element_type == "rectangle":
-        rect_fill_color = tuple(element_config.get('background_color', (255, 255, 255))) # Default white
-        draw.rectangle([x, y, x + width, y + height], fill=rect_fill_color)
+        draw.rectangle([x, y, x + width, y + height], fill=op['bg_color']) # Default white
         # Only draw border if explicitly requested in config
-        if element_config.get('show_border', False):
-            border_color = tuple(element_config.get('border_color', (0, 0, 0)))
-            draw.rectangle([x, y, x + width, y + height], outline=border_color, width=1)
+        if op['border_color'] is not None:
+            draw.rectangle([x, y, x + width, y + height], outline=op['border_color'], width=1)
 
     elif element_type == "image" or element_type == "signature":
-        # First check for value_key (legacy approach)
-        value_key = element_config.get("value_key")
-        if value_key:
-            image_path_template = str(template_data.get(value_key, ""))
-        else:
-            # Use the value field and resolve it if it's a template path
-            template_path = element_config.get("value", "")
-            image_path_template = str(resolve_template_value(template_path, template_data))
+        image_path_template = str(resolve_accessor(op['accessor'], template_data))
 
         # Resolve image path (might be a key itself in template_data for dynamic paths)
         image_path, search_directory = resolve_image_path(image_path_template, template_data)
 
         if not image_path:
-            print(f"Warning: Image path is empty for element: {element_config.get('name', 'Unnamed')}")
+            print(f"Warning: Image path is empty for element: {op['name']}")
             return
 
         full_img_path = image_path
@@ -312,7 +228,7 @@ def draw_element_pil(image, element_config, template_data):
             full_img_path = os.path.join(search_directory, image_path)
 
         if not os.path.exists(full_img_path):
-            print(f"Warning: Image not found at {full_img_path} for element: {element_config.get('name', 'Unnamed')}")
+            print(f"Warning: Image not found at {full_img_path} for element: {op['name']}")
             # Draw an X or error placeholder like in editor
             draw.rectangle([x, y, x + width, y + height], outline=(255,0,0), width=1)
             draw.line([(x,y), (x+width, y+height)], fill=(255,0,0), width=1)
@@ -320,13 +236,7 @@ def draw_element_pil(image, element_config, template_data):
             return
 
         try:
-            img_to_paste_orig = Image.open(full_img_path).convert("RGBA") # Use RGBA for transparency
-
-            padding = element_config.get('padding', {'left': 0, 'top': 0, 'right': 0, 'bottom': 0})
-            pad_left = int(padding.get('left', 0))
-            pad_top = int(padding.get('top', 0))
-            pad_right = int(padding.get('right', 0))
-            pad_bottom = int(padding.get('bottom', 0))
+            pad_left, pad_top, pad_right, pad_bottom = op['padding']
 
             content_area_w = width - pad_left - pad_right
             content_area_h = height - pad_top - pad_bottom
@@ -335,31 +245,12 @@ def draw_element_pil(image, element_config, template_data):
                 print(f"Warning: Content area for image {full_img_path} is zero or negative after padding.")
                 return
 
-            img_orig_w, img_orig_h = img_to_paste_orig.size
-            if img_orig_w == 0 or img_orig_h == 0:
-                print(f"Warning: Original image {full_img_path} has zero dimensions.")
-                return
+            # Decoded, RGBA-converted and resized once per (file, box, padding) across all datasets
+            tile_entry = assets.get_image_tile(full_img_path, width, height, op['padding'])
 
-            aspect_ratio = img_orig_w / img_orig_h
-            
-            render_w = content_area_w
-            render_h = render_w / aspect_ratio
-            
-            if render_h > content_area_h:
-                render_h = content_area_h
-                render_w = render_h * aspect_ratio
-            
-            render_w = int(render_w)
-            render_h = int(render_h)
+            if tile_entry is not None:
+                paste_x_in_box, paste_y_in_box, resized_img = tile_entry
 
-            if render_w > 0 and render_h > 0:
-                resized_img = img_to_paste_orig.resize((render_w, render_h), Image.LANCZOS) # High quality resize
-
-                # Position for pasting (top-left corner of the resized image within the content area)
-                # Centering the image within the padded content area
-                paste_x_in_box = pad_left + (content_area_w - render_w) // 2
-                paste_y_in_box = pad_top + (content_area_h - render_h) // 2
-                
                 final_paste_x = x + paste_x_in_box
                 final_paste_y = y + paste_y_in_box
                 
@@ -372,43 +263,26 @@ def draw_element_pil(image, element_config, template_data):
                 print(f"Warning: Calculated render dimensions for image {full_img_path} are zero after padding.")
 
         except Exception as e:
-            print(f"Error processing image element {element_config.get('name', 'Unnamed')} with path {full_img_path}: {e}")
+            print(f"Error processing image element {op['name']} with path {full_img_path}: {e}")
             # Draw an X or error placeholder
             draw.rectangle([x, y, x + width, y + height], outline=(255,0,0), width=1)
             draw.line([(x,y), (x+width, y+height)], fill=(255,0,0), width=1)
             draw.line([(x+width,y), (x, y+height)], fill=(255,0,0), width=1)
     
     elif element_type == "obscure":
-        mode = element_config.get('mode', DEFAULT_OBSCURE_MODE)
+        mode = op['element'].get('mode', DEFAULT_OBSCURE_MODE)
         obscure_rect_pil = (x, y, x + width, y + height)
 
         if width > 0 and height > 0:
             try:
                 region_to_obscure = image.crop(obscure_rect_pil)
-                
-                if mode == 'blacken':
-                    obscured_region = Image.new('RGB', (width, height), (0,0,0))
-                elif mode == 'pixelate':
-                    factor = OBSCURE_PIXELATE_FACTOR # From constants
-                    small_w = max(1, int(width * factor))
-                    small_h = max(1, int(height * factor))
-                    small = region_to_obscure.resize((small_w, small_h), Image.NEAREST)
-                    obscured_region = small.resize((width, height), Image.NEAREST)
-                elif mode == 'blur': # TODO: Implement blur similar to editor (e.g., BoxBlur or Gaussian)
-                    # Example using BoxBlur, kernel size needs to match editor's effect
-                    # from app.template_editor.constants import OBSURE_BLUR_KERNEL (if defined)
-                    blur_radius = element_config.get('blur_radius', 5) # Or derive from OBSURE_BLUR_KERNEL
-                    obscured_region = region_to_obscure.filter(ImageFilter.BoxBlur(blur_radius))
-                    print(f"Warning: 'blur' mode for 'obscure' element is using basic BoxBlur. Ensure visual match with editor or refine.")
-                else: # Default to blacken if mode is unknown
-                    obscured_region = Image.new('RGB', (width, height), (0,0,0))
-                
+                obscured_region = obscure_region_pil(region_to_obscure, mode, op['element'])
                 image.paste(obscured_region, obscure_rect_pil)
                 # Border removed for natural appearance in final output
                 # draw.rectangle(obscure_rect_pil, outline=(0,0,0), width=1)
 
             except Exception as e:
-                print(f"Error obscuring region for element {element_config.get('name', 'Unnamed')}: {e}")
+                print(f"Error obscuring region for element {op['name']}: {e}")
                 # Fallback: draw a simple black rectangle if effect fails
                 draw.rectangle(obscure_rect_pil, fill=(50,50,50)) # Dark gray to indicate error in effect
                 draw.rectangle(obscure_rect_pil, outline=(255,0,0), width=1)
@@ -418,92 +292,541 @@ def draw_element_pil(image, element_config, template_data):
 # Original draw_element function is removed as we're replacing its usage
 # with draw_element_pil within this script's context.
 
-def process_pdf(pdf_filename, config_path, output_dir_param, template_files): # Added template_files parameter
+def get_output_suffix(template_filename, template_data):
     """
-    Processes a single PDF file based on its JSON configuration.
-    Generates multiple output PDFs based on template_files list.
-    Uses draw_element_pil for rendering.
+    Returns the filename suffix for the output generated from one template dataset.
+    Uses the employee name if available, otherwise the template filename.
+    """
+    employee_name = template_data.get('employee', {}).get('name', '')
+    if employee_name:
+        # Clean up name for filename
+        clean_name = employee_name.replace(' ', '_').replace('.', '').lower()
+        return f"_{clean_name}"
+    # Use template filename as fallback
+    base_template_name = os.path.splitext(template_filename)[0]
+    return f"_{base_template_name}"
+
+def get_output_pdf_path(pdf_filename, template_filename, template_data, output_dir_param):
+    """Returns the output PDF path for a (pdf, template dataset) pair."""
+    output_suffix = get_output_suffix(template_filename, template_data)
+    return os.path.join(output_dir_param, f"{os.path.splitext(pdf_filename)[0]}{output_suffix}.pdf")
+
+def set_page_sizes(template_plan, pdf_path):
+    """Records the size in points of each source page on the compiled pages as 'page_size'."""
+    with pymupdf.open(pdf_path) as doc:
+        for page, pdf_page in zip(template_plan, doc):
+            page['page_size'] = (pdf_page.rect.width, pdf_page.rect.height)
+
+def get_passthrough_pages(template_plan):
+    """
+    Returns the indices of compiled pages without any elements. These pages are
+    copied verbatim from the source PDF and never need to be rasterized.
+    """
+    return {page_index for page_index, page in enumerate(template_plan) if not page['ops']}
+
+def render_template_dataset(pdf_filename, template_plan, base_pdf_images, template_filename, template_data, output_pdf_path,
+                            baked_pages=None, page_encoding=None):
+    """
+    Renders one template dataset onto the rasterized pages of a PDF and saves the result.
+    template_plan is the PDF's page configuration compiled with compile_template.
+    page_encoding selects how rendered pages are stored (see DEFAULT_PAGE_ENCODING).
+    baked_pages is an optional dict shared by the datasets of one PDF that caches page
+    bases with the static elements already drawn.
+    Pages without elements are copied verbatim from the source PDF, and pages with only
+    static elements reuse the page image encoded for the first dataset.
+    Returns True if the output PDF was written.
+    """
+    output_pages = [] # (page_index, encoded page image or None to copy the source page)
+
+    for page_index, page in enumerate(template_plan):
+        if page_index >= len(base_pdf_images):
+            print(f"Warning: Page config for page {page_index + 1} exists, but PDF has only {len(base_pdf_images)} pages.")
+            continue
+
+        if not page['ops']:
+            output_pages.append((page_index, None))
+            continue
+
+        # Elements that render the same for every dataset are baked once into a cached page base
+        static_indices, static_ops, dynamic_ops = split_static_layers(
+            page['ops'], lambda op: is_op_static(op, template_data))
+
+        base_key = (page_index, static_indices)
+        baked = baked_pages.get(base_key) if baked_pages is not None else None
+        if baked is None:
+            # [page base with the static elements drawn, its encoded image once needed]
+            baked = [base_pdf_images[page_index], None]
+            if static_ops:
+                baked[0] = base_pdf_images[page_index].copy()
+                for op in static_ops:
+                    draw_op_pil(baked[0], op, template_data)
+            if baked_pages is not None:
+                while len(baked_pages) >= _BAKED_PAGES_PER_JOB:
+                    baked_pages.pop(next(iter(baked_pages)))
+                baked_pages[base_key] = baked
+
+        if not dynamic_ops:
+            if baked[1] is None:
+                baked[1] = encode_page_image(baked[0], page.get('page_size'), page_encoding)
+            output_pages.append((page_index, baked[1]))
+            continue
+
+        current_page_image_pil = baked[0].copy() # Work on a copy
+        for op in dynamic_ops:
+            draw_op_pil(current_page_image_pil, op, template_data)
+        
+        output_pages.append((page_index, encode_page_image(current_page_image_pil, page.get('page_size'), page_encoding)))
+
+    if not output_pages:
+        print(f"No images processed for {pdf_filename} with template {template_filename}. Output PDF not generated.")
+        return False
+
+    try:
+        write_output_pdf(output_pdf_path, os.path.join(INPUT_DIR, pdf_filename), output_pages)
+        print(f"Successfully generated {output_pdf_path}")
+        return True
+    except Exception as e:
+        print(f"Error saving output PDF {output_pdf_path}: {e}")
+        return False
+
+def _pdf_color(rgb):
+    """Converts a 0-255 RGB sequence to the 0-1 float tuple PyMuPDF expects."""
+    return tuple(c / 255.0 for c in rgb[:3])
+
+def _pdf_rect(x0, y0, x1, y1, zoom, page):
+    """
+    Maps an editor-space box (pixels at TARGET_HEIGHT) to PDF points on the page.
+    Insertion and redaction APIs work on the unrotated page, so the rect is derotated.
+    """
+    return pymupdf.Rect(x0 / zoom, y0 / zoom, x1 / zoom, y1 / zoom) * page.derotation_matrix
+
+def _encode_embedded_image(img):
+    """Encodes an RGBA PIL image for embedding: JPEG when fully opaque, PNG otherwise."""
+    buffer = io.BytesIO()
+    if img.getextrema()[3][0] == 255:
+        img.convert("RGB").save(buffer, format="JPEG", quality=90)
+    else:
+        img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def _element_box_rect(element_config, zoom, page):
+    """Returns the PDF rect an element's background fills, like the raster engine's box."""
+    x = int(element_config.get("x", 0))
+    y = int(element_config.get("y", 0))
+    width = int(element_config.get("width", 100))
+    height = int(element_config.get("height", 30))
+    # PIL's draw.rectangle includes the end coordinate, so the raster engine fills width + 1 pixels
+    return _pdf_rect(x, y, x + width + 1, y + height + 1, zoom, page)
+
+def redact_covered_text(page, elements, zoom):
+    """
+    Removes the page's own text under text elements and rectangles. Their filled box only
+    hides it visually, so without this the values they replace would stay in the text
+    layer of vector output. Images and line art are kept, as the box is painted over them.
+    """
+    redacted = False
+    for element_config in elements:
+        if element_config.get("type") not in ("text", "rectangle"):
+            continue
+        rect = _element_box_rect(element_config, zoom, page).normalize()
+        if rect.is_empty:
+            continue
+        page.add_redact_annot(rect, fill=False)
+        redacted = True
+    if redacted:
+        page.apply_redactions(images=pymupdf.PDF_REDACT_IMAGE_NONE, graphics=pymupdf.PDF_REDACT_LINE_ART_NONE)
+
+def draw_element_vector(page, element_config, template_data, zoom, image_xrefs):
+    """
+    Draws a single element onto a PyMuPDF page as native PDF objects.
+    Text, rectangles and images stay vector/embedded objects; only 'obscure'
+    regions are rasterized, after the content underneath has been redacted.
+    image_xrefs maps image file paths to already embedded image xrefs of the document.
+    """
+    element_type = element_config.get("type")
+
+    x = int(element_config.get("x", 0))
+    y = int(element_config.get("y", 0))
+    width = int(element_config.get("width", 100))
+    height = int(element_config.get("height", 30))
+    box_rect = _element_box_rect(element_config, zoom, page)
+
+    if element_type == "text":
+        bg_color = tuple(element_config.get('background_color', (255, 255, 255)))
+        page.draw_rect(box_rect, color=None, fill=_pdf_color(bg_color), width=0)
+
+        text_to_draw = str(resolve_element_value(element_config, template_data))
+        if not text_to_draw:
+            return
+
+        font_path_or_name = element_config.get("font", "arial")
+        font_size = element_config.get("font_size", 18)
+        font_color = tuple(element_config.get("font_color", [0,0,0]))
+
+        font = get_system_font_path(font_path_or_name, font_size)
+        if not font:
+            print(f"Warning: Font '{font_path_or_name}' not found. Using fallback font.")
+            font = get_fallback_font(font_size)
+
+        # Use the same font file and metrics as the raster engine so text lands on the same baseline
+        font_file = getattr(font, 'path', None)
+        if not (isinstance(font_file, str) and os.path.isfile(font_file)):
+            font_file = None  # e.g. PIL's built-in default font, which has no file to embed
+        ascent = font.getmetrics()[0] if hasattr(font, 'getmetrics') else font_size
+        fontsize_pt = font_size / zoom
+        pdf_font = pymupdf.Font(fontfile=font_file) if font_file else pymupdf.Font("helv")
+
+        # The raster engine clips text to the element box; drop the characters that would overflow it
+        max_width_pt = width / zoom
+        advances = itertools.accumulate(pdf_font.char_lengths(text_to_draw, fontsize=fontsize_pt))
+        text_to_draw = text_to_draw[:bisect.bisect_right(list(advances), max_width_pt)]
+        if not text_to_draw:
+            return
+
+        baseline = pymupdf.Point(x / zoom, (y + ascent) / zoom) * page.derotation_matrix
+        if font_file:
+            fontname = "F" + os.path.splitext(os.path.basename(font_file))[0].replace(' ', '')
+            page.insert_text(baseline, text_to_draw, fontsize=fontsize_pt, fontname=fontname, fontfile=font_file,
+                             color=_pdf_color(font_color), rotate=page.rotation)
+        else:
+            page.insert_text(baseline, text_to_draw, fontsize=fontsize_pt, fontname="helv",
+                             color=_pdf_color(font_color), rotate=page.rotation)
+
+    elif element_type == "rectangle":
+        rect_fill_color = tuple(element_config.get('background_color', (255, 255, 255)))
+        border_color = None
+        if element_config.get('show_border', False):
+            border_color = _pdf_color(tuple(element_config.get('border_color', (0, 0, 0))))
+        page.draw_rect(box_rect, color=border_color, fill=_pdf_color(rect_fill_color), width=1 / zoom)
+
+    elif element_type == "image" or element_type == "signature":
+        image_path_template = str(resolve_element_value(element_config, template_data))
+        image_path, search_directory = resolve_image_path(image_path_template, template_data)
+
+        if not image_path:
+            print(f"Warning: Image path is empty for element: {element_config.get('name', 'Unnamed')}")
+            return
+
+        full_img_path = image_path
+        if not os.path.isabs(image_path):
+            full_img_path = os.path.join(search_directory, image_path)
+
+        error_color = _pdf_color((255, 0, 0))
+        if not os.path.exists(full_img_path):
+            print(f"Warning: Image not found at {full_img_path} for element: {element_config.get('name', 'Unnamed')}")
+            page.draw_rect(box_rect, color=error_color, width=1 / zoom)
+            return
+
+        try:
+            padding = element_config.get('padding', {'left': 0, 'top': 0, 'right': 0, 'bottom': 0})
+            pad = (int(padding.get('left', 0)), int(padding.get('top', 0)),
+                   int(padding.get('right', 0)), int(padding.get('bottom', 0)))
+            if width - pad[0] - pad[2] <= 0 or height - pad[1] - pad[3] <= 0:
+                print(f"Warning: Content area for image {full_img_path} is zero or negative after padding.")
+                return
+
+            with Image.open(full_img_path) as img:
+                img_orig_w, img_orig_h = img.size
+                if img_orig_w == 0 or img_orig_h == 0:
+                    print(f"Warning: Original image {full_img_path} has zero dimensions.")
+                    return
+
+                offset_x, offset_y, render_w, render_h = fit_image_in_box(img_orig_w, img_orig_h, width, height, pad)
+                if render_w <= 0 or render_h <= 0:
+                    print(f"Warning: Calculated render dimensions for image {full_img_path} are zero after padding.")
+                    return
+
+                # Embed each (image, size) once per document and reference it from every placement
+                xref_key = (full_img_path, render_w, render_h)
+                stream = None
+                if xref_key not in image_xrefs and img_orig_w * img_orig_h > render_w * render_h:
+                    # Larger than its rendered size: embed the same pixels the raster engine would paste
+                    stream = _encode_embedded_image(img.convert("RGBA").resize((render_w, render_h), Image.LANCZOS))
+
+            img_rect = _pdf_rect(x + offset_x, y + offset_y, x + offset_x + render_w, y + offset_y + render_h, zoom, page)
+            if xref_key in image_xrefs:
+                page.insert_image(img_rect, xref=image_xrefs[xref_key], keep_proportion=False, rotate=page.rotation)
+            elif stream is not None:
+                image_xrefs[xref_key] = page.insert_image(img_rect, stream=stream, keep_proportion=False, rotate=page.rotation)
+            else:
+                image_xrefs[xref_key] = page.insert_image(img_rect, filename=full_img_path, keep_proportion=False, rotate=page.rotation)
+        except Exception as e:
+            print(f"Error processing image element {element_config.get('name', 'Unnamed')} with path {full_img_path}: {e}")
+            page.draw_rect(box_rect, color=error_color, width=1 / zoom)
+
+    elif element_type == "obscure":
+        mode = element_config.get('mode', DEFAULT_OBSCURE_MODE)
+        if width > 0 and height > 0:
+            try:
+                # Render the region at editor resolution so the effect matches the raster engine
+                clip = pymupdf.Rect(x / zoom, y / zoom, (x + width) / zoom, (y + height) / zoom)
+                pix = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), clip=clip, alpha=False)
+                region = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+                obscured_region = obscure_region_pil(region, mode, element_config)
+
+                # Remove the text, vector graphics and image pixels underneath before placing the raster,
+                # otherwise the original content would still be extractable from the output PDF.
+                page.add_redact_annot(clip * page.derotation_matrix, fill=False)
+                page.apply_redactions(images=pymupdf.PDF_REDACT_IMAGE_PIXELS)
+
+                buffer = io.BytesIO()
+                obscured_region.save(buffer, format="PNG")
+                page.insert_image(clip * page.derotation_matrix, stream=buffer.getvalue(),
+                                  keep_proportion=False, rotate=page.rotation)
+            except Exception as e:
+                print(f"Error obscuring region for element {element_config.get('name', 'Unnamed')}: {e}")
+                page.draw_rect(box_rect, color=_pdf_color((255, 0, 0)), fill=_pdf_color((50, 50, 50)), width=1 / zoom)
+    else:
+        print(f"Unsupported element type: {element_type} in draw_element_vector")
+
+def render_template_dataset_vector(pdf_filename, template_plan, template_filename, template_data, output_pdf_path):
+    """
+    Renders one template dataset as a vector overlay on the source PDF and saves the result.
+    The source pages keep their text layer, except for the text under text elements and
+    rectangles (see redact_covered_text); elements are mapped from editor space back to
+    PDF points with the page zoom factor. Returns True if the output PDF was written.
     """
+    pdf_path = os.path.join(INPUT_DIR, pdf_filename)
+    try:
+        doc = pymupdf.open(pdf_path)
+    except Exception as e:
+        print(f"Error opening PDF {pdf_path}: {e}")
+        return False
+
+    try:
+        if len(template_plan) > len(doc):
+            print(f"Warning: Config has {len(template_plan)} pages, but PDF {pdf_filename} has only {len(doc)} pages.")
+        page_count = min(len(template_plan), len(doc))
+        if page_count == 0:
+            print(f"No pages processed for {pdf_filename} with template {template_filename}. Output PDF not generated.")
+            return False
+        # Like the raster engine, the output only contains the pages that have a config
+        if page_count < len(doc):
+            doc.select(list(range(page_count)))
+
+        image_xrefs = {}
+        for page_index in range(page_count):
+            page = doc[page_index]
+            zoom = template_plan[page_index]['zoom_factor'] or TARGET_HEIGHT / page.rect.height
+            redact_covered_text(page, [op['element'] for op in template_plan[page_index]['ops']], zoom)
+            for op in template_plan[page_index]['ops']:
+                draw_element_vector(page, op['element'], template_data, zoom, image_xrefs)
+
+        # Embed only the glyphs actually used by the inserted text
+        doc.subset_fonts()
+        doc.save(output_pdf_path, garbage=3, deflate=True)
+        print(f"Successfully generated {output_pdf_path}")
+        return True
+    except Exception as e:
+        print(f"Error saving output PDF {output_pdf_path}: {e}")
+        return False
+    finally:
+        doc.close()
+
+def load_pdf_config(config_path):
+    """Loads a page configuration JSON file. Returns None if it cannot be read."""
     try:
         with open(config_path, 'r', encoding='utf-8') as f: # Added encoding
-            config_data = json.load(f)
+            return json.load(f)
     except FileNotFoundError:
         print(f"Configuration file not found: {config_path}")
-        return
     except json.JSONDecodeError:
         print(f"Error decoding JSON from: {config_path}")
-        return
+    return None
+
+def process_pdf(pdf_filename, config_path, output_dir_param, template_files, engine='raster', page_encoding=None): # Added template_files parameter
+    """
+    Processes a single PDF file based on its JSON configuration.
+    Generates multiple output PDFs based on template_files list.
+    Uses draw_element_pil for rendering, or draw_element_vector with engine='vector'.
+    Returns the number of output PDFs written.
+    """
+    config_data = load_pdf_config(config_path)
+    if config_data is None:
+        return 0
+    template_plan = compile_template(config_data)
+
+    if engine == 'vector':
+        generated = 0
+        for template_filename, template_data in template_files:
+            output_pdf_path = get_output_pdf_path(pdf_filename, template_filename, template_data, output_dir_param)
+            if render_template_dataset_vector(pdf_filename, template_plan, template_filename, template_data, output_pdf_path):
+                generated += 1
+        return generated
 
     pdf_path = os.path.join(INPUT_DIR, pdf_filename)
-    base_pdf_images = convert_pdf_to_images(pdf_path) # This returns PIL Images
+    base_pdf_images = convert_pdf_to_images(pdf_path, get_passthrough_pages(template_plan)) # This returns PIL Images
+    set_page_sizes(template_plan, pdf_path)
 
     if not base_pdf_images:
         print(f"Could not convert PDF {pdf_filename} to images. Skipping.")
-        return
+        return 0
 
+    generated = 0
+    baked_pages = {}
     # Process each template file
     for template_filename, template_data in template_files:
-        output_images_pil = [] # Store PIL images for output
-        
-        # Extract employee name for filename if available
-        employee_name = template_data.get('employee', {}).get('name', '')
-        if employee_name:
-            # Clean up name for filename
-            clean_name = employee_name.replace(' ', '_').replace('.', '').lower()
-            output_suffix = f"_{clean_name}"
-        else:
-            # Use template filename as fallback
-            base_template_name = os.path.splitext(template_filename)[0]
-            output_suffix = f"_{base_template_name}"
+        output_pdf_path = get_output_pdf_path(pdf_filename, template_filename, template_data, output_dir_param)
+        if render_template_dataset(pdf_filename, template_plan, base_pdf_images, template_filename, template_data, output_pdf_path,
+                                   baked_pages, page_encoding):
+            generated += 1
+    return generated
 
-        output_pdf_path = os.path.join(output_dir_param, f"{os.path.splitext(pdf_filename)[0]}{output_suffix}.pdf")
+# Per-process cache of the compiled configuration and rasterized pages of recently used PDFs.
+# Work units are queued grouped by PDF, so each worker rasterizes a PDF only once.
+_job_cache = {}
+_JOB_CACHE_SIZE = 2
+_BAKED_PAGES_PER_JOB = 16  # static page bases kept per PDF (one per page and distinct static layer)
 
-        for page_index, page_config in enumerate(config_data.get("pages", [])):
-            if page_index >= len(base_pdf_images):
-                print(f"Warning: Page config for page {page_index + 1} exists, but PDF has only {len(base_pdf_images)} pages.")
-                continue
+def _load_pdf_job(pdf_filename, config_path, rasterize=True):
+    """
+    Returns (template_plan, base_pdf_images, baked_pages) for a PDF, compiling its
+    configuration and rasterizing it on first use.
+    base_pdf_images is None when rasterize is False (vector engine); baked_pages is the
+    static page base cache shared by the datasets rendered for this PDF.
+    """
+    key = (pdf_filename, config_path, rasterize)
+    if key not in _job_cache:
+        config_data = load_pdf_config(config_path)
+        if config_data is None:
+            raise ValueError(f"Could not load configuration {config_path}")
+        template_plan = compile_template(config_data)
+        base_pdf_images = None
+        if rasterize:
+            base_pdf_images = convert_pdf_to_images(os.path.join(INPUT_DIR, pdf_filename),
+                                                    get_passthrough_pages(template_plan))
+            if not base_pdf_images:
+                raise ValueError(f"Could not convert PDF {pdf_filename} to images")
+            set_page_sizes(template_plan, os.path.join(INPUT_DIR, pdf_filename))
+        while len(_job_cache) >= _JOB_CACHE_SIZE:
+            _job_cache.pop(next(iter(_job_cache)))
+        _job_cache[key] = (template_plan, base_pdf_images, {})
+    return _job_cache[key]
 
-            current_page_image_pil = base_pdf_images[page_index].copy() # Work on a copy
+def render_work_unit(unit, engine='raster', page_encoding=None):
+    """
+    Renders a single (pdf, template dataset) work unit with the given output engine
+    and, for the raster engine, page encoding.
+    Never raises: failures are reported in the returned result so that one bad
+    dataset or PDF does not abort the rest of the batch.
+    """
+    pdf_filename, config_path, template_filename, template_data, output_pdf_path = unit
+    start = time.perf_counter()
+    image_stats_before = assets.get_image_cache_stats()
+    result = {
+        'pdf': pdf_filename,
+        'template': template_filename,
+        'output': output_pdf_path,
+        'ok': False,
+        'error': None,
+    }
+    try:
+        if engine == 'vector':
+            template_plan, _, _ = _load_pdf_job(pdf_filename, config_path, rasterize=False)
+            result['ok'] = render_template_dataset_vector(pdf_filename, template_plan, template_filename,
+                                                          template_data, output_pdf_path)
+        else:
+            template_plan, base_pdf_images, baked_pages = _load_pdf_job(pdf_filename, config_path)
+            result['ok'] = render_template_dataset(pdf_filename, template_plan, base_pdf_images,
+                                                   template_filename, template_data, output_pdf_path, baked_pages,
+                                                   page_encoding)
+        if not result['ok']:
+            result['error'] = "Output PDF not generated"
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = time.perf_counter() - start
+    image_stats_after = assets.get_image_cache_stats()
+    result['image_cache'] = {k: image_stats_after[k] - image_stats_before[k] for k in ('hits', 'misses', 'evictions')}
+    return result
 
-            # Draw elements in the correct order: rectangle, obscure, image, text
-            # This ensures proper layering just like in the template editor
-            element_types_draw_order = ['rectangle', 'obscure', 'image', 'text']
-            all_elements_with_indices = list(enumerate(page_config.get("elements", [])))
-            
-            # Draw elements by type in the specified order
-            for el_type_to_draw in element_types_draw_order:
-                for original_idx, element in all_elements_with_indices:
-                    if element.get('type') == el_type_to_draw:
-                        # Call the new PIL-based drawing function with template_data
-                        draw_element_pil(current_page_image_pil, element, template_data)
-            
-            # Draw any remaining element types not in the standard order
-            for original_idx, element in all_elements_with_indices:
-                if element.get('type') not in element_types_draw_order:
-                    # Call the new PIL-based drawing function with template_data
-                    draw_element_pil(current_page_image_pil, element, template_data)
-            
-            output_images_pil.append(current_page_image_pil)
+def iter_work_units(pdf_jobs, dataset_source, output_dir_param):
+    """
+    Lazily expands (pdf_filename, config_path) pairs and the records of a dataset source
+    into work units. Datasets are re-read for each PDF so that only one record is held
+    at a time. Output paths are assigned in input order so naming does not depend on
+    completion order; a dataset whose name collides with an earlier one gets the
+    dataset name appended.
+    """
+    used_paths = set()
+    for pdf_filename, config_path in pdf_jobs:
+        for template_filename, template_data in datasets.iter_datasets(dataset_source):
+            output_pdf_path = get_output_pdf_path(pdf_filename, template_filename, template_data, output_dir_param)
+            if output_pdf_path in used_paths:
+                base, ext = os.path.splitext(output_pdf_path)
+                output_pdf_path = f"{base}_{os.path.splitext(template_filename)[0]}{ext}"
+            used_paths.add(output_pdf_path)
+            yield (pdf_filename, config_path, template_filename, template_data, output_pdf_path)
 
-        if output_images_pil:
-            try:
-                # Ensure images are in RGB before saving to PDF if they had alpha (e.g. from RGBA paste)
-                # PyMuPDF conversion should give RGB, but elements might have introduced alpha.
-                rgb_output_images = [img.convert("RGB") for img in output_images_pil]
-                
-                if rgb_output_images:
-                    rgb_output_images[0].save(
-                        output_pdf_path, 
-                        save_all=True, 
-                        append_images=rgb_output_images[1:]
-                    )
-                    print(f"Successfully generated {output_pdf_path}")
+def run_work_units(units, jobs=1, engine='raster', page_encoding=None):
+    """
+    Renders work units serially (jobs == 1) or on a process pool, consuming the units
+    iterable lazily. Yields unit results as they complete; at most a few units per
+    worker are queued at a time so memory does not grow with the batch size.
+    """
+    if jobs <= 1:
+        for unit in units:
+            yield render_work_unit(unit, engine, page_encoding)
+        return
+
+    max_pending = jobs * 2
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = {}
+        units = iter(units)
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_pending:
+                unit = next(units, None)
+                if unit is None:
+                    exhausted = True
                 else:
-                    print(f"No images to save for {pdf_filename} with template {template_filename}. Output PDF not generated.")
-            except Exception as e:
-                print(f"Error saving output PDF {output_pdf_path}: {e}")
-        else:
-            print(f"No images processed for {pdf_filename} with template {template_filename}. Output PDF not generated.")
+                    pending[executor.submit(render_work_unit, unit, engine, page_encoding)] = unit
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                unit = pending.pop(future)
+                try:
+                    yield future.result()
+                except Exception as e:
+                    # The worker process itself died (e.g. killed); record it against the unit
+                    pdf_filename, _, template_filename, _, output_pdf_path = unit
+                    yield {'pdf': pdf_filename, 'template': template_filename, 'output': output_pdf_path,
+                           'ok': False, 'error': f"{type(e).__name__}: {e}", 'seconds': 0.0,
+                           'image_cache': {'hits': 0, 'misses': 0, 'evictions': 0}}
+
+def new_batch_summary():
+    """Returns the running totals of a batch, updated with update_batch_summary."""
+    return {
+        'units': 0,
+        'succeeded': 0,
+        'failed': [],
+        'render_seconds': 0.0,
+        'image_cache': {'hits': 0, 'misses': 0, 'evictions': 0},
+    }
+
+def update_batch_summary(summary, result):
+    """Adds one unit result to the batch totals; only failures are kept individually."""
+    summary['units'] += 1
+    if result['ok']:
+        summary['succeeded'] += 1
+    else:
+        summary['failed'].append(result)
+    summary['render_seconds'] += result['seconds']
+    for k, count in result['image_cache'].items():
+        summary['image_cache'][k] += count
+
+def print_batch_summary(summary, elapsed):
+    """Prints an aggregate summary of a batch run."""
+    print()
+    print("=== Batch Summary ===")
+    print(f"Work units: {summary['units']}  succeeded: {summary['succeeded']}  failed: {len(summary['failed'])}")
+    print(f"Wall time: {elapsed:.2f}s  total render time: {summary['render_seconds']:.2f}s")
+    image_cache = summary['image_cache']
+    if image_cache['hits'] or image_cache['misses']:
+        print(f"Image tile cache: {image_cache['hits']} hit(s)  {image_cache['misses']} miss(es)  "
+              f"{image_cache['evictions']} eviction(s)")
+    for r in summary['failed']:
+        print(f"  FAILED {r['pdf']} + {r['template']} -> {r['output']}: {r['error']}")
 
 def resolve_template_value(value_path, template_data):
     """
@@ -542,13 +865,20 @@ def resolve_template_value(value_path, template_data):
         # If traversal fails, return original value
         return value_path
 
-def resolve_image_path(image_path, template_data):
+def resolve_element_value(element_config, template_data):
+    """
+    Returns the data value of a text or image element for one template dataset.
+    """
+    return resolve_accessor(compile_accessor(element_config), template_data)
+
+def resolve_image_path(image_path, template_data, verbose=True):
     """
     Resolves image path using template-specific image replacements.
     
     Args:
         image_path (str): Original image path
         template_data (dict): The template data dictionary
+        verbose (bool): Print a message when a replacement is used
     
     Returns:
         tuple: (resolved_path, search_directory) where search_directory is either CONFIG_IMG_DIR or INPUT_IMG_DIR
@@ -562,36 +892,132 @@ def resolve_image_path(image_path, template_data):
     # If this image has a replacement, use it and look in config_img
     if image_path in image_replacements:
         replacement_path = image_replacements[image_path]
-        print(f"Image replacement: '{image_path}' -> '{replacement_path}' (using config_img directory)")
+        if verbose:
+            print(f"Image replacement: '{image_path}' -> '{replacement_path}' (using config_img directory)")
         return replacement_path, CONFIG_IMG_DIR
     
     # No replacement found, use original path and look in input_img
     return image_path, INPUT_IMG_DIR
 
-def main():
+def get_unit_inputs(pdf_filename, config_path, config_data, template_data, engine, page_encoding=None):
+    """
+    Returns the hashes of everything a work unit's output depends on, by component:
+    source PDF, page config, dataset, referenced images, fonts and renderer.
+    """
+    renderer = f"{RENDERER_VERSION}/{engine}"
+    if engine == 'raster':
+        page_encoding = page_encoding or DEFAULT_PAGE_ENCODING
+        renderer += "/" + "-".join(f"{k}={page_encoding.get(k)}" for k in sorted(DEFAULT_PAGE_ENCODING))
+    asset_paths = []
+    font_paths = []
+    for page_config in config_data.get("pages", []):
+        for element in page_config.get("elements", []):
+            element_type = element.get('type')
+            if element_type == "image" or element_type == "signature":
+                image_path, search_directory = resolve_image_path(
+                    str(resolve_element_value(element, template_data)), template_data, verbose=False)
+                if image_path:
+                    asset_paths.append(image_path if os.path.isabs(image_path) else os.path.join(search_directory, image_path))
+            elif element_type == "text":
+                font_size = element.get("font_size", 18)
+                font = get_system_font_path(element.get("font", "arial"), font_size) or get_fallback_font(font_size)
+                if getattr(font, 'path', None):
+                    font_paths.append(font.path)
+    return {
+        'pdf': manifest.hash_file(os.path.join(INPUT_DIR, pdf_filename)),
+        'config': manifest.hash_file(config_path),
+        'dataset': manifest.hash_json(template_data),
+        'assets': manifest.hash_files(asset_paths),
+        'fonts': manifest.hash_files(font_paths),
+        'renderer': renderer,
+    }
+
+def iter_outdated_units(units, entries, engine, build_stats, force=False, page_encoding=None):
+    """
+    Filters work units against the build manifest entries, yielding only the units whose
+    output is missing or whose inputs changed. build_stats collects the number of units
+    seen and skipped, the rebuild reasons, and the input hashes of units not yet recorded.
+    """
+    configs = {}
+    for unit in units:
+        pdf_filename, config_path, template_filename, template_data, output_pdf_path = unit
+        build_stats['units'] += 1
+        if config_path not in configs:
+            configs[config_path] = load_pdf_config(config_path) or {}
+        inputs = get_unit_inputs(pdf_filename, config_path, configs[config_path], template_data, engine, page_encoding)
+        if force:
+            reason = 'forced'
+        else:
+            reason = manifest.get_rebuild_reason(entries.get(os.path.basename(output_pdf_path)), inputs, output_pdf_path)
+        if reason is None:
+            build_stats['skipped'] += 1
+            continue
+        build_stats['rebuild_reasons'][reason] = build_stats['rebuild_reasons'].get(reason, 0) + 1
+        build_stats['inputs'][output_pdf_path] = inputs
+        yield unit
+
+def record_build_result(entries, result, inputs):
+    """Records the inputs of a successfully written output and forgets a failed one."""
+    output_name = os.path.basename(result['output'])
+    if result['ok']:
+        entries[output_name] = {'pdf': result['pdf'], 'template': result['template'], 'inputs': inputs}
+    else:
+        entries.pop(output_name, None)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate templated PDFs from input_pdfs/ and the template datasets in configs/.")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Number of worker processes for (pdf, dataset) work units. 0 uses all CPU cores. Default: 1")
+    parser.add_argument('--engine', choices=['raster', 'vector'], default='raster',
+                        help="'raster' redraws every page as an image (default). 'vector' keeps the source PDF "
+                             "and adds text, rectangles and images as PDF objects; only obscure regions are rasterized.")
+    parser.add_argument('--page-compression', choices=['jpeg', 'flate'], default=DEFAULT_PAGE_ENCODING['compression'],
+                        help="How the raster engine stores pages: 'jpeg' (lossy, default) or 'flate' (lossless).")
+    parser.add_argument('--page-color', choices=['rgb', 'gray', 'mono'], default=DEFAULT_PAGE_ENCODING['color'],
+                        help="Page color for the raster engine: 'rgb' (default), 'gray' (8-bit) or 'mono' "
+                             "(1-bit black and white, always flate).")
+    parser.add_argument('--jpeg-quality', type=int, default=DEFAULT_PAGE_ENCODING['jpeg_quality'],
+                        help="JPEG quality (1-95) for --page-compression jpeg. Default: %(default)s")
+    parser.add_argument('--dpi', type=int, default=DEFAULT_PAGE_ENCODING['dpi'],
+                        help="Downsample raster pages to this resolution (dots per inch, > 0). Default: the editor render resolution.")
+    parser.add_argument('--data', metavar='PATH', default=None,
+                        help="Template datasets to render: a .jsonl file, a .csv file with dotted column names "
+                             "(e.g. employee.name), a .json file or a directory of .json files. Records are "
+                             "streamed. Default: configs/template_keys_*.json")
+    parser.add_argument('--force', action='store_true',
+                        help="Regenerate every output, even those the build manifest reports as up to date.")
+    args = parser.parse_args(argv)
+    if not 1 <= args.jpeg_quality <= 95:
+        parser.error(f"--jpeg-quality must be between 1 and 95, got {args.jpeg_quality}")
+    if args.dpi is not None and args.dpi <= 0:
+        parser.error(f"--dpi must be a positive number, got {args.dpi}")
+    return args
+
+def main(argv=None):
     """
     Main function to scan for PDFs and process them with all template files.
     """
+    args = parse_args(argv)
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
     ensure_dirs()
+    fonts.get_font_index()  # build or refresh the font index once, before any worker needs it
     
-    # Load all template files
-    template_files = load_all_template_files()
-    if not template_files:
-        print("No template files found. Cannot process PDFs.")
+    dataset_source = args.data
+    if dataset_source is not None and not os.path.exists(dataset_source):
+        print(f"Dataset source not found: {dataset_source}")
         return
-    
-    print(f"Found {len(template_files)} template files:")
-    for filename, _ in template_files:
-        print(f"  - {filename}")
-    
+    try:
+        datasets.iter_datasets(dataset_source)  # validates the source type without reading records
+    except ValueError as e:
+        print(e)
+        return
+    print(f"Reading template datasets from: {dataset_source or os.path.join(CONFIG_DIR, 'template_keys_*.json')}")
     print(f"Scanning for PDF files in: {INPUT_DIR}")
     print(f"Looking for JSON configurations in: {CONFIG_DIR}")
     print(f"Outputting processed PDFs to: {OUTPUT_DIR}") # Uses imported OUTPUT_DIR
 
-    processed_files = 0
-    total_generated_pdfs = 0
-    
-    for filename in os.listdir(INPUT_DIR):
+    pdf_jobs = []
+    for filename in sorted(os.listdir(INPUT_DIR)):
         if filename.lower().endswith(".pdf"):
             pdf_name_without_ext = os.path.splitext(filename)[0]
             # Config filename might now have complex chars, ensure it's handled.
@@ -602,17 +1028,52 @@ def main():
             print(f"Found PDF: {filename}. Looking for config: {config_path}")
 
             if os.path.exists(config_path):
-                print(f"Processing {filename} with {config_filename} using {len(template_files)} template datasets...")
-                process_pdf(filename, config_path, OUTPUT_DIR, template_files) # Pass template_files
-                processed_files += 1
-                total_generated_pdfs += len(template_files)  # Each PDF generates multiple outputs
+                print(f"Processing {filename} with {config_filename}...")
+                pdf_jobs.append((filename, config_path))
             else:
                 print(f"Config file {config_filename} not found for {filename}. Skipping.")
     
-    if processed_files == 0:
+    if not pdf_jobs:
         print(f"No PDF files were processed. Ensure PDFs are in '{INPUT_DIR}' and JSON configs in '{CONFIG_DIR}'.")
-    else:
-        print(f"Processed {processed_files} PDF file(s), generating {total_generated_pdfs} output documents total.")
+        return
+
+    entries = manifest.load_manifest(OUTPUT_DIR)
+    build_stats = {'units': 0, 'skipped': 0, 'rebuild_reasons': {}, 'inputs': {}}
+    page_encoding = {
+        'compression': args.page_compression,
+        'color': args.page_color,
+        'jpeg_quality': args.jpeg_quality,
+        'dpi': args.dpi,
+    }
+    units = iter_outdated_units(iter_work_units(pdf_jobs, dataset_source, OUTPUT_DIR),
+                                entries, args.engine, build_stats, args.force, page_encoding)
+
+    print(f"Rendering with {jobs} job(s) using the {args.engine} engine...")
+    summary = new_batch_summary()
+    start = time.perf_counter()
+    try:
+        for result in run_work_units(units, jobs, args.engine, page_encoding):
+            record_build_result(entries, result, build_stats['inputs'].pop(result['output']))
+            update_batch_summary(summary, result)
+    finally:
+        # Keep what was built so far, even if the batch is interrupted
+        manifest.save_manifest(OUTPUT_DIR, entries)
+    elapsed = time.perf_counter() - start
+
+    if build_stats['units'] == 0:
+        print("No template datasets found. Cannot process PDFs.")
+        return
+    if build_stats['skipped']:
+        print(f"Skipped {build_stats['skipped']} up-to-date output(s): inputs unchanged since the last build.")
+    if build_stats['rebuild_reasons']:
+        reasons = ', '.join(f"{count} {reason}" for reason, count in sorted(build_stats['rebuild_reasons'].items()))
+        print(f"Rebuilt {summary['units']} output(s): {reasons}")
+    if summary['units'] == 0:
+        print("All outputs are up to date.")
+        return
+
+    print(f"Processed {len(pdf_jobs)} PDF file(s), generating {summary['succeeded']} output documents total.")
+    print_batch_summary(summary, elapsed)
 
 
 if __name__ == "__main__":
@@ -114,5 +114,37 @@ def verify_consistency():
     print("- Doc templater uses the same rendering scale")
     print("- This ensures true WYSIWYG: what you see in the editor is what you get in output!")
 
+def verify_vector_redaction():
+    """Checks that vector output no longer contains the source text that elements cover."""
+    from doc_templater import redact_covered_text, draw_element_vector
+
+    print("=== Vector Output Text Layer Verification ===")
+    doc = pymupdf.open()
+    page = doc.new_page(width=595, height=842)
+    page.insert_text((72, 100), "ORIGINAL-SECRET-VALUE", fontsize=12)
+    page.insert_text((72, 300), "UNCOVERED-TEXT", fontsize=12)
+    zoom = TARGET_HEIGHT / page.rect.height
+    elements = [
+        {'type': 'text', 'x': 60 * zoom, 'y': 85 * zoom, 'width': 250 * zoom, 'height': 20 * zoom,
+         'value': 'NEWVALUE', 'font_size': 24, 'background_color': [255, 255, 255]},
+    ]
+    redact_covered_text(page, elements, zoom)
+    for element in elements:
+        draw_element_vector(page, element, {}, zoom, {})
+    text = pymupdf.open("pdf", doc.tobytes()).load_page(0).get_text()
+    doc.close()
+
+    covered_gone = "ORIGINAL-SECRET-VALUE" not in text
+    print(f"   Covered source text removed: {covered_gone}")
+    print(f"   Element text present: {'NEWVALUE' in text}")
+    print(f"   Uncovered source text kept: {'UNCOVERED-TEXT' in text}")
+    if covered_gone and "NEWVALUE" in text and "UNCOVERED-TEXT" in text:
+        print("   ✅ Covered text is gone from the vector output!")
+    else:
+        print("   ❌ Vector output text layer is wrong!")
+    return covered_gone
+
 if __name__ == "__main__":
-    verify_consistency() 
\ No newline at end of file
+    verify_consistency()
+    print()
+    verify_vector_redaction() 
\ No newline at end of file